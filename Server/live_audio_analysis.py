@@ -1,11 +1,7 @@
-import librosa
 import numpy as np
-from scipy.signal import find_peaks
 import json
 import tempfile
 import os
-import torch
-import torchaudio
 from datetime import datetime
 import subprocess
 import shutil
@@ -16,6 +12,9 @@ def generate_live_analysis(audio_bytes, filename="uploaded_audio", output_dir="s
     Uses Demucs for high-fidelity source isolation.
     """
     try:
+        import librosa
+        from scipy.signal import find_peaks
+
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
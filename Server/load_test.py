@@ -0,0 +1,234 @@
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import wave
+import socket
+import shutil
+import tempfile
+import subprocess
+import http.client
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# ================================
+# Upload Load Test
+# ================================
+# Posts synthetic WAV uploads to the FastAPI server at several concurrency
+# levels and reports latency percentiles, throughput and error rate.
+#
+# By default it starts its own server on a free localhost port, in a scratch
+# working directory, with the stand-in separator (FORENSIC_SEPARATOR=stub,
+# see separator_service.py). Pass --separator=demucs to load the real model,
+# or --url=http://host:port to test a server that is already running.
+#
+# Usage:
+#   python load_test.py [--duration=30] [--concurrency=1,2,4,8] [--requests=16]
+#                       [--endpoint=/api/separate-audio] [--field=file]
+#                       [--separator=stub|demucs] [--stub-rtf=0.05]
+#                       [--url=http://localhost:8000] [--timeout=600] [--out=report.json]
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_ENDPOINT = "/api/separate-audio"
+DEFAULT_FIELD = "file"
+DEFAULT_DURATION = 30.0
+DEFAULT_CONCURRENCY = [1, 2, 4, 8]
+DEFAULT_REQUESTS_PER_WORKER = 4
+SAMPLE_RATE = 44100
+STARTUP_TIMEOUT = 60
+
+
+def synthetic_wav(duration, sr=SAMPLE_RATE, seed=0):
+    """16-bit stereo WAV bytes: tones, noise and a few bursts, so every stage has work to do."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sr)) / sr
+    signal = 0.2 * np.sin(2 * np.pi * 220 * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 0.5 * t))
+    signal += 0.05 * rng.standard_normal(len(t))
+    for start in rng.uniform(0, max(duration - 0.1, 0.0), size=max(1, int(duration // 5))):
+        i = int(start * sr)
+        signal[i:i + sr // 20] += 0.5 * rng.standard_normal(len(signal[i:i + sr // 20]))
+    stereo = np.stack([signal, np.roll(signal, 7)], axis=1)
+    pcm = (np.clip(stereo, -1, 1) * 32767).astype("<i2")
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def multipart_body(field, filename, payload):
+    boundary = uuid.uuid4().hex
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        "Content-Type: audio/wav\r\n\r\n"
+    ).encode()
+    return head + payload + f"\r\n--{boundary}--\r\n".encode(), f"multipart/form-data; boundary={boundary}"
+
+
+def post_upload(base_url, endpoint, field, payload, timeout):
+    """One upload. Returns {latency, status, ok, error}."""
+    url = urlparse(base_url)
+    # Unique names: the server stores uploads and stems by filename
+    body, content_type = multipart_body(field, f"load_{uuid.uuid4().hex[:12]}.wav", payload)
+    started = time.perf_counter()
+    try:
+        conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+        conn.request("POST", endpoint, body=body, headers={"Content-Type": content_type})
+        response = conn.getresponse()
+        data = response.read()
+        conn.close()
+        latency = time.perf_counter() - started
+        error = None
+        if response.status >= 400:
+            error = f"HTTP {response.status}"
+        else:
+            try:
+                result = json.loads(data or b"{}")
+                if isinstance(result, dict) and result.get("error"):
+                    error = str(result["error"])[:200]
+            except ValueError:
+                error = "Invalid JSON"
+        return {"latency": latency, "status": response.status, "ok": error is None, "error": error}
+    except Exception as e:
+        return {"latency": time.perf_counter() - started, "status": None, "ok": False, "error": f"{type(e).__name__}: {e}"}
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    arr = np.asarray(values)
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {
+        "p50": round(float(p50), 3), "p95": round(float(p95), 3), "p99": round(float(p99), 3),
+        "mean": round(float(arr.mean()), 3), "max": round(float(arr.max()), 3),
+    }
+
+
+def run_level(base_url, endpoint, field, payload, audio_seconds, concurrency, requests, timeout):
+    """`requests` uploads through `concurrency` parallel clients."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: post_upload(base_url, endpoint, field, payload, timeout), range(requests)))
+    wall = time.perf_counter() - started
+
+    ok = [r for r in results if r["ok"]]
+    errors = {}
+    for r in results:
+        if r["error"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "succeeded": len(ok),
+        "errorRate": round(1 - len(ok) / float(requests), 4) if requests else 0.0,
+        "wallSec": round(wall, 2),
+        "throughputRps": round(len(ok) / wall, 3) if wall > 0 else None,
+        "audioSecondsPerSec": round(len(ok) * audio_seconds / wall, 2) if wall > 0 else None,
+        "latencySec": percentiles([r["latency"] for r in ok]),
+        "errors": errors,
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(separator, stub_rtf, workdir):
+    """uvicorn on a free localhost port, cwd in `workdir` so uploads land there."""
+    port = free_port()
+    env = dict(os.environ, FORENSIC_SEPARATOR=separator, FORENSIC_STUB_RTF=str(stub_rtf))
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--app-dir", SERVER_DIR,
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            log.close()
+            with open(log.name, "rb") as f:
+                tail = f.read()[-2000:].decode(errors="replace")
+            raise RuntimeError(f"Server exited with code {process.returncode}: {tail}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Server did not start in time")
+
+
+def run_load_test(duration=DEFAULT_DURATION, levels=None, requests=None, endpoint=DEFAULT_ENDPOINT,
+                  field=DEFAULT_FIELD, separator="stub", stub_rtf=0.05, url=None, timeout=600):
+    levels = levels or DEFAULT_CONCURRENCY
+    payload = synthetic_wav(duration)
+    workdir = None
+    process = None
+    try:
+        if url is None:
+            workdir = tempfile.mkdtemp(prefix="forensic-load-")
+            process, url = start_server(separator, stub_rtf, workdir)
+
+        results = []
+        for concurrency in levels:
+            count = requests or concurrency * DEFAULT_REQUESTS_PER_WORKER
+            print(f"[Load] {count} uploads at concurrency {concurrency}...", file=sys.stderr)
+            level = run_level(url, endpoint, field, payload, duration, concurrency, count, timeout)
+            print(f"[Load]   p50 {level['latencySec']['p50']}s  p95 {level['latencySec']['p95']}s  "
+                  f"{level['throughputRps']} req/s  errors {level['errorRate']:.1%}", file=sys.stderr)
+            results.append(level)
+
+        return {
+            "status": "success",
+            "url": url,
+            "endpoint": endpoint,
+            "separator": separator if process else "external",
+            "stubRtf": stub_rtf if process and separator == "stub" else None,
+            "uploadSeconds": duration,
+            "uploadBytes": len(payload),
+            "levels": results,
+        }
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    options = dict(a[2:].partition("=")[::2] for a in sys.argv[1:] if a.startswith("--"))
+    try:
+        report = run_load_test(
+            duration=float(options.get("duration") or DEFAULT_DURATION),
+            levels=[int(v) for v in options["concurrency"].split(",")] if options.get("concurrency") else None,
+            requests=int(options["requests"]) if options.get("requests") else None,
+            endpoint=options.get("endpoint") or DEFAULT_ENDPOINT,
+            field=options.get("field") or DEFAULT_FIELD,
+            separator=options.get("separator") or "stub",
+            stub_rtf=float(options.get("stub-rtf") or 0.05),
+            url=options.get("url") or None,
+            timeout=float(options.get("timeout") or 600),
+        )
+        if options.get("out"):
+            with open(options["out"], "w") as f:
+                json.dump(report, f, indent=2)
+    except Exception as e:
+        report = {"status": "error", "message": str(e)}
+    sys.stdout.write(json.dumps(report))
+    sys.stdout.flush()
@@ -1,8 +1,11 @@
 import numpy as np
-import tensorflow as tf
 import librosa  # For audio loading
 import csv
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+from windowed_inference import classify_windows, DEFAULT_HOP
 
 # --- Configuration ---
 TFLITE_MODEL_PATH = 'scripts/yamnet.tflite'
@@ -19,36 +22,20 @@ def load_labels(class_map_csv_file):
         class_names = [row[2] for row in reader][1:]  # Skip header row
     return class_names
 
-def run_tflite_inference(model_path, waveform):
-    """Run inference on a waveform using the TFLite model."""
+def run_tflite_inference(model_path, waveform, hop=DEFAULT_HOP):
+    """
+    Run the TFLite model on overlapping windows every `hop` seconds
+    (strided, batched; see windowed_inference). Returns one score row per hop.
+    """
     if not os.path.exists(model_path):
         raise FileNotFoundError(f"Model not found at: {model_path}")
-
-    interpreter = tf.lite.Interpreter(model_path=model_path)
-    interpreter.allocate_tensors()
-
-    # Input/output details
-    input_details = interpreter.get_input_details()
-    output_details = interpreter.get_output_details()
-    waveform_input_index = input_details[0]['index']
-    scores_output_index = output_details[0]['index']
-
-    # Resize input tensor for audio length
-    input_size = len(waveform)
-    input_tensor = np.asarray(waveform, dtype=np.float32)
-    interpreter.resize_tensor_input(waveform_input_index, [input_size], strict=True)
-    interpreter.allocate_tensors()
-    interpreter.set_tensor(waveform_input_index, input_tensor)
-
-    # Run inference
-    interpreter.invoke()
-    scores = interpreter.get_tensor(scores_output_index)
+    scores, _ = classify_windows(waveform, SAMPLE_RATE, model_path, hop=hop)
     return scores
 
 # --- Main function to be imported ---
-def run_yamnet(input_wav_path):
+def run_yamnet(input_wav_path, hop=DEFAULT_HOP):
     """
-    Run YAMNet analysis on a given audio file.
+    Run YAMNet analysis on a given audio file, scored every `hop` seconds.
     Returns top 5 predicted classes with scores.
     """
     if not os.path.exists(input_wav_path):
@@ -58,7 +45,7 @@ def run_yamnet(input_wav_path):
     waveform, sr = librosa.load(input_wav_path, sr=SAMPLE_RATE, mono=True, dtype=np.float32)
 
     # Run inference
-    scores = run_tflite_inference(TFLITE_MODEL_PATH, waveform)
+    scores = run_tflite_inference(TFLITE_MODEL_PATH, waveform, hop)
 
     # Load class labels
     class_names = load_labels(CLASS_MAP_PATH)
@@ -1,11 +1,34 @@
 import subprocess
 import os
+import time
+import shutil
+
+# "demucs" runs the real model; "stub" is the stand-in used by load_test.py:
+# it holds the request for FORENSIC_STUB_RTF seconds per second of audio and
+# writes copies of the input as the four stems.
+SEPARATOR_BACKEND = os.environ.get("FORENSIC_SEPARATOR", "demucs")
+STUB_RTF = float(os.environ.get("FORENSIC_STUB_RTF", "0.05"))
+STUB_STEMS = ("vocals", "drums", "bass", "other")
+
+def stub_separate(input_file_path, output_root, rtf=None):
+    """Stand-in separator with Demucs' output layout and a duration-proportional delay."""
+    import wave
+    with wave.open(input_file_path, "rb") as w:
+        duration = w.getnframes() / float(w.getframerate())
+    time.sleep(duration * (STUB_RTF if rtf is None else rtf))
+    stem_dir = os.path.join(output_root, "htdemucs", os.path.splitext(os.path.basename(input_file_path))[0])
+    os.makedirs(stem_dir, exist_ok=True)
+    for stem in STUB_STEMS:
+        shutil.copyfile(input_file_path, os.path.join(stem_dir, f"{stem}.wav"))
+    return True
 
 def separate_audio_tracks(input_file_path, output_root):
     """
     Uses Meta's Demucs to separate audio into 4 stems: 
     Vocals, Drums, Bass, and Other (Environment).
     """
+    if SEPARATOR_BACKEND == "stub":
+        return stub_separate(input_file_path, output_root)
     try:
         # Command for Demucs
         # -n htdemucs: uses the high-quality model
@@ -1,10 +1,16 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, Request, HTTPException
+from fastapi.responses import Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import os
+import sys
 import shutil
 
+# Shared helpers live in the top-level scripts folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+from waveform_peaks import build_peaks_from_wav
+
 # Importing your custom logic
 # from run_yamnet import run_yamnet 
 # from live_audio_analysis import generate_live_analysis
@@ -31,8 +37,40 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 # Mount the static directory so the frontend can stream the .wav files
 app.mount("/output", StaticFiles(directory=OUTPUT_DIR), name="output")
 
+# Peak files for the input and each Demucs stem (peak name -> source file name)
+PEAK_SOURCES = {"vocals": "vocals.wav", "environment": "other.wav", "drums": "drums.wav", "bass": "bass.wav"}
+
+def build_track_peaks(input_path, stem_dir):
+    """
+    Writes .peaks files next to the stems and returns {name: file name} for
+    the ones written. Peaks are an optimisation for the waveform view, so a
+    file that cannot be read is logged and left out, never raised.
+    """
+    built = {}
+    try:
+        # Demucs accepts MP3/M4A/...; the peak builder reads WAV only
+        with open(input_path, "rb") as f:
+            header = f.read(12)
+        if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+            build_peaks_from_wav(input_path, os.path.join(stem_dir, "input.peaks"))
+            built["input"] = "input.peaks"
+        else:
+            print(f"Input peaks skipped (not a WAV file): {input_path}")
+    except Exception as e:
+        print(f"Input peaks failed: {str(e)}")
+
+    for name, stem_file in PEAK_SOURCES.items():
+        try:
+            build_peaks_from_wav(os.path.join(stem_dir, stem_file))
+            built[name] = os.path.splitext(stem_file)[0] + ".peaks"
+        except Exception as e:
+            print(f"Peaks for {stem_file} failed: {str(e)}")
+    return built
+
+# Plain `def`: Demucs and the peak pass block, so FastAPI runs this in its
+# thread pool instead of stalling the event loop for every other request
 @app.post("/api/separate-audio")
-async def handle_separation(file: UploadFile = File(...)):
+def handle_separation(file: UploadFile = File(...)):
     try:
         # 1. Save original file
         file_path = os.path.join(UPLOAD_DIR, file.filename)
@@ -49,6 +87,11 @@ async def handle_separation(file: UploadFile = File(...)):
             
             # This URL matches the app.mount and the Demucs folder structure
             base_url = f"http://localhost:8000/output/htdemucs/{folder_name}"
+            stem_dir = os.path.join(OUTPUT_DIR, "htdemucs", folder_name)
+
+            # Peak files so the waveform view can draw without decoding the WAVs
+            peaks_url = f"http://localhost:8000/api/peaks/htdemucs/{folder_name}"
+            peak_files = build_track_peaks(file_path, stem_dir)
             
             return {
                 "status": "success",
@@ -57,12 +100,59 @@ async def handle_separation(file: UploadFile = File(...)):
                     "environment": f"{base_url}/other.wav", # Environment/Car noise
                     "drums": f"{base_url}/drums.wav",
                     "bass": f"{base_url}/bass.wav"
-                }
+                },
+                "peaks": {name: f"{peaks_url}/{peak_file}" for name, peak_file in peak_files.items()}
             }
         return {"error": "Separation failed"}
         
     except Exception as e:
         return {"error": str(e)}
 
+def parse_range(header, size):
+    """Parses a single 'bytes=a-b' / 'bytes=a-' / 'bytes=-n' range into (start, end) inclusive."""
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start = max(0, size - int(last))
+        end = size - 1
+    if start > end or start >= size:
+        return None
+    return start, end
+
+@app.get("/api/peaks/{peak_path:path}")
+async def get_peaks(peak_path: str, request: Request):
+    # Peak files are fetched level by level, so honour Range requests
+    full_path = os.path.realpath(os.path.join(OUTPUT_DIR, peak_path))
+    if not full_path.startswith(os.path.realpath(OUTPUT_DIR) + os.sep) or not full_path.endswith(".peaks"):
+        raise HTTPException(status_code=404)
+    if not os.path.isfile(full_path):
+        raise HTTPException(status_code=404)
+
+    size = os.path.getsize(full_path)
+    headers = {"Accept-Ranges": "bytes", "Cache-Control": "public, max-age=3600"}
+    range_header = request.headers.get("range")
+    if not range_header:
+        with open(full_path, "rb") as f:
+            return Response(f.read(), media_type="application/octet-stream", headers=headers)
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        byte_range = None
+    if byte_range is None:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    start, end = byte_range
+    with open(full_path, "rb") as f:
+        f.seek(start)
+        body = f.read(end - start + 1)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(body, status_code=206, media_type="application/octet-stream", headers=headers)
+
 if __name__ == "__main__":
     uvicorn.run("server:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
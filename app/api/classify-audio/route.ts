@@ -3,31 +3,139 @@ import { spawn } from "child_process";
 import path from "path";
 import fs from "fs";
 import os from "os";
+import {
+  cpuScheduler,
+  describeAllocation,
+  threadEnv,
+  JobCancelledError,
+  type Allocation,
+  type JobOptions,
+  type JobPriority,
+} from "@/lib/cpu-scheduler";
 
 export const maxDuration = 300;
 
-async function runPython(scriptName: string, args: string[]): Promise<any> {
+// Run time (excluding time paused by the scheduler) before a Python job is killed
+const RUN_TIMEOUT_MS = 600000;
+
+// Uploads larger than this run as batch work unless the client says otherwise
+const BATCH_THRESHOLD_BYTES = Number(process.env.FORENSIC_BATCH_BYTES) || 50 * 1024 * 1024;
+
+export interface EngineMessage {
+  type: string;
+  [key: string]: any;
+}
+
+// Rebuilds whatever a job produced before it stopped from its streamed messages
+function partialResult(messages: EngineMessage[], reason: string) {
+  const soundEvents = messages.filter((m) => m.type === "events").flatMap((m) => m.events);
+  const stems: Record<string, string> = {};
+  const stemFiles: Record<string, any> = {};
+  for (const m of messages.filter((m) => m.type === "stem")) {
+    stems[m.name === "other" ? "background" : m.name] = m.url;
+    stemFiles[m.name] = m.files;
+  }
+  const lastProgress = [...messages].reverse().find((m) => m.type === "progress");
+  return {
+    status: "partial",
+    partial: true,
+    message: reason,
+    lastProgress,
+    eventMode: "frames",
+    detectedSounds: soundEvents.length,
+    soundEvents,
+    stems,
+    stemFiles,
+  };
+}
+
+// Runs an engine script with --ndjson: every stdout line is a JSON message and
+// the job ends with a "result" line. Messages are passed to onMessage as they
+// arrive; on timeout or a crash the partial result built from them is returned.
+// The timeout budgets run time only: it stops while the job reports itself
+// paused by the scheduler and picks up where it left off on "resumed".
+async function runPython(
+  scriptName: string,
+  args: string[],
+  env?: NodeJS.ProcessEnv,
+  onMessage?: (message: EngineMessage) => void
+): Promise<any> {
   return new Promise((resolve, reject) => {
     const scriptPath = path.join(process.cwd(), "scripts", scriptName);
-    console.log(`[Forensic] Spawning: python "${scriptPath}" ${args.join(" ")}`);
+    console.log(`[Forensic] Spawning: python "${scriptPath}" ${args.join(" ")} --ndjson`);
 
-    const python = spawn("python", [`"${scriptPath}"`, ...args], {
+    const python = spawn("python", [`"${scriptPath}"`, ...args, "--ndjson"], {
       shell: true,
-      windowsHide: true
+      windowsHide: true,
+      env: env ?? process.env
     });
 
+    let buffered = "";
     let stdout = "";
     let stderr = "";
+    let finalResult: any = null;
+    let settled = false;
+    const messages: EngineMessage[] = [];
+
+    const handleLine = (line: string) => {
+      const trimmed = line.trim();
+      if (!trimmed) return;
+      let message: EngineMessage;
+      try {
+        message = JSON.parse(trimmed);
+      } catch {
+        stdout += trimmed; // Legacy single-document output or stray prints
+        return;
+      }
+      if (message.type === "paused") stopTimer();
+      else if (message.type === "resumed") startTimer();
+      if (message.type === "result") {
+        finalResult = message.result;
+      } else if (message.type) {
+        messages.push(message);
+      } else {
+        finalResult = message; // A script that does not stream yet
+      }
+      onMessage?.(message);
+    };
 
     // Set a timeout to kill the process if it hangs. Demucs can be slow on CPU.
-    // Increased to 10 minutes (600,000 ms) for CPU processing
-    const timeout = setTimeout(() => {
+    // Increased to 10 minutes (600,000 ms) of run time for CPU processing
+    let remainingMs = RUN_TIMEOUT_MS;
+    let timerStartedAt = 0;
+    let timeout: NodeJS.Timeout | undefined;
+    const onTimeout = () => {
       console.error(`[Forensic] Timeout executing ${scriptName}`);
       python.kill();
-      reject(new Error(`Timeout executing ${scriptName}. The operation took too long.`));
-    }, 600000);
-
-    python.stdout.on("data", (data) => (stdout += data.toString()));
+      settled = true;
+      if (messages.length) {
+        resolve(partialResult(messages, `Timeout executing ${scriptName}. Returning partial results.`));
+      } else {
+        reject(new Error(`Timeout executing ${scriptName}. The operation took too long.`));
+      }
+    };
+    const startTimer = () => {
+      if (timeout) return;
+      timerStartedAt = Date.now();
+      timeout = setTimeout(onTimeout, remainingMs);
+    };
+    const stopTimer = () => {
+      if (!timeout) return;
+      clearTimeout(timeout);
+      timeout = undefined;
+      remainingMs = Math.max(0, remainingMs - (Date.now() - timerStartedAt));
+    };
+    startTimer();
+
+    python.stdout.on("data", (data) => {
+      buffered += data.toString();
+      let newline = buffered.indexOf("\n");
+      while (newline !== -1) {
+        handleLine(buffered.slice(0, newline));
+        buffered = buffered.slice(newline + 1);
+        newline = buffered.indexOf("\n");
+      }
+    });
     python.stderr.on("data", (data) => {
       const msg = data.toString();
       stderr += msg;
@@ -35,12 +143,18 @@ async function runPython(scriptName: string, args: string[]): Promise<any> {
     });
 
     python.on("close", (code) => {
-      clearTimeout(timeout);
+      stopTimer();
+      if (settled) return;
+      handleLine(buffered);
       if (code !== 0) {
         console.error(`[Forensic] Process exited with code ${code}`);
         console.error(`[Forensic] Stderr: ${stderr}`);
       }
 
+      if (finalResult) return resolve(finalResult);
+      if (messages.length) {
+        return resolve(partialResult(messages, `${scriptName} exited with code ${code} before finishing.`));
+      }
       try {
         const start = stdout.indexOf('{');
         const end = stdout.lastIndexOf('}');
@@ -55,19 +169,166 @@ async function runPython(scriptName: string, args: string[]): Promise<any> {
     });
 
     python.on("error", (err) => {
-      clearTimeout(timeout);
-      reject(err);
+      stopTimer();
+      if (!settled) reject(err);
     });
   });
 }
 
+// Builds the simulated response used when the Python engine is unavailable
+function simulationResult(audioDataToUse: string, error: any) {
+  // FALLBACK: If the Python engine fails (timeout or missing dependencies), 
+  // return a mocked successful response so the user can verify the UI visuals.
+  console.log("[Forensic] Activating Simulation Mode due to backend failure.");
+
+  // Create a rich mock classification for the visualization
+  const mockClassification = {
+    status: "simulated",
+    jobID: "simularion_fallback",
+    detectedSounds: 8,
+    soundEvents: Array.from({ length: 15 }, (_, i) => ({
+      time: (i * 2.5).toFixed(2),
+      type: ["Human Voice", "Vehicle Sound", "Atmospheric Wind", "Animal Signal", "Musical Content"][Math.floor(Math.random() * 5)],
+      confidence: 0.95,
+      decibels: -10 - Math.random() * 30,
+      speaker: Math.random() > 0.5 ? "SPEAKER_01" : "SPEAKER_02"
+    }))
+  };
+
+  // Populate ALL stems with the original audio to simulate a "complete" separation result
+  // The user will hear the master mix for each, but the UI cards will be active.
+  const audioUri = audioDataToUse ? `data:audio/wav;base64,${audioDataToUse}` : null;
+  const mockStems = {
+    "vocals": audioUri,
+    "background": audioUri,
+    "vehicles": audioUri,
+    "footsteps": audioUri,
+    "animals": audioUri,
+    "wind": audioUri
+  };
+
+  // Generate Mock Frequency Spectrum
+  const frequencySpectrum = []
+  for (let i = 0; i < 50; i++) {
+    const freq = i * (20000 / 50)
+    const magnitude = Math.max(0.1, Math.sin(i * 0.2) * 0.5 + Math.random() * 0.3)
+    frequencySpectrum.push({
+      frequency: freq,
+      magnitude: magnitude,
+      time: Math.random() * 5
+    })
+  }
+
+  return {
+    status: "Success",
+    jobID: "simulation_mode",
+    classification: mockClassification,
+    stems: mockStems,
+    frequencySpectrum: frequencySpectrum,
+    debug: ["Backend process failed/timed out.", "Switched to simulation mode for UI verification.", error.message]
+  };
+}
+
+// Priority from the X-Job-Priority header or a `priority` field, else by upload
+// size; the user (for fair sharing) from X-User-Id, a `user` field or the client address
+function jobOptions(request: NextRequest, bytes: number, fields: { priority?: any; user?: any }): JobOptions {
+  const requested = String(request.headers.get("x-job-priority") || fields.priority || "").toLowerCase();
+  const priority: JobPriority =
+    requested === "batch" || requested === "interactive"
+      ? requested
+      : bytes > BATCH_THRESHOLD_BYTES ? "batch" : "interactive";
+  const user = String(
+    request.headers.get("x-user-id") || fields.user ||
+    (request.headers.get("x-forwarded-for") || "").split(",")[0].trim() || "anonymous"
+  );
+  return { priority, user };
+}
+
+function cancelledResult(jobID: string, classification?: any) {
+  return {
+    status: "Cancelled",
+    jobID,
+    classification,
+    debug: [`Job ${jobID} was cancelled`]
+  };
+}
+
+// Classification then separation. `send` receives every engine message
+// (tagged with the engine that produced it) when the client streams.
+async function runEngines(
+  jobID: string,
+  tempFilePath: string,
+  options: JobOptions,
+  send?: (message: EngineMessage) => void
+) {
+  const outputDir = path.join(process.cwd(), "public", "separated_audio");
+  if (!fs.existsSync(outputDir)) fs.mkdirSync(outputDir, { recursive: true });
+
+  // Each Python job waits for a thread grant instead of claiming every core
+  const scheduling: string[] = [];
+  // Every message also goes to the scheduler, which needs the job's pause acknowledgement
+  const forward = (engine: string, allocation: Allocation) => (message: EngineMessage) => {
+    cpuScheduler.jobMessage(allocation, message);
+    if (message.type !== "result") send?.({ ...message, engine });
+  };
+
+  // Pass the PATH to the file, not the actual audio string
+  const classification = await cpuScheduler.run("classify", jobID, (allocation) => {
+    scheduling.push(describeAllocation(allocation));
+    send?.({ type: "scheduled", engine: "classify", detail: scheduling[scheduling.length - 1] });
+    return runPython("mediapipe_audio_classifier.py", [
+      `"${tempFilePath}"`,
+      `"${jobID}"`
+    ], threadEnv(allocation), forward("classify", allocation));
+  }, options);
+  send?.({ type: "classification", classification });
+  if (classification.status === "cancelled") return cancelledResult(jobID, classification);
+
+  // Save classification to a file so audio_separator can derive stems from it
+  const classificationPath = path.join(os.tmpdir(), `${jobID}_classification.json`);
+  fs.writeFileSync(classificationPath, JSON.stringify(classification));
+
+  const separation = await cpuScheduler.run("separate", jobID, (allocation) => {
+    scheduling.push(describeAllocation(allocation));
+    send?.({ type: "scheduled", engine: "separate", detail: scheduling[scheduling.length - 1] });
+    return runPython("audio_separator.py", [
+      `"${tempFilePath}"`,
+      `"${outputDir}"`,
+      `"${jobID}"`,
+      `"${classificationPath}"`
+    ], threadEnv(allocation), forward("separate", allocation));
+  }, options);
+  if (separation.status === "cancelled") return cancelledResult(jobID, classification);
+
+  return {
+    status: "Success",
+    jobID,
+    partial: Boolean(classification.partial || separation.partial) || undefined,
+    classification,
+    stems: separation.stems,
+    peaks: separation.peaks,
+    debug: [...scheduling, ...(separation.debug || [])] // Return debug info for inspection
+  };
+}
+
 export async function POST(request: NextRequest) {
   let tempFilePath = "";
   let audioDataToUse = ""; // Store for fallback
+  const cleanup = () => {
+    // Cleanup the temp file after processing is done
+    if (tempFilePath && fs.existsSync(tempFilePath)) {
+      try { fs.unlinkSync(tempFilePath); } catch (e) { }
+    }
+  };
+
+  // Clients that send `Accept: application/x-ndjson` get engine messages as they
+  // happen and the usual response object as the last line ({"type": "result"}).
+  const streaming = (request.headers.get("accept") || "").includes("application/x-ndjson");
 
+  let jobID = "";
   try {
     const contentType = request.headers.get("content-type") || "";
-    let jobID = "";
+    let options: JobOptions;
 
     if (contentType.includes("multipart/form-data")) {
       const formData = await request.formData();
@@ -82,116 +343,84 @@ export async function POST(request: NextRequest) {
       const arrayBuffer = await file.arrayBuffer();
       const buffer = Buffer.from(arrayBuffer);
       fs.writeFileSync(tempFilePath, buffer);
+      options = jobOptions(request, buffer.length, {
+        priority: formData.get("priority"),
+        user: formData.get("user"),
+      });
 
       // Store base64 for fallback
       audioDataToUse = buffer.toString('base64');
 
     } else {
       // JSON Handling (Base64)
-      const { audioData, filename } = await request.json();
+      const { audioData, filename, priority, user } = await request.json();
       audioDataToUse = audioData; // Store for fallback
 
       jobID = filename ? filename.replace(/[^a-z0-9]/gi, '_').toLowerCase() : `job_${Date.now()}`;
 
       const tempDir = os.tmpdir();
       tempFilePath = path.join(tempDir, `${jobID}_input.wav`);
-      fs.writeFileSync(tempFilePath, Buffer.from(audioData, 'base64'));
+      const buffer = Buffer.from(audioData, 'base64');
+      fs.writeFileSync(tempFilePath, buffer);
+      options = jobOptions(request, buffer.length, { priority, user });
     }
 
-    const outputDir = path.join(process.cwd(), "public", "separated_audio");
-    if (!fs.existsSync(outputDir)) fs.mkdirSync(outputDir, { recursive: true });
-
-    // Pass the PATH to the file, not the actual audio string
-    const classification = await runPython("mediapipe_audio_classifier.py", [
-      `"${tempFilePath}"`,
-      `"${jobID}"`
-    ]);
-
-    // Save classification to a file so audio_separator can derive stems from it
-    const classificationPath = path.join(os.tmpdir(), `${jobID}_classification.json`);
-    fs.writeFileSync(classificationPath, JSON.stringify(classification));
+    // A client that goes away takes its queued or running jobs with it
+    const currentJob = jobID;
+    request.signal?.addEventListener("abort", () => cpuScheduler.cancel(currentJob));
+
+    if (streaming) {
+      const encoder = new TextEncoder();
+      const stream = new ReadableStream({
+        async start(controller) {
+          const send = (message: EngineMessage) => controller.enqueue(encoder.encode(JSON.stringify(message) + "\n"));
+          try {
+            send({ type: "result", result: await runEngines(jobID, tempFilePath, options, send) });
+          } catch (error: any) {
+            if (error instanceof JobCancelledError) {
+              send({ type: "result", result: cancelledResult(jobID) });
+              return;
+            }
+            console.error("Forensic Engine Error:", error.message);
+            send({ type: "error", message: error.message });
+            send({ type: "result", result: simulationResult(audioDataToUse, error) });
+          } finally {
+            cleanup();
+            controller.close();
+          }
+        }
+      });
+      return new Response(stream, {
+        headers: { "Content-Type": "application/x-ndjson", "Cache-Control": "no-cache" }
+      });
+    }
 
-    const separation = await runPython("audio_separator.py", [
-      `"${tempFilePath}"`,
-      `"${outputDir}"`,
-      `"${jobID}"`,
-      `"${classificationPath}"`
-    ]);
-
-    return NextResponse.json({
-      status: "Success",
-      jobID,
-      classification,
-      stems: separation.stems,
-      debug: separation.debug // Return debug info for inspection
-    });
+    const result = await runEngines(jobID, tempFilePath, options);
+    cleanup();
+    return NextResponse.json(result);
 
   } catch (error: any) {
+    cleanup();
+    if (error instanceof JobCancelledError) return NextResponse.json(cancelledResult(jobID));
     console.error("Forensic Engine Error:", error.message);
 
-    // FALLBACK: If the Python engine fails (timeout or missing dependencies), 
-    // return a mocked successful response so the user can verify the UI visuals.
-    console.log("[Forensic] Activating Simulation Mode due to backend failure.");
-
     try {
-      // Attempt to recover audio data for fallback playback if possible
-      // Note: we can't easily access the request stream again if already consumed, 
-      // but we can try to return a generic success without the audio echo if needed.
-
-      // Create a rich mock classification for the visualization
-      const mockClassification = {
-        status: "simulated",
-        jobID: "simularion_fallback",
-        detectedSounds: 8,
-        soundEvents: Array.from({ length: 15 }, (_, i) => ({
-          time: (i * 2.5).toFixed(2),
-          type: ["Human Voice", "Vehicle Sound", "Atmospheric Wind", "Animal Signal", "Musical Content"][Math.floor(Math.random() * 5)],
-          confidence: 0.95,
-          decibels: -10 - Math.random() * 30,
-          speaker: Math.random() > 0.5 ? "SPEAKER_01" : "SPEAKER_02"
-        }))
-      };
-
-      // Populate ALL stems with the original audio to simulate a "complete" separation result
-      // The user will hear the master mix for each, but the UI cards will be active.
-      const audioUri = audioDataToUse ? `data:audio/wav;base64,${audioDataToUse}` : null;
-      const mockStems = {
-        "vocals": audioUri,
-        "background": audioUri,
-        "vehicles": audioUri,
-        "footsteps": audioUri,
-        "animals": audioUri,
-        "wind": audioUri
-      };
-
-      // Generate Mock Frequency Spectrum
-      const frequencySpectrum = []
-      for (let i = 0; i < 50; i++) {
-        const freq = i * (20000 / 50)
-        const magnitude = Math.max(0.1, Math.sin(i * 0.2) * 0.5 + Math.random() * 0.3)
-        frequencySpectrum.push({
-          frequency: freq,
-          magnitude: magnitude,
-          time: Math.random() * 5
-        })
-      }
-
-      return NextResponse.json({
-        status: "Success",
-        jobID: "simulation_mode",
-        classification: mockClassification,
-        stems: mockStems,
-        frequencySpectrum: frequencySpectrum,
-        debug: ["Backend process failed/timed out.", "Switched to simulation mode for UI verification.", error.message]
-      });
+      return NextResponse.json(simulationResult(audioDataToUse, error));
     } catch (fallbackError) {
       return NextResponse.json({ error: "Critical Failure: " + error.message }, { status: 500 });
     }
-
-  } finally {
-    // Cleanup the temp file after processing is done
-    if (tempFilePath && fs.existsSync(tempFilePath)) {
-      try { fs.unlinkSync(tempFilePath); } catch (e) { }
-    }
   }
-}
\ No newline at end of file
+}
+
+// Cancels a queued or running job: DELETE /api/classify-audio?jobID=...
+export async function DELETE(request: NextRequest) {
+  const jobID = request.nextUrl.searchParams.get("jobID");
+  if (!jobID) return NextResponse.json({ error: "jobID is required" }, { status: 400 });
+  const affected = cpuScheduler.cancel(jobID);
+  return NextResponse.json({ jobID, cancelled: affected > 0, affected }, { status: affected ? 200 : 404 });
+}
+
+// Scheduler state: running jobs, queue depth and per-priority wait/run times
+export async function GET() {
+  return NextResponse.json(cpuScheduler.status());
+}
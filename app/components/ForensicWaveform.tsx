@@ -1,37 +1,57 @@
 import React, { useEffect, useRef, useState } from 'react'
 import WaveSurfer from 'wavesurfer.js'
 import { Play, Pause, Volume2 } from 'lucide-react'
+import { loadPeaks } from '@/lib/waveform-peaks'
 
 interface TrackProps {
   url: string;
   label: string;
   color: string;
+  peaksUrl?: string;
 }
 
-const ForensicWaveform = ({ url, label, color }: TrackProps) => {
+const ForensicWaveform = ({ url, label, color, peaksUrl }: TrackProps) => {
   const containerRef = useRef<HTMLDivElement>(null)
   const wavesurfer = useRef<WaveSurfer | null>(null)
   const [isPlaying, setIsPlaying] = useState(false)
 
   useEffect(() => {
     if (!containerRef.current) return
+    let cancelled = false
 
-    // Initialize WaveSurfer for this specific track
-    wavesurfer.current = WaveSurfer.create({
-      container: containerRef.current,
-      waveColor: '#4b5563', // Gray-600
-      progressColor: color, // Custom color for each stem
-      cursorColor: '#ffffff',
-      barWidth: 2,
-      height: 60,
-      url: url,
-    })
-
-    wavesurfer.current.on('play', () => setIsPlaying(true))
-    wavesurfer.current.on('pause', () => setIsPlaying(false))
-
-    return () => wavesurfer.current?.destroy()
-  }, [url, color])
+    const create = (peaks?: Float32Array, duration?: number) => {
+      if (cancelled || !containerRef.current) return
+      // Initialize WaveSurfer for this specific track
+      wavesurfer.current = WaveSurfer.create({
+        container: containerRef.current,
+        waveColor: '#4b5563', // Gray-600
+        progressColor: color, // Custom color for each stem
+        cursorColor: '#ffffff',
+        barWidth: 2,
+        height: 60,
+        url: url,
+        // With precomputed peaks the audio is streamed, not decoded up front
+        ...(peaks ? { peaks: [peaks], duration } : {}),
+      })
+
+      wavesurfer.current.on('play', () => setIsPlaying(true))
+      wavesurfer.current.on('pause', () => setIsPlaying(false))
+    }
+
+    if (peaksUrl) {
+      const width = containerRef.current.clientWidth || 1024
+      loadPeaks(peaksUrl, width)
+        .then(({ peaks, duration }) => create(peaks, duration))
+        .catch(() => create())
+    } else {
+      create()
+    }
+
+    return () => {
+      cancelled = true
+      wavesurfer.current?.destroy()
+    }
+  }, [url, color, peaksUrl])
 
   return (
     <div className="bg-slate-900/50 p-4 rounded-lg border border-slate-700 mb-3">
@@ -6,6 +6,7 @@ import { Button } from "@/components/ui/button"
 import { Badge } from "@/components/ui/badge"
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs"
 import WaveSurfer from "wavesurfer.js"
+import { loadPeaks } from "@/lib/waveform-peaks"
 import {
   Target, Play, Pause, Layers, Activity,
   FileText, ChevronRight, Scissors, Loader2,
@@ -16,7 +17,7 @@ import {
 import ForensicDashboard from "./forensic-dashboard" // New Component
 
 // --- FORENSIC TRACK COMPONENT ---
-function ForensicTrack({ url, label, color, icon: Icon, masterPlaying, masterTime, stats }: any) {
+function ForensicTrack({ url, peaksUrl, label, color, icon: Icon, masterPlaying, masterTime, stats }: any) {
   const containerRef = useRef<HTMLDivElement>(null)
   const waveSurferRef = useRef<WaveSurfer | null>(null)
   const [isReady, setIsReady] = useState(false)
@@ -26,24 +27,41 @@ function ForensicTrack({ url, label, color, icon: Icon, masterPlaying, masterTim
   useEffect(() => {
     if (!containerRef.current || !url) return
     if (waveSurferRef.current) waveSurferRef.current.destroy();
+    let cancelled = false
+
+    const create = (peaks?: Float32Array, duration?: number) => {
+      if (cancelled || !containerRef.current) return
+      waveSurferRef.current = WaveSurfer.create({
+        container: containerRef.current,
+        waveColor: "#1e293b",
+        progressColor: color,
+        cursorColor: "#ffffff",
+        barWidth: 2,
+        barGap: 3,
+        height: 60,
+        url: url,
+        // With precomputed peaks the stem is streamed, not decoded up front
+        ...(peaks ? { peaks: [peaks], duration } : {}),
+      })
+
+      waveSurferRef.current.on("ready", () => setIsReady(true))
+      waveSurferRef.current.on("play", () => setIsLocalPlaying(true))
+      waveSurferRef.current.on("pause", () => setIsLocalPlaying(false))
+    }
 
-    waveSurferRef.current = WaveSurfer.create({
-      container: containerRef.current,
-      waveColor: "#1e293b",
-      progressColor: color,
-      cursorColor: "#ffffff",
-      barWidth: 2,
-      barGap: 3,
-      height: 60,
-      url: url,
-    })
-
-    waveSurferRef.current.on("ready", () => setIsReady(true))
-    waveSurferRef.current.on("play", () => setIsLocalPlaying(true))
-    waveSurferRef.current.on("pause", () => setIsLocalPlaying(false))
+    if (peaksUrl) {
+      loadPeaks(peaksUrl, containerRef.current.clientWidth || 1024)
+        .then(({ peaks, duration }) => create(peaks, duration))
+        .catch(() => create())
+    } else {
+      create()
+    }
 
-    return () => waveSurferRef.current?.destroy()
-  }, [url, color])
+    return () => {
+      cancelled = true
+      waveSurferRef.current?.destroy()
+    }
+  }, [url, peaksUrl, color])
 
   useEffect(() => {
     if (!waveSurferRef.current || !isReady) return
@@ -146,6 +164,8 @@ export default function SonarView({
   const [rotation, setRotation] = useState({ x: 0.5, y: 0.5 })
   const [currentTime, setCurrentTime] = useState(0)
   const [isSeparating, setIsSeparating] = useState(false)
+  // Peak-file URLs per stem (and "input") from the separation result
+  const [stemPeaks, setStemPeaks] = useState<Record<string, string>>({})
   // Interaction State
   const [hoveredEvent, setHoveredEvent] = useState<any | null>(null);
   const mousePos = useRef({ x: 0, y: 0 });
@@ -237,6 +257,7 @@ export default function SonarView({
       // 4. Update UI with the job-specific stems AND Classification
       if (result.status === "Success" || result.stems) {
         if (setCurrentStems) setCurrentStems(result.stems);
+        setStemPeaks(result.peaks || {});
         if (setShowStems) setShowStems(true);
 
         // CRITICAL FIX: Update the parent audioData with the fresh classification events
@@ -807,19 +828,19 @@ export default function SonarView({
             </div>
           ) : (
             <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-8 pb-20">
-              <ForensicTrack url={audioData?.url} label="Master Mix" color="#ffffff" icon={AudioWaveform} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Master"])} />
-              <ForensicTrack url={currentStems?.vocals} label="Vocals / Dialogue" color="#3b82f6" icon={Mic2} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Voice", "Speech"])} />
-              <ForensicTrack url={currentStems?.background} label="Ambient / Noise" color="#10b981" icon={Waves} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Music", "Background"])} />
-              <ForensicTrack url={currentStems?.vehicles} label="Vehicle / Machinery" color="#ef4444" icon={Car} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Vehicle", "Car", "Engine"])} />
-              <ForensicTrack url={currentStems?.footsteps} label="Footsteps / Impact" color="#8b5cf6" icon={Footprints} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Footstep"])} />
-              <ForensicTrack url={currentStems?.animals} label="Animal Signal" color="#f59e0b" icon={Bird} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Animal", "Bird", "Dog"])} />
-              <ForensicTrack url={currentStems?.wind} label="Atmospheric Wind" color="#06b6d4" icon={Wind} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Wind", "Thunder"])} />
+              <ForensicTrack url={audioData?.url} peaksUrl={stemPeaks.input} label="Master Mix" color="#ffffff" icon={AudioWaveform} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Master"])} />
+              <ForensicTrack url={currentStems?.vocals} peaksUrl={stemPeaks.vocals} label="Vocals / Dialogue" color="#3b82f6" icon={Mic2} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Voice", "Speech"])} />
+              <ForensicTrack url={currentStems?.background} peaksUrl={stemPeaks.background} label="Ambient / Noise" color="#10b981" icon={Waves} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Music", "Background"])} />
+              <ForensicTrack url={currentStems?.vehicles} peaksUrl={stemPeaks.vehicles} label="Vehicle / Machinery" color="#ef4444" icon={Car} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Vehicle", "Car", "Engine"])} />
+              <ForensicTrack url={currentStems?.footsteps} peaksUrl={stemPeaks.footsteps} label="Footsteps / Impact" color="#8b5cf6" icon={Footprints} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Footstep"])} />
+              <ForensicTrack url={currentStems?.animals} peaksUrl={stemPeaks.animals} label="Animal Signal" color="#f59e0b" icon={Bird} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Animal", "Bird", "Dog"])} />
+              <ForensicTrack url={currentStems?.wind} peaksUrl={stemPeaks.wind} label="Atmospheric Wind" color="#06b6d4" icon={Wind} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Wind", "Thunder"])} />
 
               {/* NEW FORENSIC CATEGORIES */}
-              <ForensicTrack url={currentStems?.gunshots} label="Gunshot / Explosion" color="#dc2626" icon={Bomb} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Gunshot", "Explosion"])} />
-              <ForensicTrack url={currentStems?.screams} label="Scream / Aggression" color="#be123c" icon={Megaphone} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Scream", "Shout"])} />
-              <ForensicTrack url={currentStems?.sirens} label="Siren / Alarm" color="#f97316" icon={AlertTriangle} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Siren", "Alarm"])} />
-              <ForensicTrack url={currentStems?.impact} label="Impact / Breach" color="#7c3aed" icon={Hammer} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Glass", "Hammer", "Slam"])} />
+              <ForensicTrack url={currentStems?.gunshots} peaksUrl={stemPeaks.gunshots} label="Gunshot / Explosion" color="#dc2626" icon={Bomb} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Gunshot", "Explosion"])} />
+              <ForensicTrack url={currentStems?.screams} peaksUrl={stemPeaks.screams} label="Scream / Aggression" color="#be123c" icon={Megaphone} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Scream", "Shout"])} />
+              <ForensicTrack url={currentStems?.sirens} peaksUrl={stemPeaks.sirens} label="Siren / Alarm" color="#f97316" icon={AlertTriangle} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Siren", "Alarm"])} />
+              <ForensicTrack url={currentStems?.impact} peaksUrl={stemPeaks.impact} label="Impact / Breach" color="#7c3aed" icon={Hammer} masterPlaying={isPlaying} masterTime={currentTime} stats={getStats(["Glass", "Hammer", "Slam"])} />
             </div>
           )}
         </TabsContent>
@@ -11,6 +11,7 @@ import EnhancedAudioAnalysis from "./components/enhanced-audio-analysis"
 import SonarView from "./components/sonar-view"
 import AudioSettings from "./components/audio-settings"
 import LiveVisualization from "./components/live-visualization"
+import { readNdjson } from "@/lib/ndjson"
 
 interface AudioData {
   blob: Blob
@@ -97,25 +98,35 @@ export default function AudioForensicDetector() {
     setAnalysisProgress(0)
 
     try {
-      // Progress simulation
-      const interval = setInterval(() => {
-        setAnalysisProgress(prev => (prev < 90 ? prev + 10 : prev))
-      }, 500)
-
       // Try the API call
       const formData = new FormData()
       formData.append("audio", targetAudio.blob, targetAudio.name)
 
       const response = await fetch("/api/classify-audio", {
         method: "POST",
+        headers: { Accept: "application/x-ndjson" }, // Stream progress and early events
         body: formData, // Sending as FormData is better for large files
       }).catch(() => null)
 
-      clearInterval(interval)
-
       let result
       if (response && response.ok) {
-        result = await response.json()
+        // Classification fills the first half of the bar, separation the second
+        const liveEvents: any[] = []
+        const handleMessage = (message: any) => {
+          if (message.type === "progress" && typeof message.percent === "number") {
+            const offset = message.engine === "separate" ? 50 : 0
+            setAnalysisProgress(Math.min(99, Math.round(offset + message.percent / 2)))
+          } else if (message.type === "events") {
+            liveEvents.push(...message.events)
+            const soundEvents = [...liveEvents]
+            setAudioData(prev => prev?.url === targetAudio.url
+              ? { ...prev, analysisResults: { ...prev.analysisResults, partial: true, soundEvents, detectedSounds: soundEvents.length } }
+              : prev)
+          }
+        }
+        result = (response.headers.get("content-type") || "").includes("application/x-ndjson")
+          ? await readNdjson(response, handleMessage)
+          : await response.json()
 
         // Polyfill frequency spectrum if missing (for legacy or partial API results)
         if (!result.frequencySpectrum || result.frequencySpectrum.length === 0) {
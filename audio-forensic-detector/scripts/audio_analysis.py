@@ -2,28 +2,34 @@
 # Audio Forensic Analysis Script
 # ================================
 
-import librosa
-import librosa.display
-import matplotlib
-import matplotlib.pyplot as plt
-import numpy as np
-from scipy.signal import find_peaks
 import json
 import sys
 import base64
-import io
-from scipy.io import wavfile
 import tempfile
 import os
 
-# Set matplotlib to use Agg backend for server environments
-matplotlib.use('Agg')
+# Heavy numeric libraries are imported inside analyze_audio so that spawning
+# this script (or importing it) does not pay librosa/scipy start-up cost
+# before any audio is touched. Nothing here plots, so matplotlib is not needed.
+
+def stft_magnitude(y, n_fft=2048, hop_length=512):
+    """
+    Magnitude STFT (frequency bins x frames). Shared with the fingerprinting
+    module so both use the same transform.
+    """
+    import numpy as np
+    import librosa
+    return np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length))
 
 def analyze_audio(audio_data_base64, filename="uploaded_audio"):
     """
     Analyze audio data and return comprehensive forensic analysis results
     """
     try:
+        import numpy as np
+        import librosa
+        from scipy.signal import find_peaks
+
         # Decode base64 audio data
         audio_bytes = base64.b64decode(audio_data_base64)
         
@@ -42,8 +48,7 @@ def analyze_audio(audio_data_base64, filename="uploaded_audio"):
         # ================================
         # STFT - Short-Time Fourier Transform
         # ================================
-        stft_result = librosa.stft(y)
-        stft_db = librosa.amplitude_to_db(np.abs(stft_result), ref=np.max)
+        stft_db = librosa.amplitude_to_db(stft_magnitude(y), ref=np.max)
         
         # ================================
         # FFT - Fast Fourier Transform
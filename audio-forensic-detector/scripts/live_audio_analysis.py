@@ -3,31 +3,26 @@
 # Enhanced version with real-time processing
 # ================================
 
-import librosa
-import librosa.display
-import matplotlib
-import matplotlib.pyplot as plt
 import numpy as np
-from scipy.signal import find_peaks
 import json
 import sys
 import base64
-import io
-from scipy.io import wavfile
 import tempfile
 import os
-import plotly.graph_objs as go
-import plotly.offline as opy
 from datetime import datetime
 
-# Set matplotlib to use Agg backend for server environments
-matplotlib.use('Agg')
+# librosa/scipy are imported inside generate_live_analysis so the real-time
+# chunk path (process_real_time_chunk) only needs numpy. Visualisation data is
+# emitted as plain JSON, so neither matplotlib nor plotly is required here.
 
 def generate_live_analysis(audio_data_base64, filename="uploaded_audio"):
     """
     Generate comprehensive live audio analysis with multiple visualizations
     """
     try:
+        import librosa
+        from scipy.signal import find_peaks
+
         # Decode base64 audio data
         audio_bytes = base64.b64decode(audio_data_base64)
         
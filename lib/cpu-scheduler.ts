@@ -0,0 +1,401 @@
+import fs from "fs"
+import os from "os"
+import path from "path"
+
+// CPU budget for the Python jobs spawned by the API routes.
+// Every job asks for a thread range; it starts only when at least its minimum
+// is free and is then told exactly how many threads it may use, so concurrent
+// uploads queue instead of each letting torch/TFLite grab every core.
+//
+// Jobs come in two priority classes. Interactive jobs (short live clips) are
+// always dispatched before batch jobs and may preempt running batch work:
+// the batch job is told to pause at its next checkpoint, and once it reports
+// that it has stopped ("paused" message, see jobMessage) its threads are lent
+// out until the interactive work drains. Until then they stay counted, so the
+// CPU is never oversubscribed while a long segment finishes. Within a class, the next job
+// goes to the user currently holding the fewest threads (FIFO among equals).
+//
+// Each running job gets a control file (FORENSIC_JOB_CONTROL) holding "run",
+// "pause" or "cancel", which the Python loops check between segments
+// (scripts/job_control.py).
+
+export type JobKind = "classify" | "separate"
+export type JobPriority = "interactive" | "batch"
+export const JOB_PRIORITIES: JobPriority[] = ["interactive", "batch"]
+
+interface JobProfile {
+  minThreads: number
+  maxThreads: number
+}
+
+// YAMNet gains little past two threads; Demucs scales with whatever it gets.
+const JOB_PROFILES: Record<JobKind, JobProfile> = {
+  classify: { minThreads: 1, maxThreads: 2 },
+  separate: { minThreads: 2, maxThreads: Number.POSITIVE_INFINITY },
+}
+
+export interface JobOptions {
+  priority?: JobPriority
+  user?: string
+}
+
+export interface Allocation {
+  id: number
+  kind: JobKind
+  jobID: string
+  user: string
+  priority: JobPriority
+  threads: number
+  budget: number
+  inUseBefore: number
+  queuedMs: number
+  queuePosition: number
+  controlPath: string
+  startedAt: number
+}
+
+export class JobCancelledError extends Error {
+  constructor(jobID: string) {
+    super(`Job ${jobID} was cancelled`)
+    this.name = "JobCancelledError"
+  }
+}
+
+interface Waiter {
+  kind: JobKind
+  jobID: string
+  user: string
+  priority: JobPriority
+  enqueuedAt: number
+  position: number
+  resolve: (allocation: Allocation) => void
+  reject: (error: Error) => void
+}
+
+// "pausing": pause requested, threads still held until the job acknowledges
+type RunState = "running" | "pausing" | "paused"
+
+interface Running {
+  allocation: Allocation
+  state: RunState
+  pausedAt: number
+}
+
+interface ClassStats {
+  jobs: number
+  cancelled: number
+  preempted: number
+  queueMsTotal: number
+  queueMsMax: number
+  runMsTotal: number
+  runMsMax: number
+  pausedMsTotal: number
+}
+
+const emptyStats = (): ClassStats => ({
+  jobs: 0, cancelled: 0, preempted: 0,
+  queueMsTotal: 0, queueMsMax: 0, runMsTotal: 0, runMsMax: 0, pausedMsTotal: 0,
+})
+
+function writeControl(allocation: Allocation, command: "run" | "pause" | "cancel") {
+  try {
+    fs.writeFileSync(allocation.controlPath, command)
+  } catch (e) {
+    console.error(`[Scheduler] Could not write ${command} for ${allocation.jobID}:`, e)
+  }
+}
+
+export class CpuScheduler {
+  readonly budget: number
+  private inUse = 0
+  private nextId = 1
+  private queue: Waiter[] = []
+  private running = new Map<number, Running>()
+  private pausedMs = new Map<number, number>()
+  private stats: Record<JobPriority, ClassStats> = { interactive: emptyStats(), batch: emptyStats() }
+
+  constructor(budget?: number) {
+    const fromEnv = Number(process.env.FORENSIC_CPU_BUDGET)
+    this.budget = Math.max(1, Math.floor(budget || fromEnv || os.cpus().length || 1))
+  }
+
+  acquire(kind: JobKind, jobID: string, options: JobOptions = {}): Promise<Allocation> {
+    return new Promise((resolve, reject) => {
+      this.queue.push({
+        kind,
+        jobID,
+        user: options.user || "anonymous",
+        priority: options.priority || "interactive",
+        enqueuedAt: Date.now(),
+        position: this.queue.length,
+        resolve,
+        reject,
+      })
+      this.dispatch()
+    })
+  }
+
+  release(allocation: Allocation, outcome: "done" | "cancelled" = "done") {
+    const entry = this.running.get(allocation.id)
+    if (!entry) return
+    this.running.delete(allocation.id)
+    // A paused job's threads are already lent out
+    if (entry.state !== "paused") this.inUse = Math.max(0, this.inUse - allocation.threads)
+
+    const stats = this.stats[allocation.priority]
+    const runMs = Date.now() - allocation.startedAt
+    const pausedMs = (this.pausedMs.get(allocation.id) || 0) + (entry.state === "paused" ? Date.now() - entry.pausedAt : 0)
+    this.pausedMs.delete(allocation.id)
+    stats.runMsTotal += runMs
+    stats.runMsMax = Math.max(stats.runMsMax, runMs)
+    stats.pausedMsTotal += pausedMs
+    if (outcome === "cancelled") stats.cancelled++
+
+    fs.rm(allocation.controlPath, { force: true }, () => {})
+    this.dispatch()
+  }
+
+  // Runs `task` with a thread grant and always gives the threads back
+  async run<T>(
+    kind: JobKind,
+    jobID: string,
+    task: (allocation: Allocation) => Promise<T>,
+    options: JobOptions = {}
+  ): Promise<T> {
+    const allocation = await this.acquire(kind, jobID, options)
+    let outcome: "done" | "cancelled" = "done"
+    try {
+      const result = await task(allocation)
+      if ((result as any)?.status === "cancelled") outcome = "cancelled"
+      return result
+    } finally {
+      this.release(allocation, outcome)
+    }
+  }
+
+  // Engine messages of a running job. "paused" is the job's acknowledgement
+  // that it stopped at a checkpoint: only then are its threads handed out.
+  jobMessage(allocation: Allocation, message: { type: string }) {
+    const entry = this.running.get(allocation.id)
+    if (!entry || message.type !== "paused" || entry.state !== "pausing") return
+    entry.state = "paused"
+    entry.pausedAt = Date.now()
+    this.inUse = Math.max(0, this.inUse - allocation.threads)
+    console.log(`[Scheduler] Batch ${allocation.kind} ${allocation.jobID} paused; ${allocation.threads} thread(s) lent out`)
+    this.dispatch()
+  }
+
+  // Queued jobs are rejected with JobCancelledError; running ones are told to
+  // stop at their next checkpoint. Returns how many jobs were affected.
+  cancel(jobID: string): number {
+    let count = 0
+    for (const waiter of this.queue.filter((w) => w.jobID === jobID)) {
+      this.queue.splice(this.queue.indexOf(waiter), 1)
+      this.stats[waiter.priority].cancelled++
+      waiter.reject(new JobCancelledError(jobID))
+      count++
+    }
+    for (const { allocation } of this.running.values()) {
+      if (allocation.jobID === jobID) {
+        writeControl(allocation, "cancel")
+        count++
+      }
+    }
+    if (count) this.dispatch()
+    return count
+  }
+
+  status() {
+    const perClass = Object.fromEntries(JOB_PRIORITIES.map((priority) => {
+      const s = this.stats[priority]
+      const finished = Math.max(1, s.jobs - this.countRunning(priority))
+      return [priority, {
+        queued: this.queue.filter((w) => w.priority === priority).length,
+        running: this.countRunning(priority),
+        jobs: s.jobs,
+        cancelled: s.cancelled,
+        preempted: s.preempted,
+        meanQueueMs: s.jobs ? Math.round(s.queueMsTotal / s.jobs) : 0,
+        maxQueueMs: s.queueMsMax,
+        meanRunMs: Math.round(s.runMsTotal / finished),
+        maxRunMs: s.runMsMax,
+        pausedMs: s.pausedMsTotal,
+      }]
+    }))
+    return {
+      budget: this.budget,
+      inUse: this.inUse,
+      queued: this.queue.length,
+      running: [...this.running.values()].map(({ allocation, state }) => ({
+        jobID: allocation.jobID,
+        kind: allocation.kind,
+        user: allocation.user,
+        priority: allocation.priority,
+        threads: allocation.threads,
+        state,
+      })),
+      classes: perClass,
+    }
+  }
+
+  private countRunning(priority: JobPriority) {
+    return [...this.running.values()].filter((r) => r.allocation.priority === priority).length
+  }
+
+  private threadsHeldBy(user: string) {
+    let threads = 0
+    for (const { allocation, state } of this.running.values()) {
+      if (allocation.user === user && state !== "paused") threads += allocation.threads
+    }
+    return threads
+  }
+
+  // Fair share: the waiter of this class whose user holds the fewest threads;
+  // the earliest one among equals
+  private nextWaiter(priority: JobPriority): Waiter | undefined {
+    let best: Waiter | undefined
+    let bestHeld = Infinity
+    for (const waiter of this.queue) {
+      if (waiter.priority !== priority) continue
+      const held = this.threadsHeldBy(waiter.user)
+      if (held < bestHeld) {
+        best = waiter
+        bestHeld = held
+      }
+    }
+    return best
+  }
+
+  // Asks running batch jobs (newest first) to pause until `needed` threads
+  // will be free, counting jobs already asked. Nothing is paused unless that
+  // is enough. Threads are freed when each job acknowledges (jobMessage).
+  private preempt(needed: number) {
+    let pending = 0
+    for (const entry of this.running.values()) {
+      if (entry.state === "pausing") pending += entry.allocation.threads
+    }
+    if (pending >= needed) return
+    const candidates = [...this.running.values()]
+      .filter((r) => r.allocation.priority === "batch" && r.state === "running")
+      .sort((a, b) => b.allocation.startedAt - a.allocation.startedAt)
+    const chosen: Running[] = []
+    let freed = pending
+    for (const candidate of candidates) {
+      if (freed >= needed) break
+      chosen.push(candidate)
+      freed += candidate.allocation.threads
+    }
+    if (freed < needed) return
+    for (const entry of chosen) {
+      entry.state = "pausing"
+      this.stats.batch.preempted++
+      writeControl(entry.allocation, "pause")
+      console.log(`[Scheduler] Pausing batch ${entry.allocation.kind} ${entry.allocation.jobID} for interactive work`)
+    }
+  }
+
+  // Paused jobs resume (oldest pause first) once no interactive job is waiting
+  // and their threads are free again; jobs that have not stopped yet are just
+  // told to carry on. Returns false if one is still waiting.
+  private resumePaused(): boolean {
+    for (const entry of this.running.values()) {
+      if (entry.state !== "pausing") continue
+      entry.state = "running"
+      writeControl(entry.allocation, "run")
+    }
+    const paused = [...this.running.values()].filter((r) => r.state === "paused").sort((a, b) => a.pausedAt - b.pausedAt)
+    for (const entry of paused) {
+      if (this.budget - this.inUse < entry.allocation.threads) return false
+      entry.state = "running"
+      this.inUse += entry.allocation.threads
+      const id = entry.allocation.id
+      this.pausedMs.set(id, (this.pausedMs.get(id) || 0) + Date.now() - entry.pausedAt)
+      writeControl(entry.allocation, "run")
+      console.log(`[Scheduler] Resumed batch ${entry.allocation.kind} ${entry.allocation.jobID}`)
+    }
+    return true
+  }
+
+  // Interactive first (preempting batch work if needed), then paused batch
+  // jobs, then new batch jobs. Within a class the chosen waiter blocks the
+  // ones behind it, so a large job is not starved by smaller ones.
+  private dispatch() {
+    for (const priority of JOB_PRIORITIES) {
+      if (priority === "batch" && (this.queue.some((w) => w.priority === "interactive") || !this.resumePaused())) return
+
+      let waiter = this.nextWaiter(priority)
+      while (waiter) {
+        const profile = JOB_PROFILES[waiter.kind]
+        const minThreads = Math.min(profile.minThreads, this.budget)
+        const free = this.budget - this.inUse
+        if (free < minThreads) {
+          if (priority === "interactive") this.preempt(minThreads - free)
+          break
+        }
+
+        this.queue.splice(this.queue.indexOf(waiter), 1)
+        this.start(waiter, Math.min(profile.maxThreads, free))
+        waiter = this.nextWaiter(priority)
+      }
+      if (waiter) return
+    }
+  }
+
+  private start(waiter: Waiter, threads: number) {
+    const id = this.nextId++
+    const now = Date.now()
+    const allocation: Allocation = {
+      id,
+      kind: waiter.kind,
+      jobID: waiter.jobID,
+      user: waiter.user,
+      priority: waiter.priority,
+      threads,
+      budget: this.budget,
+      inUseBefore: this.inUse,
+      queuedMs: now - waiter.enqueuedAt,
+      queuePosition: waiter.position,
+      controlPath: path.join(os.tmpdir(), `forensic-job-${process.pid}-${id}.ctl`),
+      startedAt: now,
+    }
+    writeControl(allocation, "run")
+    this.inUse += threads
+    this.running.set(id, { allocation, state: "running", pausedAt: 0 })
+
+    const stats = this.stats[waiter.priority]
+    stats.jobs++
+    stats.queueMsTotal += allocation.queuedMs
+    stats.queueMsMax = Math.max(stats.queueMsMax, allocation.queuedMs)
+    waiter.resolve(allocation)
+  }
+}
+
+// Environment for a spawned Python job so every thread pool honours the grant
+export function threadEnv(allocation: Allocation): NodeJS.ProcessEnv {
+  const threads = String(allocation.threads)
+  return {
+    ...process.env,
+    FORENSIC_THREADS: threads,
+    FORENSIC_JOB_CONTROL: allocation.controlPath,
+    OMP_NUM_THREADS: threads,
+    MKL_NUM_THREADS: threads,
+    OPENBLAS_NUM_THREADS: threads,
+    NUMEXPR_NUM_THREADS: threads,
+    VECLIB_MAXIMUM_THREADS: threads,
+    TF_NUM_INTRAOP_THREADS: threads,
+    TF_NUM_INTEROP_THREADS: "1",
+  }
+}
+
+export function describeAllocation(allocation: Allocation): string {
+  return (
+    `[Scheduler] ${allocation.priority} ${allocation.kind} ${allocation.jobID} (${allocation.user}): ` +
+    `${allocation.threads}/${allocation.budget} threads ` +
+    `(${allocation.inUseBefore} in use, waited ${allocation.queuedMs}ms behind ${allocation.queuePosition} job(s))`
+  )
+}
+
+// One scheduler per server process (kept on globalThis so dev hot reloads don't reset it)
+const globalForScheduler = globalThis as unknown as { cpuScheduler?: CpuScheduler }
+export const cpuScheduler = globalForScheduler.cpuScheduler ?? new CpuScheduler()
+globalForScheduler.cpuScheduler = cpuScheduler
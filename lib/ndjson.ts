@@ -0,0 +1,33 @@
+// Reads a newline-delimited JSON response (see app/api/classify-audio/route.ts),
+// passing every message to onMessage. Resolves with the payload of the final
+// {"type": "result"} line.
+export async function readNdjson(response: Response, onMessage?: (message: any) => void): Promise<any> {
+  if (!response.body) throw new Error("Response has no body")
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffered = ""
+  let result: any = null
+
+  const handleLine = (line: string) => {
+    if (!line.trim()) return
+    const message = JSON.parse(line)
+    if (message.type === "result") result = message.result
+    onMessage?.(message)
+  }
+
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffered += decoder.decode(value, { stream: true })
+    let newline = buffered.indexOf("\n")
+    while (newline !== -1) {
+      handleLine(buffered.slice(0, newline))
+      buffered = buffered.slice(newline + 1)
+      newline = buffered.indexOf("\n")
+    }
+  }
+  handleLine(buffered + decoder.decode())
+
+  if (!result) throw new Error("Stream ended without a result")
+  return result
+}
@@ -0,0 +1,92 @@
+// Reader for the .peaks files written by scripts/waveform_peaks.py.
+// Only the header and the level being drawn are downloaded, using HTTP Range.
+
+const HEADER_SIZE = 28
+const LEVEL_SIZE = 16
+const HEADER_FETCH_BYTES = 512
+
+export interface PeakLevel {
+  samplesPerPixel: number
+  length: number
+  offset: number
+}
+
+export interface PeaksHeader {
+  version: number
+  channels: number
+  sampleRate: number
+  totalSamples: number
+  duration: number
+  levels: PeakLevel[]
+}
+
+async function fetchRange(url: string, start: number, end: number): Promise<ArrayBuffer> {
+  const response = await fetch(url, { headers: { Range: `bytes=${start}-${end}` } })
+  if (!response.ok) {
+    throw new Error(`Failed to fetch peaks: ${response.status}`)
+  }
+  const buffer = await response.arrayBuffer()
+  // Servers without Range support send the whole file
+  return response.status === 206 ? buffer : buffer.slice(start, end + 1)
+}
+
+export async function fetchPeaksHeader(url: string): Promise<PeaksHeader> {
+  let buffer = await fetchRange(url, 0, HEADER_FETCH_BYTES - 1)
+  let view = new DataView(buffer)
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4))
+  if (magic !== "AFPK") {
+    throw new Error("Not a peak file")
+  }
+
+  const nLevels = view.getUint32(20, true)
+  const tableEnd = HEADER_SIZE + nLevels * LEVEL_SIZE
+  if (tableEnd > buffer.byteLength) {
+    buffer = await fetchRange(url, 0, tableEnd - 1)
+    view = new DataView(buffer)
+  }
+
+  const levels: PeakLevel[] = []
+  for (let i = 0; i < nLevels; i++) {
+    const base = HEADER_SIZE + i * LEVEL_SIZE
+    levels.push({
+      samplesPerPixel: view.getUint32(base, true),
+      length: view.getUint32(base + 4, true),
+      offset: Number(view.getBigUint64(base + 8, true)),
+    })
+  }
+
+  const sampleRate = view.getUint32(8, true)
+  const totalSamples = Number(view.getBigUint64(12, true))
+  return {
+    version: view.getUint16(4, true),
+    channels: view.getUint16(6, true),
+    sampleRate,
+    totalSamples,
+    duration: sampleRate ? totalSamples / sampleRate : 0,
+    levels,
+  }
+}
+
+// Picks the coarsest level that still has at least `pixels` columns
+export function pickLevel(header: PeaksHeader, pixels: number): PeakLevel {
+  const candidates = header.levels.filter((level) => level.length >= pixels)
+  return candidates.length ? candidates[candidates.length - 1] : header.levels[0]
+}
+
+// Returns interleaved [min, max, min, max, ...] values in [-1, 1]
+export async function fetchPeaksLevel(url: string, level: PeakLevel): Promise<Float32Array> {
+  if (level.length === 0) return new Float32Array(0)
+  const buffer = await fetchRange(url, level.offset, level.offset + level.length * 4 - 1)
+  const pairs = new Int16Array(buffer)
+  const peaks = new Float32Array(pairs.length)
+  for (let i = 0; i < pairs.length; i++) {
+    peaks[i] = pairs[i] / 32767
+  }
+  return peaks
+}
+
+// Header plus the level that fits `pixels` columns, ready for WaveSurfer's `peaks`/`duration`
+export async function loadPeaks(url: string, pixels: number): Promise<{ peaks: Float32Array; duration: number }> {
+  const header = await fetchPeaksHeader(url)
+  return { peaks: await fetchPeaksLevel(url, pickLevel(header, pixels)), duration: header.duration }
+}
@@ -2,137 +2,73 @@
 # Audio Forensic Analysis Script
 # ================================
 
-import librosa
-import librosa.display
-import matplotlib
-import matplotlib.pyplot as plt
-import numpy as np
-from scipy.signal import find_peaks
 import json
 import sys
 import base64
-import io
-from scipy.io import wavfile
-import tempfile
 import os
 
-# Set matplotlib to use Agg backend for server environments
-matplotlib.use('Agg')
+# Heavy numeric libraries are imported inside the functions so that spawning
+# this script (or importing it) does not pay librosa/scipy start-up cost
+# before any audio is touched. Nothing here plots, so matplotlib is not needed.
 
-def analyze_audio(audio_data_base64, filename="uploaded_audio"):
+def stft_magnitude(y, n_fft=2048, hop_length=512):
     """
-    Analyze audio data and return comprehensive forensic analysis results
+    Magnitude STFT (frequency bins x frames). Shared with the fingerprinting
+    module so both use the same transform.
+    """
+    import numpy as np
+    import librosa
+    return np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length))
+
+def analyze_audio(audio_data_base64, filename="uploaded_audio",
+                  peak_height=0.2, peak_distance=5, bands=None):
+    """
+    Analyze audio data and return comprehensive forensic analysis results.
+    Frame features are cached per content hash (see feature_store.py), so
+    re-running with other detection parameters does not decode the file again.
     """
     try:
+        from feature_store import get_features, detect_events, summary
+
         # Decode base64 audio data
         audio_bytes = base64.b64decode(audio_data_base64)
         
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
-            temp_file.write(audio_bytes)
-            temp_path = temp_file.name
-        
-        # Load audio with librosa
-        y, sr = librosa.load(temp_path, sr=None)
+        # Load cached features, or decode and extract them on first sight
+        features, cache_hit = get_features(data=audio_bytes, filename=filename)
+        info = summary(features)
+        duration = info["duration"]
+        sr = info["sampleRate"]
         
-        print(f"✅ Audio loaded: {filename}")
+        print(f"✅ Audio loaded: {filename}{' (cached features)' if cache_hit else ''}")
         print(f"Sample Rate: {sr} Hz")
-        print(f"Duration: {librosa.get_duration(y=y, sr=sr):.2f} seconds")
-        
-        # ================================
-        # STFT - Short-Time Fourier Transform
-        # ================================
-        stft_result = librosa.stft(y)
-        stft_db = librosa.amplitude_to_db(np.abs(stft_result), ref=np.max)
-        
-        # ================================
-        # FFT - Fast Fourier Transform
-        # ================================
-        fft_result = np.fft.fft(y)
-        magnitude = np.abs(fft_result)
-        frequency = np.linspace(0, sr, len(magnitude))
+        print(f"Duration: {duration:.2f} seconds")
         
         # ================================
         # Detect Sound Events
         # ================================
-        frame_length = 1024
-        hop_length = 512
-        energy = np.array([
-            sum(abs(y[i:i+frame_length]**2))
-            for i in range(0, len(y), hop_length)
-        ])
+        # Peak picking on frame energy, labelled by spectral centroid band
+        num_sounds, sound_events = detect_events(
+            features, height=peak_height, distance=peak_distance, bands=bands, top=None
+        )
         
-        # Normalize energy
-        energy = energy / np.max(energy) if np.max(energy) > 0 else energy
-        
-        # Find peaks (sound events)
-        peaks, properties = find_peaks(energy, height=0.2, distance=5)
-        num_sounds = len(peaks)
-        
-        # ================================
-        # Advanced Analysis
-        # ================================
-        duration = librosa.get_duration(y=y, sr=sr)
-        rms = np.mean(librosa.feature.rms(y=y))
-        
-        # Spectral features
-        spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
-        dominant_frequency = np.mean(spectral_centroids)
-        
-        # Convert to decibels
-        max_decibels = 20 * np.log10(np.max(np.abs(y))) if np.max(np.abs(y)) > 0 else -np.inf
-        
-        # Detect different types of sounds based on frequency characteristics
-        sound_events = []
-        for i, peak in enumerate(peaks):
-            time_pos = (peak * hop_length) / sr
-            freq_at_peak = spectral_centroids[min(peak, len(spectral_centroids)-1)]
-            amplitude = energy[peak]
-            
-            # Classify sound type based on frequency
-            if freq_at_peak < 300:
-                sound_type = "Low Frequency/Bass"
-            elif freq_at_peak < 1000:
-                sound_type = "Voice/Mid Range"
-            elif freq_at_peak < 4000:
-                sound_type = "High Voice/Instruments"
-            else:
-                sound_type = "High Frequency/Noise"
-            
-            sound_events.append({
-                "time": round(time_pos, 2),
-                "frequency": round(freq_at_peak, 1),
-                "amplitude": round(amplitude, 3),
-                "type": sound_type,
-                "decibels": round(20 * np.log10(amplitude) if amplitude > 0 else -np.inf, 1)
-            })
-        
-        # Sort by amplitude (loudest first)
-        sound_events.sort(key=lambda x: x["amplitude"], reverse=True)
-        
-        # Create frequency spectrum data
-        freq_spectrum = []
-        freq_step = len(frequency) // 100  # Sample 100 points
-        for i in range(0, len(frequency)//2, freq_step):
-            if i < len(magnitude):
-                freq_spectrum.append({
-                    "frequency": round(frequency[i], 1),
-                    "magnitude": round(magnitude[i] / np.max(magnitude), 3) if np.max(magnitude) > 0 else 0
-                })
+        rms = info["averageRMS"]
+        dominant_frequency = info["dominantFrequency"]
+        max_decibels = info["maxDecibels"]
         
         # ================================
         # Generate Analysis Report
         # ================================
         analysis_results = {
             "filename": filename,
-            "duration": round(duration, 2),
+            "duration": duration,
             "sampleRate": int(sr),
-            "averageRMS": round(float(rms), 6),
+            "averageRMS": rms,
             "detectedSounds": num_sounds,
-            "dominantFrequency": round(float(dominant_frequency), 1),
-            "maxDecibels": round(float(max_decibels), 1),
+            "dominantFrequency": dominant_frequency,
+            "maxDecibels": max_decibels,
             "soundEvents": sound_events[:10],  # Top 10 events
-            "frequencySpectrum": freq_spectrum,
+            "frequencySpectrum": info["frequencySpectrum"],
+            "featureHash": features.hash,
             "analysisComplete": True,
             "timestamp": "2024-01-01T00:00:00Z"
         }
@@ -150,9 +86,6 @@ def analyze_audio(audio_data_base64, filename="uploaded_audio"):
         for i, event in enumerate(sound_events[:5]):
             print(f"{i+1}. {event['type']} at {event['time']}s - {event['frequency']:.1f}Hz ({event['decibels']:.1f}dB)")
         
-        # Clean up temporary file
-        os.unlink(temp_path)
-        
         return json.dumps(analysis_results, indent=2)
         
     except Exception as e:
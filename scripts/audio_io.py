@@ -0,0 +1,46 @@
+import numpy as np
+
+# ================================
+# PCM to Float Conversion
+# ================================
+# Every engine reads WAVs memory-mapped and converts them block by block, so
+# a one-hour file is never turned into float32 all at once. These helpers are
+# the one place that maps integer PCM onto [-1, 1]; the scaling is done in
+# place on the converted block, so each call makes a single float32 copy.
+
+SCALES = {
+    np.dtype(np.int16): (0.0, 32768.0),
+    np.dtype(np.int32): (0.0, 2147483648.0),
+    np.dtype(np.uint8): (128.0, 128.0),
+}
+
+
+def to_float(block):
+    """PCM block (any dtype, any channel layout) as float32 in [-1, 1]."""
+    block = np.asarray(block)
+    if block.dtype not in SCALES:
+        return block.astype(np.float32, copy=False)
+    offset, scale = SCALES[block.dtype]
+    out = block.astype(np.float32)
+    if offset:
+        out -= offset
+    out /= scale
+    return out
+
+
+def to_mono_float(block):
+    """PCM block as mono float32 in [-1, 1]; (samples, channels) input is averaged."""
+    block = to_float(block)
+    return block.mean(axis=1, dtype=np.float32) if block.ndim > 1 else block
+
+
+def iter_float_blocks(audio, block_samples, mono=False):
+    """
+    Yields (start, block) over `audio` in blocks of `block_samples` samples,
+    each converted with to_float (or to_mono_float when `mono`). Works on
+    memory-mapped arrays without reading ahead of the current block.
+    """
+    convert = to_mono_float if mono else to_float
+    block_samples = max(1, int(block_samples))
+    for start in range(0, len(audio), block_samples):
+        yield start, convert(audio[start:start + block_samples])
@@ -6,6 +6,7 @@ import shutil
 import warnings
 import numpy as np
 from scipy.io import wavfile
+from job_control import JobCancelled
 
 import tempfile
 
@@ -13,15 +14,28 @@ import tempfile
 warnings.filterwarnings("ignore")
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 
+def read_wav_mapped(path):
+    """
+    wavfile.read memory-mapped, so the samples are paged in from disk as they
+    are used instead of being copied into memory. 24-bit containers cannot be
+    mapped and are read in full.
+    """
+    try:
+        return wavfile.read(path, mmap=True)
+    except ValueError as e:
+        if "mmap" not in str(e):
+            raise
+        return wavfile.read(path)
+
 def convert_to_wav_if_needed(input_path, log_func):
     """
     Tries to read the file. If it fails, converts to WAV using FFmpeg.
     Returns (path_to_read, is_temp)
     """
     try:
-        # Check if readable
+        # Check if readable (mapped: this only parses the header and chunk layout)
         try:
-            wavfile.read(input_path)
+            read_wav_mapped(input_path)
             return input_path, False
         except Exception:
             log_func(f"Direct read failed, attempting conversion for {input_path}")
@@ -44,7 +58,202 @@ def convert_to_wav_if_needed(input_path, log_func):
         log_func(f"Conversion failed: {str(e)}")
         return input_path, False
 
-def separate_audio(input_path, output_dir, job_id, classification_path=None):
+_MODELS = {}
+MODEL_CACHE_DIR = os.environ.get(
+    "FORENSIC_MODEL_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "audio-forensic")
+)
+# Demucs runs in chunks this long so pause/cancel requests are honoured between them
+CHECKPOINT_SECONDS = 60
+CHUNK_CONTEXT_SECONDS = 2
+# Forensic stems built by masking the input with classified events (stem key -> event type)
+FORENSIC_STEMS = {
+    "vocals": "Human Voice",
+    "background": "Musical Content",
+    "vehicles": "Vehicle Sound",
+    "footsteps": "Footsteps",
+    "animals": "Animal Signal",
+    "wind": "Atmospheric Wind",
+    "gunshots": "Gunshot / Explosion",
+    "screams": "Scream / Aggression",
+    "sirens": "Siren / Alarm",
+    "impact": "Impact / Breach"
+}
+
+def quantized_model_path(name="htdemucs"):
+    """On-disk cache for the int8 weights; keyed by torch version since quantized packing can change."""
+    import torch
+    version = torch.__version__.replace("+", "_")
+    return os.path.join(MODEL_CACHE_DIR, f"{name}-int8-dynamic-torch{version}.state.pt")
+
+def _quantize_demucs(name):
+    """
+    Dynamic int8 quantization of the Linear/LSTM layers (the transformer and
+    BiLSTM blocks); convolutions stay float32. The quantized weights are cached
+    on disk as a state_dict, so every later run loads the same int8 model; the
+    cache is read with weights_only=True and never unpickles code.
+    """
+    import torch
+    from demucs.pretrained import get_model
+    try:
+        from torch.ao.quantization import quantize_dynamic
+    except ImportError:
+        from torch.quantization import quantize_dynamic
+    model = get_model(name)
+    model.cpu()
+    model.eval()
+    model = quantize_dynamic(model, {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8)
+
+    path = quantized_model_path(name)
+    if os.path.exists(path):
+        try:
+            model.load_state_dict(torch.load(path, map_location="cpu", weights_only=True))
+            return model
+        except Exception as e:
+            print(f"[Demucs] Ignoring unreadable quantized cache {path}: {e}", file=sys.stderr)
+
+    os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+    tmp_path = path + ".tmp"
+    torch.save(model.state_dict(), tmp_path)
+    os.replace(tmp_path, path)
+    print(f"[Demucs] Cached quantized model at {path}", file=sys.stderr)
+    return model
+
+def load_demucs_model(name="htdemucs", quantized=False):
+    """
+    Loads a pretrained Demucs model once per process; later calls reuse it.
+    With `quantized`, the dynamic int8 variant is used (see _quantize_demucs).
+    """
+    key = (name, quantized)
+    if key not in _MODELS:
+        if quantized:
+            model = _quantize_demucs(name)
+        else:
+            from demucs.pretrained import get_model
+            model = get_model(name)
+        model.cpu()
+        model.eval()
+        _MODELS[key] = model
+    return _MODELS[key]
+
+def load_audio(read_path):
+    """
+    Reads a WAV as float32 in [-1, 1], shaped (Channels, Samples), with mono
+    duplicated to stereo as Demucs expects.
+    """
+    sr, audio_data = wavfile.read(read_path)
+    
+    # Convert to float32 in [-1, 1] (scaled in place: no second float copy)
+    from audio_io import to_float
+    audio_data = to_float(audio_data)
+
+    # Ensure shape (Channels, Samples)
+    if len(audio_data.shape) == 1:
+        audio_data = np.expand_dims(audio_data, axis=0) # (1, Samples)
+    else:
+        audio_data = audio_data.T # (Channels, Samples)
+        
+    # Demucs expects Stereo (2 channels). Mix/Duplicate if Mono.
+    if audio_data.shape[0] == 1:
+        audio_data = np.concatenate([audio_data, audio_data], axis=0)
+    return sr, audio_data
+
+def event_spans(events, sr, n_samples, stems_to_generate, skip=(), clip_duration=0.975):
+    """
+    Sample spans of the classified events per stem (`stems_to_generate` is
+    stem key -> event type). Stems in `skip` and stems without events are left out.
+    """
+    by_type = { trigger_word.lower(): stem_key for stem_key, trigger_word in stems_to_generate.items() }
+    spans = {}
+    for event in events:
+        target_stem = by_type.get(event.get("type", "").lower())
+        if not target_stem or target_stem in skip:
+            continue
+
+        # Segments carry their own end; per-frame events span one clip
+        start_time = float(event.get("start", event.get("time", 0)))
+        end_time = float(event.get("end", start_time + clip_duration))
+        start_idx = max(0, int(start_time * sr))
+        end_idx = min(n_samples, int(end_time * sr))
+        if start_idx < end_idx:
+            spans.setdefault(target_stem, []).append((start_idx, end_idx))
+    return spans
+
+def masked_stems(audio_data, spans):
+    """
+    Yields (stem, audio, peak) per stem: silence except the stem's spans, copied
+    from `audio_data`. One full-length stem is built at a time, so drop each
+    one before asking for the next.
+    """
+    for stem_key, stem_spans in spans.items():
+        stem_audio = np.zeros(audio_data.shape, dtype=audio_data.dtype)
+        peak = 0
+        for start_idx, end_idx in stem_spans:
+            stem_audio[start_idx:end_idx] = audio_data[start_idx:end_idx]
+            peak = max(peak, np.max(np.abs(audio_data[start_idx:end_idx])))
+        yield stem_key, stem_audio, peak
+        del stem_audio
+
+def separate_array(model, audio_data, sr, regions=None, progress=True):
+    """
+    Runs Demucs on a (channels, samples) float32 array (mono is duplicated to
+    stereo). With `regions` (VAD intervals in seconds) only those spans are
+    separated and the rest stays silent. A float32 `audio_data` is shared with
+    the input tensor and normalised in place, so callers must not reuse it.
+    Returns a (sources, channels, samples) tensor at model.samplerate.
+    """
+    import torch
+    from demucs.apply import apply_model
+    import torchaudio.transforms as T
+
+    # Demucs expects Stereo (2 channels). Mix/Duplicate if Mono.
+    if audio_data.shape[0] == 1:
+        audio_data = np.concatenate([audio_data, audio_data], axis=0)
+
+    # Share the buffer with the tensor rather than copying it
+    wav = torch.from_numpy(np.asarray(audio_data, dtype=np.float32))
+
+    # Resample if needed (Demucs htdemucs is 44100Hz)
+    if sr != model.samplerate:
+        print(f"[Demucs] Resampling {sr} -> {model.samplerate}Hz", file=sys.stderr)
+        resampler = T.Resample(sr, model.samplerate)
+        wav = resampler(wav)
+
+    # Normalization (Standard Demucs procedure), in place
+    ref = wav.mean(0)
+    ref_mean, ref_std = ref.mean(), ref.std()
+    del ref
+    wav.sub_(ref_mean).div_(ref_std)
+
+    from progress import progress as report
+    from job_control import checkpoint
+    total = wav.shape[-1]
+    if regions is not None:
+        from vad import region_sample_bounds
+        bounds = list(region_sample_bounds(regions, model.samplerate, total))
+    else:
+        bounds = [(0, total)]
+
+    # Long spans go through in CHECKPOINT_SECONDS chunks (with CHUNK_CONTEXT_SECONDS
+    # of context each side, trimmed afterwards) so the scheduler can pause or
+    # cancel the job between chunks
+    chunk = int(CHECKPOINT_SECONDS * model.samplerate)
+    context = int(CHUNK_CONTEXT_SECONDS * model.samplerate)
+    pieces = [(s, min(s + chunk, end)) for start, end in bounds for s in range(start, end, chunk)]
+
+    # sources shape: (Sources, Channels, Samples)
+    sources = torch.zeros((len(model.sources),) + tuple(wav.shape))
+    with torch.inference_mode():
+        for i, (start_idx, end_idx) in enumerate(pieces):
+            checkpoint("separate", force=True)
+            lo, hi = max(0, start_idx - context), min(total, end_idx + context)
+            separated = apply_model(model, wav[None, :, lo:hi], device="cpu", shifts=1, split=True, overlap=0.25, progress=progress)[0]
+            sources[:, :, start_idx:end_idx] = separated[:, :, start_idx - lo:end_idx - lo]
+            report("separate", 100.0 * (i + 1) / len(pieces), chunk=i + 1, chunks=len(pieces))
+
+    # De-normalize, in place
+    return sources.mul_(ref_std).add_(ref_mean)
+
+def separate_audio(input_path, output_dir, job_id, classification_path=None, use_vad=False, stem_formats=None, peaks=True, quantized=False):
     debug_log = []
     
     def log(msg):
@@ -52,9 +261,16 @@ def separate_audio(input_path, output_dir, job_id, classification_path=None):
 
     converted_audio_path = None
     is_temp_file = False
+    vad_info = None
+    stem_files = {}
 
     try:
         log(f"Start separation. Input: {input_path}, Job: {job_id}")
+        from stem_writer import parse_formats, write_stem_formats
+        from progress import emit, progress
+        from job_control import checkpoint
+        stem_formats = parse_formats(stem_formats)
+        log(f"Stem formats: {', '.join(stem_formats)}")
         input_path = os.path.abspath(input_path.strip('"'))
         output_dir = os.path.abspath(output_dir.strip('"'))
         
@@ -77,64 +293,41 @@ def separate_audio(input_path, output_dir, job_id, classification_path=None):
         # but let's see what Demucs does.
 
         # 1. Run Demucs (In-process to bypass torchaudio.save issues)
-        print(f"[Demucs] Loading model htdemucs...", file=sys.stderr)
+        print(f"[Demucs] Loading model htdemucs{' (int8)' if quantized else ''}...", file=sys.stderr)
         
         # Imports inside function to avoid heavy load if not needed
         import torch
-        from demucs.pretrained import get_model
-        from demucs.apply import apply_model
-        import torchaudio.transforms as T
         
-        # Load Model
-        model = get_model("htdemucs")
-        model.cpu()
-        model.eval()
+        # Respect the scheduler's thread grant before torch spins up its pool
+        from thread_budget import apply_thread_budget
+        log(f"Thread budget: {apply_thread_budget(torch_module=torch)}")
+
+        # Load Model (cached, so batch workers keep it warm between files)
+        progress("load_model", 0, quantized=quantized)
+        model = load_demucs_model("htdemucs", quantized=quantized)
+        log(f"Model: htdemucs ({'dynamic int8' if quantized else 'float32'})")
         
         # Load Audio via Scipy (safe)
-        sr, audio_data = wavfile.read(read_path)
-        
-        # Convert to float32 and normalize to [-1, 1]
-        if audio_data.dtype == np.int16:
-             audio_data = audio_data.astype(np.float32) / 32768.0
-        elif audio_data.dtype == np.int32:
-             audio_data = audio_data.astype(np.float32) / 2147483648.0
-        elif audio_data.dtype == np.uint8:
-             audio_data = (audio_data.astype(np.float32) - 128) / 128.0
-             
-        # Ensure shape (Channels, Samples)
-        if len(audio_data.shape) == 1:
-            audio_data = np.expand_dims(audio_data, axis=0) # (1, Samples)
-        else:
-            audio_data = audio_data.T # (Channels, Samples)
-            
-        # Demucs expects Stereo (2 channels). Mix/Duplicate if Mono.
-        if audio_data.shape[0] == 1:
-            audio_data = np.concatenate([audio_data, audio_data], axis=0)
-            
-        # Convert to Tensor
-        wav = torch.tensor(audio_data)
-        
-        # Resample if needed (Demucs htdemucs is 44100Hz)
-        if sr != model.samplerate:
-            print(f"[Demucs] Resampling {sr} -> {model.samplerate}Hz", file=sys.stderr)
-            resampler = T.Resample(sr, model.samplerate)
-            wav = resampler(wav)
-            
-        # Normalization (Standard Demucs procedure)
-        ref = wav.mean(0)
-        wav = (wav - ref.mean()) / ref.std()
+        sr, audio_data = load_audio(read_path)
         
         # Separate
         print(f"[Demucs] Separating...", file=sys.stderr)
-        # sources shape: (Sources, Channels, Samples)
-        sources = apply_model(model, wav[None], device="cpu", shifts=1, split=True, overlap=0.25, progress=True)[0]
-        
-        # De-normalize
-        sources = sources * ref.std() + ref.mean()
+        progress("separate", 0)
+        regions = None
+        if use_vad:
+            # Only run Demucs over active spans; silent gaps stay silent in every stem
+            from vad import detect_active_regions
+            vad_info = detect_active_regions(audio_data.T, sr)
+            regions = vad_info["regions"]
+            log(f"VAD skipped {vad_info['skippedSeconds']}s of {vad_info['duration']}s ({vad_info['skippedRatio']:.1%})")
+        sources = separate_array(model, audio_data, sr, regions=regions)
+        # The decoded input is not needed again: masking and the input peaks
+        # read the file memory-mapped
+        del audio_data
         
         print("[Demucs] Separation finished. Saving stems...", file=sys.stderr)
         
-        # Save Stems manually using scipy
+        # Save Stems in the requested encodings (streamed chunk by chunk)
         stem_names = model.sources # ['drums', 'bass', 'other', 'vocals'] for htdemucs
         
         # Create output structure matching standard Demucs
@@ -146,23 +339,42 @@ def separate_audio(input_path, output_dir, job_id, classification_path=None):
         sources_np = sources.numpy()
         
         for i, name in enumerate(stem_names):
+            checkpoint("write_stems", force=True)
             stem_audio = sources_np[i] # (Channels, Samples)
             stem_audio = stem_audio.T # (Samples, Channels)
             
-            out_file = os.path.join(separated_folder, f"{name}.wav")
-            wavfile.write(out_file, model.samplerate, stem_audio)
+            stem_files[name] = write_stem_formats(
+                os.path.join(separated_folder, name), stem_audio, model.samplerate,
+                stem_formats, "/separated_audio", output_dir, peaks=peaks
+            )
+            emit("stem", name=name, url=stem_files[name][stem_formats[0]]["url"], files=stem_files[name])
+            progress("write_stems", 100.0 * (i + 1) / len(stem_names))
             
         log(f"Demucs output saved to: {separated_folder}")
+        # Release the (sources, channels, samples) output before masking allocates its stems
+        del sources, sources_np, stem_audio
+
+        # Waveform peaks for the input so the viewer never has to decode it
+        peak_files = {}
+        if peaks:
+            from waveform_peaks import build_peaks
+            _, mapped_input = read_wav_mapped(read_path)
+            input_peaks = build_peaks(mapped_input, sr, os.path.join(separated_folder, "input.peaks"))
+            del mapped_input
+            peak_files["input"] = f"/separated_audio/htdemucs/{demucs_folder_name}/input.peaks"
+            log(f"Input peaks: {input_peaks['bytes']} bytes, levels {input_peaks['levels']}")
 
-        # Populate final_stems
+        # Populate final_stems (first requested format is the one the UI plays)
         final_stems = {}
-        if os.path.exists(os.path.join(separated_folder, "vocals.wav")):
-            final_stems["vocals"] = f"/separated_audio/htdemucs/{demucs_folder_name}/vocals.wav"
-        if os.path.exists(os.path.join(separated_folder, "other.wav")):
-            final_stems["background"] = f"/separated_audio/htdemucs/{demucs_folder_name}/other.wav"
+        if "vocals" in stem_files:
+            final_stems["vocals"] = stem_files["vocals"][stem_formats[0]]["url"]
+        if "other" in stem_files:
+            final_stems["background"] = stem_files["other"][stem_formats[0]]["url"]
+            stem_files["background"] = stem_files.pop("other")
 
 
         # 2. Forensic Event Masking (if classification provided)
+        checkpoint("mask", force=True)
         if classification_path and os.path.exists(classification_path):
             try:
                 log("Starting forensic masking...")
@@ -173,65 +385,32 @@ def separate_audio(input_path, output_dir, job_id, classification_path=None):
                 if "status" in classification_data and classification_data["status"] == "error":
                      log(f"Classification ERROR: {classification_data.get('message', 'No message')}")
 
-                # Load original Audio (already converted/validated)
-                sr, audio_data = wavfile.read(read_path)
+                # Original Audio (already converted/validated), memory-mapped:
+                # only the event spans are ever paged in
+                sr, audio_data = read_wav_mapped(read_path)
                 log(f"Loaded audio. Sample rate: {sr}, Shape: {audio_data.shape}")
                 
-                # Prepare empty containers (silence)
-                stems_to_generate = {
-                    "vocals": "Human Voice",
-                    "background": "Musical Content",
-                    "vehicles": "Vehicle Sound",
-                    "footsteps": "Footsteps",
-                    "animals": "Animal Signal",
-                    "wind": "Atmospheric Wind",
-                    "gunshots": "Gunshot / Explosion",
-                    "screams": "Scream / Aggression",
-                    "sirens": "Siren / Alarm",
-                    "impact": "Impact / Breach"
-                }
-                
                 # Check what we already have from Demucs
                 has_demucs_vocals = "vocals" in final_stems
                 has_demucs_background = "background" in final_stems
                 
-                if len(audio_data.shape) > 1:
-                     generated_audio = { key: np.zeros_like(audio_data) for key in stems_to_generate }
-                else:
-                     generated_audio = { key: np.zeros_like(audio_data) for key in stems_to_generate }
+                # Skip forensic generation if Demucs already provided it (higher quality)
+                skip = set()
+                if has_demucs_vocals:
+                    skip.add("vocals")
+                if has_demucs_background:
+                    skip.add("background")
 
                 # Iterate events and fill segments
                 events = classification_data.get("soundEvents", [])
                 log(f"Found {len(events)} sound events.")
                 
-                CLIP_DURATION = 0.975
-                
-                count_generated = 0
-                for event in events:
-                    etype = event.get("type", "")
-                    target_stem = None
-                    for stem_key, trigger_word in stems_to_generate.items():
-                        if trigger_word.lower() == etype.lower():
-                            target_stem = stem_key
-                            break
-                    
-                    if target_stem:
-                        # Skip forensic generation if Demucs already provided it (higher quality)
-                        if target_stem == "vocals" and has_demucs_vocals:
-                            continue
-                        if target_stem == "background" and has_demucs_background:
-                            continue
-
-                        start_time = float(event.get("time", 0))
-                        end_time = start_time + CLIP_DURATION
-                        start_idx = int(start_time * sr)
-                        end_idx = int(end_time * sr)
-                        start_idx = max(0, start_idx)
-                        end_idx = min(len(audio_data), end_idx)
-                        
-                        if start_idx < end_idx:
-                            generated_audio[target_stem][start_idx:end_idx] = audio_data[start_idx:end_idx]
-                            count_generated += 1
+                # Per-frame events span one classifier frame (finer with --hop)
+                clip_duration = float(classification_data.get("frameDuration", 0.975))
+                spans = event_spans(
+                    events, sr, len(audio_data), FORENSIC_STEMS, skip=skip, clip_duration=clip_duration
+                )
+                count_generated = sum(len(stem_spans) for stem_spans in spans.values())
 
                 log(f"Processed {count_generated} event segments matches.")
 
@@ -239,14 +418,18 @@ def separate_audio(input_path, output_dir, job_id, classification_path=None):
                 gen_dir = os.path.join(output_dir, "generated", job_id)
                 os.makedirs(gen_dir, exist_ok=True)
                 
-                for stem_key, audio_arr in generated_audio.items():
-                    peak = np.max(np.abs(audio_arr))
+                for stem_key, audio_arr, peak in masked_stems(audio_data, spans):
                     log(f"Stem {stem_key} peak amplitude: {peak}")
                     
                     if peak > 0:
-                        out_file = os.path.join(gen_dir, f"{stem_key}.wav")
-                        wavfile.write(out_file, sr, audio_arr)
-                        final_stems[stem_key] = f"/separated_audio/generated/{job_id}/{stem_key}.wav"
+                        stem_files[stem_key] = write_stem_formats(
+                            os.path.join(gen_dir, stem_key), audio_arr, sr,
+                            stem_formats, "/separated_audio", output_dir, peaks=peaks
+                        )
+                        final_stems[stem_key] = stem_files[stem_key][stem_formats[0]]["url"]
+                        emit("stem", name=stem_key, url=final_stems[stem_key], files=stem_files[stem_key])
+                    # Release this stem before the next one is built
+                    del audio_arr
             
             except Exception as e:
                 log(f"Masking Exception: {str(e)}")
@@ -255,7 +438,25 @@ def separate_audio(input_path, output_dir, job_id, classification_path=None):
              log("No stems were generated.")
              return {"status": "error", "message": "Separation failed, no stems found.", "debug": debug_log}
 
-        return {"status": "success", "stems": final_stems, "debug": debug_log}
+        result = {
+            "status": "success",
+            "stems": final_stems,
+            "stemFiles": stem_files,
+            "peaks": dict(peak_files, **{
+                stem: files["peaks"]["url"] for stem, files in stem_files.items() if "peaks" in files
+            }),
+            "outputBytes": {
+                fmt: sum(files[fmt]["bytes"] for files in stem_files.values() if fmt in files)
+                for fmt in stem_formats
+            },
+            "debug": debug_log
+        }
+        if vad_info is not None:
+            result["vad"] = vad_info
+        return result
+    except JobCancelled as e:
+        log(str(e))
+        return {"status": "cancelled", "message": str(e), "stemFiles": stem_files, "debug": debug_log}
     except Exception as e:
         return {"status": "error", "message": str(e), "debug": debug_log}
     finally:
@@ -267,11 +468,25 @@ def separate_audio(input_path, output_dir, job_id, classification_path=None):
 
 if __name__ == "__main__":
     # Ensure no other prints exist in this file!
-    if len(sys.argv) > 3:
+    # Positional: <input> <output_dir> <job_id> [classification_path]
+    # Flags: --vad, --formats=master,pcm16,flac,preview, --no-peaks,
+    #        --quantized (dynamic int8 Demucs, cached under FORENSIC_MODEL_CACHE),
+    #        --ndjson (stream progress/stems as JSON lines, then a final "result" line)
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    options = dict(a[2:].partition("=")[::2] for a in sys.argv[1:] if a.startswith("--"))
+    import progress
+    if "ndjson" in options:
+        progress.enable()
+    if len(args) > 2:
         # Check for optional 4th arg
-        cls_path = sys.argv[4] if len(sys.argv) > 4 else None
-        result = separate_audio(sys.argv[1], sys.argv[2], sys.argv[3], cls_path)
-        sys.stdout.write(json.dumps(result))
+        cls_path = args[3] if len(args) > 3 else None
+        result = separate_audio(
+            args[0], args[1], args[2], cls_path,
+            use_vad="vad" in options,
+            stem_formats=options.get("formats") or None,
+            peaks="no-peaks" not in options,
+            quantized="quantized" in options,
+        )
+        progress.write_result(result)
     else:
-        sys.stdout.write(json.dumps({"status": "error", "message": "Insufficient arguments"}))
-    sys.stdout.flush()
\ No newline at end of file
+        progress.write_result({"status": "error", "message": "Insufficient arguments"})
\ No newline at end of file
@@ -0,0 +1,251 @@
+import sys
+import os
+import json
+import time
+import re
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# ================================
+# Batch Processing for Evidence Directories
+# ================================
+# Running the classifier and separator per file means two cold process spawns
+# (and two model loads) per recording. This walks a directory and hands the
+# files to a pool of long-lived workers: each worker loads its models once,
+# converts a non-WAV file to WAV once (ffmpeg), then classifies and separates
+# that WAV. The steps still read it separately -- the classifier once, the
+# separator for its input, stems and masking -- but the reads are of a local
+# PCM file rather than repeated ffmpeg decodes. Finished files are
+# appended to a manifest (JSON lines) in the output directory, so an
+# interrupted run picks up where it stopped. Progress and throughput go to
+# stderr; the final summary is printed as JSON on stdout.
+
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".flac", ".m4a", ".aac", ".ogg", ".opus", ".wma", ".aiff", ".aif"}
+MANIFEST_NAME = "batch_manifest.jsonl"
+DEFAULT_WORKERS = 2
+STEPS = ("decode", "classify", "separate")   # decode always runs
+DEFAULT_STEPS = ["classify", "separate"]
+
+
+def find_audio_files(input_dir):
+    """All audio files below input_dir, in a stable order."""
+    found = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+                found.append(os.path.join(root, name))
+    return found
+
+
+def job_id_for(path, input_dir):
+    """Stable, filesystem-safe job id derived from the path inside input_dir."""
+    rel = os.path.splitext(os.path.relpath(path, input_dir))[0]
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", rel).strip("_") or "job"
+
+
+def load_manifest(manifest_path):
+    """Latest manifest entry per input path."""
+    entries = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A run killed mid-write leaves a partial last line
+                    continue
+                entries[entry["path"]] = entry
+    return entries
+
+
+def is_done(entry, path):
+    """A file is done if it succeeded and has not changed since."""
+    if not entry or entry.get("status") != "success":
+        return False
+    stat = os.stat(path)
+    return entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime
+
+
+def _warm_worker(steps, threads):
+    """Pool initializer: load the models once per worker process."""
+    sys.stdout = sys.stderr  # Keep model chatter off the summary stream
+    from thread_budget import apply_thread_budget
+    apply_thread_budget(threads)
+    if "separate" in steps:
+        try:
+            import torch
+            apply_thread_budget(threads, torch_module=torch)
+            from audio_separator import load_demucs_model
+            load_demucs_model("htdemucs")
+        except Exception as e:
+            print(f"[Batch] Demucs warm-up failed: {e}", file=sys.stderr)
+    if "classify" in steps:
+        try:
+            from mediapipe_audio_classifier import get_classifier
+            get_classifier()
+        except Exception as e:
+            print(f"[Batch] Classifier warm-up failed: {e}", file=sys.stderr)
+
+
+def process_file(path, job_id, output_dir, steps, options):
+    """Convert to WAV once, then run the requested steps on it. Runs inside a worker."""
+    from audio_separator import convert_to_wav_if_needed, read_wav_mapped
+
+    started = time.perf_counter()
+    job_dir = os.path.join(output_dir, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    log = []
+    read_path, is_temp = convert_to_wav_if_needed(path, log.append)
+    result = {"path": path, "jobID": job_id, "status": "success"}
+    try:
+        # Length only: mapped where the format allows, so no samples are read here
+        sample_rate, audio = read_wav_mapped(read_path)
+        result["audioSeconds"] = round(len(audio) / float(sample_rate), 2)
+        del audio
+
+        classification_path = None
+        if "classify" in steps:
+            from mediapipe_audio_classifier import classify_audio
+            classification = classify_audio(
+                read_path, job_id,
+                use_vad=options.get("vad", False),
+                hop=options.get("hop"),
+            )
+            classification_path = os.path.join(job_dir, "classification.json")
+            with open(classification_path, "w") as f:
+                json.dump(classification, f)
+            result["classification"] = classification_path
+            if classification.get("status") != "success":
+                raise RuntimeError(classification.get("message", "classification failed"))
+
+        if "separate" in steps:
+            from audio_separator import separate_audio
+            separation = separate_audio(
+                read_path, job_dir, job_id, classification_path,
+                use_vad=options.get("vad", False),
+                stem_formats=options.get("formats"),
+            )
+            separation_path = os.path.join(job_dir, "separation.json")
+            with open(separation_path, "w") as f:
+                json.dump(separation, f)
+            result["separation"] = separation_path
+            if separation.get("status") != "success":
+                raise RuntimeError(separation.get("message", "separation failed"))
+    except Exception as e:
+        result["status"] = "error"
+        result["message"] = str(e)
+    finally:
+        if is_temp and os.path.exists(read_path):
+            os.unlink(read_path)
+    result["elapsed"] = round(time.perf_counter() - started, 2)
+    return result
+
+
+def format_throughput(done, audio_seconds, elapsed):
+    hours = max(elapsed, 1e-9) / 3600.0
+    return {
+        "filesPerHour": round(done / hours, 1),
+        "audioHoursPerHour": round(audio_seconds / 3600.0 / hours, 2),
+    }
+
+
+def run_batch(input_dir, output_dir, workers=DEFAULT_WORKERS, steps=None, options=None, retry_failed=True):
+    steps = steps or list(DEFAULT_STEPS)
+    unknown = [s for s in steps if s not in STEPS]
+    if unknown:
+        raise ValueError(f"Unknown step(s): {', '.join(unknown)}")
+    options = options or {}
+    input_dir = os.path.abspath(input_dir)
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    files = find_audio_files(input_dir)
+    pending = [
+        p for p in files
+        if not is_done(manifest.get(p), p)
+        and (retry_failed or manifest.get(p, {}).get("status") != "error")
+    ]
+    print(f"[Batch] {len(files)} files, {len(files) - len(pending)} already done, {len(pending)} to process", file=sys.stderr)
+
+    threads = max(1, (os.cpu_count() or 1) // max(1, workers))
+    started = time.perf_counter()
+    done = failed = 0
+    audio_seconds = 0.0
+
+    # Spawned workers: forking a process that may already hold torch threads is unsafe
+    context = multiprocessing.get_context("spawn")
+    with open(manifest_path, "a") as manifest_file, ProcessPoolExecutor(
+        max_workers=workers, mp_context=context,
+        initializer=_warm_worker, initargs=(steps, threads),
+    ) as pool:
+        futures = {
+            pool.submit(process_file, p, job_id_for(p, input_dir), output_dir, steps, options): p
+            for p in pending
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                entry = {"path": path, "status": "error", "message": str(e)}
+            stat = os.stat(path)
+            entry.update({"size": stat.st_size, "mtime": stat.st_mtime, "finishedAt": time.time()})
+            manifest_file.write(json.dumps(entry) + "\n")
+            manifest_file.flush()
+
+            if entry["status"] == "success":
+                done += 1
+                audio_seconds += entry.get("audioSeconds", 0.0)
+            else:
+                failed += 1
+            rate = format_throughput(done, audio_seconds, time.perf_counter() - started)
+            print(
+                f"[Batch] {done + failed}/{len(pending)} {os.path.basename(path)}: {entry['status']} | "
+                f"{rate['filesPerHour']} files/h, {rate['audioHoursPerHour']} audio-h/h",
+                file=sys.stderr,
+            )
+
+    elapsed = time.perf_counter() - started
+    return {
+        "status": "success",
+        "manifest": manifest_path,
+        "total": len(files),
+        "skipped": len(files) - len(pending),
+        "processed": done,
+        "failed": failed,
+        "audioHours": round(audio_seconds / 3600.0, 3),
+        "elapsed": round(elapsed, 1),
+        **format_throughput(done, audio_seconds, elapsed),
+    }
+
+
+if __name__ == "__main__":
+    # Usage: batch_process.py <input_dir> <output_dir> [--workers=N] [--steps=classify,separate]
+    #                         [--vad] [--hop=SECONDS] [--formats=master,pcm16] [--skip-failed]
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    options = dict(a[2:].partition("=")[::2] for a in sys.argv[1:] if a.startswith("--"))
+    if len(args) > 1:
+        try:
+            output = run_batch(
+                args[0].strip('"'), args[1].strip('"'),
+                workers=int(options.get("workers") or DEFAULT_WORKERS),
+                steps=[s.strip() for s in options["steps"].split(",")] if options.get("steps") else None,
+                options={
+                    "vad": "vad" in options,
+                    "hop": float(options["hop"]) if options.get("hop") else None,
+                    "formats": options.get("formats") or None,
+                },
+                retry_failed="skip-failed" not in options,
+            )
+        except Exception as e:
+            output = {"status": "error", "message": str(e)}
+    else:
+        output = {"status": "error", "message": "Usage: batch_process.py <input_dir> <output_dir>"}
+    sys.stdout.write(json.dumps(output))
+    sys.stdout.flush()
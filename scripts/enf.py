@@ -0,0 +1,277 @@
+import sys
+import os
+import json
+import time
+import warnings
+import numpy as np
+
+from audio_io import iter_float_blocks, to_mono_float
+
+# ================================
+# Electrical Network Frequency (ENF) Extraction
+# ================================
+# Recordings made near mains wiring pick up a faint 50/60 Hz hum whose exact
+# frequency wanders with grid load. A continuous recording shows a smooth
+# trace; a cut, insertion or re-recording shows up as a jump in frequency or a
+# sudden loss of the hum.
+#
+# The file is streamed block by block from a memory-mapped WAV (memory does not
+# grow with duration):
+#
+#   1. low-pass (stateful SOS filter) and decimate to about 1 kHz
+#   2. frame the decimated signal (FRAME_SEC frames every HOP_SEC)
+#   3. zoom DFT around each mains harmonic: the frames times a small basis of
+#      complex exponentials on a 0.01 Hz grid, i.e. a bank of Goertzel filters
+#      evaluated as one matrix product
+#   4. peak with parabolic refinement per harmonic, combined by SNR weight
+#
+# The SNR compares the peak of the search band with the peaks of two equally
+# wide bands beside it, i.e. a max-of-K statistic against the same statistic
+# of noise, so pure noise sits near 0 dB whatever the grid density. The hum
+# counts as present only after MIN_RUN frames agree, and a frequency step is
+# only scored where both windows around it are mostly valid.
+#
+# Output: the trace (Hz per HOP_SEC) and flagged discontinuities.
+
+TARGET_RATE = 1000.0
+BLOCK_SECONDS = 60
+FRAME_SEC = 4.0
+HOP_SEC = 1.0
+HARMONICS = (1, 2, 3)
+SEARCH_HZ = 0.5
+GRID_HZ = 0.01
+# Noise reference: two bands as wide as the search band, NOISE_CENTRE_HZ either
+# side of the harmonic (per unit harmonic), on a grid still finer than the main lobe
+NOISE_CENTRE_HZ = 2.0
+NOISE_GRID_HZ = 0.05
+_NOISE_BAND = np.arange(-SEARCH_HZ, SEARCH_HZ + NOISE_GRID_HZ / 2, NOISE_GRID_HZ)
+NOISE_OFFSETS = np.concatenate([-NOISE_CENTRE_HZ + _NOISE_BAND, NOISE_CENTRE_HZ + _NOISE_BAND])
+# Peak over the side-band peaks: pure noise exceeds this in about 0.1% of frames per harmonic
+MIN_SNR_DB = 9.0
+# Presence changes only after this many consecutive frames agree
+MIN_RUN = 3
+# Share of valid frames each step window needs before a jump is scored
+MIN_WINDOW_COVERAGE = 0.6
+JUMP_K = 6.0
+STEP_WINDOW = 10
+MIN_JUMP_HZ = 0.005
+
+
+def decimated_blocks(audio, sr, target_rate=TARGET_RATE, block_seconds=BLOCK_SECONDS):
+    """
+    Yields chunks of low-passed mono audio decimated to sr // (sr // target_rate). The filter state
+    carries across blocks, so the concatenated chunks equal one long filter pass.
+    """
+    from scipy.signal import butter, sosfilt, sosfilt_zi
+    factor = max(1, int(sr // target_rate))
+    sos = butter(8, 0.4 * sr / factor, fs=sr, output="sos")
+    state = None
+    block = max(factor, int(block_seconds * sr) // factor * factor)
+    for _, chunk in iter_float_blocks(audio, block, mono=True):
+        chunk = chunk.astype(np.float64)
+        if state is None:
+            state = sosfilt_zi(sos) * (chunk[0] if len(chunk) else 0.0)
+        filtered, state = sosfilt(sos, chunk, zi=state)
+        yield filtered[::factor]
+
+
+def frames_from_blocks(blocks, frame, hop):
+    """Fixed-length frames every `hop` samples over a stream of chunks, keeping only the overlap."""
+    carry = np.zeros(0)
+    for chunk in blocks:
+        carry = np.concatenate([carry, chunk])
+        if len(carry) >= frame:
+            n = 1 + (len(carry) - frame) // hop
+            yield np.lib.stride_tricks.sliding_window_view(carry, frame)[:n * hop:hop]
+            carry = carry[n * hop:]
+
+
+def zoom_basis(nominal, rate, frame, harmonics=HARMONICS, search=SEARCH_HZ, grid=GRID_HZ):
+    """
+    Windowed complex exponentials around each harmonic: K search bins on a fine
+    grid followed by the noise reference bins. Shape (frame, harmonics * (K + noise)).
+    """
+    offsets = np.arange(-search, search + grid / 2, grid)
+    freqs = np.concatenate([h * nominal + h * np.concatenate([offsets, NOISE_OFFSETS]) for h in harmonics])
+    t = np.arange(frame) / rate
+    return np.hanning(frame)[:, None] * np.exp(-2j * np.pi * t[:, None] * freqs[None, :]), offsets
+
+
+def estimate_frames(frames, basis, offsets, n_harmonics):
+    """
+    Per frame: frequency deviation from nominal (Hz, referred to the
+    fundamental) and SNR in dB, combined over harmonics by SNR weight.
+    """
+    k = len(offsets)
+    power = np.abs(frames @ basis).reshape(len(frames), n_harmonics, -1) ** 2
+    power, noise = power[..., :k], power[..., k:]
+    best = power.argmax(axis=2)
+    idx = np.clip(best, 1, k - 2)
+    take = lambda d: np.take_along_axis(power, (idx + d)[..., None], axis=2)[..., 0]
+    left, centre, right = np.log(take(-1) + 1e-20), np.log(take(0) + 1e-20), np.log(take(1) + 1e-20)
+    denom = left - 2 * centre + right
+    shift = np.where(np.abs(denom) > 1e-12, 0.5 * (left - right) / denom, 0.0)
+    deviation = offsets[idx] + np.clip(shift, -1, 1) * (offsets[1] - offsets[0])
+
+    peak = power.max(axis=2)
+    half = noise.shape[2] // 2
+    reference = 0.5 * (noise[..., :half].max(axis=2) + noise[..., half:].max(axis=2))
+    snr_db = 10 * np.log10(peak / (reference + 1e-20) + 1e-20)
+    weight = np.maximum(snr_db - MIN_SNR_DB, 0.0)
+    total = weight.sum(axis=1)
+    combined = np.where(total > 0, (deviation * weight).sum(axis=1) / np.maximum(total, 1e-12), np.nan)
+    return combined, snr_db.max(axis=1)
+
+
+def detect_mains(audio, sr, seconds=60):
+    """50 or 60 Hz, whichever carries more energy (with harmonics) in the first `seconds`."""
+    head = to_mono_float(audio[:int(seconds * sr)]).astype(np.float64)
+    if not len(head):
+        return 50.0
+    spectrum = np.abs(np.fft.rfft(head * np.hanning(len(head)))) ** 2
+    freqs = np.fft.rfftfreq(len(head), 1.0 / sr)
+
+    def band(f):
+        return spectrum[(freqs > f - 0.5) & (freqs < f + 0.5)].sum()
+    return 50.0 if sum(band(50.0 * h) for h in HARMONICS) >= sum(band(60.0 * h) for h in HARMONICS) else 60.0
+
+
+def stable_presence(detected, min_run=MIN_RUN):
+    """
+    Per-frame hum presence from the raw detections: detections shorter than
+    `min_run` frames are dropped, then dropouts shorter than `min_run` inside
+    the hum are bridged.
+    """
+    present = np.asarray(detected, dtype=bool).copy()
+    for value in (True, False):
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], (present == value).astype(np.int8), [0]])))
+        for run_start, run_end in zip(edges[::2], edges[1::2]):
+            interior = run_start > 0 and run_end < len(present)
+            if run_end - run_start < min_run and (value or interior):
+                present[run_start:run_end] = not value
+    return present
+
+
+def find_discontinuities(trace, snr_db, hop_sec=HOP_SEC, k=JUMP_K, window=STEP_WINDOW, start=FRAME_SEC / 2,
+                         present=None):
+    """
+    Flags steps in the trace: the median of the `window` frames after each
+    point against the median of the `window` frames before, in units of the
+    standard error of that difference (frame noise from the MAD of first
+    differences). Points whose windows are not at least MIN_WINDOW_COVERAGE
+    valid are not scored. Also flags points where the hum appears or
+    disappears according to `present` (default: the valid frames).
+    Frame i is reported at start + i * hop_sec (its centre).
+    """
+    from scipy.signal import find_peaks
+    flags = []
+    valid = ~np.isnan(trace)
+    present = valid if present is None else np.asarray(present, dtype=bool)
+    steps = np.diff(trace)
+    usable = valid[1:] & valid[:-1]
+    if usable.sum() > 2 * window:
+        sigma = 1.4826 * np.median(np.abs(steps[usable] - np.median(steps[usable]))) / np.sqrt(2)
+        padded = np.pad(trace, window, constant_values=np.nan)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            medians = np.nanmedian(np.lib.stride_tricks.sliding_window_view(padded, window), axis=1)
+        before, after = medians[:len(trace)], medians[window:window + len(trace)]
+        counts = np.lib.stride_tricks.sliding_window_view(np.pad(valid, window).astype(np.int32), window).sum(axis=1)
+        covered = np.minimum(counts[:len(trace)], counts[window:window + len(trace)]) >= MIN_WINDOW_COVERAGE * window
+        delta = np.where(covered, np.nan_to_num(after - before), 0.0)
+        stderr = max(1.2533 * sigma * np.sqrt(2.0 / window), MIN_JUMP_HZ / k)
+        score = np.abs(delta) / stderr
+        peaks, _ = find_peaks(score, height=k, distance=window)
+        for i in peaks:
+            flags.append({
+                "time": round(float(start + i * hop_sec), 2),
+                "kind": "frequency_jump",
+                "deltaHz": round(float(delta[i]), 4),
+                "score": round(float(score[i]), 2),
+            })
+    for i in np.flatnonzero(present[1:] != present[:-1]):
+        flags.append({
+            "time": round(float(start + (i + 1) * hop_sec), 2),
+            "kind": "hum_lost" if present[i] else "hum_found",
+            "snrDb": round(float(snr_db[i + 1]), 1),
+        })
+    return sorted(flags, key=lambda f: f["time"])
+
+
+def extract_enf(audio, sr, nominal=None, frame_sec=FRAME_SEC, hop_sec=HOP_SEC):
+    """Streams the ENF trace out of a (memory-mapped) array. Returns a result dict."""
+    from progress import progress
+    nominal = nominal or detect_mains(audio, sr)
+    factor = max(1, int(sr // TARGET_RATE))
+    rate = sr / float(factor)
+    frame = int(round(frame_sec * rate))
+    hop = int(round(hop_sec * rate))
+    hop_sec = hop / rate
+    basis, offsets = zoom_basis(nominal, rate, frame)
+
+    traces, snrs = [], []
+    done = 0
+    for frames in frames_from_blocks(decimated_blocks(audio, sr), frame, hop):
+        deviation, snr_db = estimate_frames(frames, basis, offsets, len(HARMONICS))
+        traces.append(deviation)
+        snrs.append(snr_db)
+        done += len(frames)
+        progress("enf", 100.0 * min(1.0, done * hop_sec * sr / max(1, len(audio))))
+
+    deviation = np.concatenate(traces) if traces else np.zeros(0)
+    snr_db = np.concatenate(snrs) if snrs else np.zeros(0)
+    present = stable_presence(~np.isnan(deviation))
+    deviation[~present] = np.nan
+    trace = nominal + deviation
+    return {
+        "nominalHz": nominal,
+        "hopSec": round(hop_sec, 6),
+        "traceStart": frame_sec / 2,
+        "frameSec": frame_sec,
+        "frames": int(len(trace)),
+        "coverage": round(float(np.mean(~np.isnan(trace))), 4) if len(trace) else 0.0,
+        "meanHz": round(float(np.nanmean(trace)), 4) if np.any(~np.isnan(trace)) else None,
+        "trace": [None if np.isnan(v) else round(float(v), 4) for v in trace],
+        "snrDb": [round(float(v), 1) for v in snr_db],
+        "discontinuities": find_discontinuities(trace, snr_db, hop_sec, start=frame_sec / 2, present=present),
+    }
+
+
+def analyze_file(audio_path, nominal=None):
+    started = time.perf_counter()
+    converted_path = None
+    try:
+        from scipy.io import wavfile
+        audio_path = audio_path.strip('"')
+        try:
+            sr, audio = wavfile.read(audio_path, mmap=True)
+        except Exception:
+            from mediapipe_audio_classifier import convert_to_wav
+            converted_path = convert_to_wav(audio_path)
+            sr, audio = wavfile.read(converted_path, mmap=True)
+
+        output = {"status": "success", "duration": round(len(audio) / float(sr), 2)}
+        output.update(extract_enf(audio, sr, nominal))
+        elapsed = time.perf_counter() - started
+        output["elapsedSec"] = round(elapsed, 2)
+        output["realtimeFactor"] = round(len(audio) / float(sr) / elapsed, 1) if elapsed > 0 else None
+        return output
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+    finally:
+        if converted_path and converted_path != audio_path and os.path.exists(converted_path):
+            os.unlink(converted_path)
+
+
+if __name__ == "__main__":
+    # Usage: enf.py <audio> [--mains=50|60] [--ndjson]
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    options = dict(a[2:].partition("=")[::2] for a in sys.argv[1:] if a.startswith("--"))
+    import progress
+    if "ndjson" in options:
+        progress.enable()
+    if args:
+        output = analyze_file(args[0], nominal=float(options["mains"]) if options.get("mains") else None)
+    else:
+        output = {"status": "error", "message": "No input"}
+    progress.write_result(output)
@@ -0,0 +1,282 @@
+import sys
+import os
+import json
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+# ================================
+# Local Event Store (SQLite)
+# ================================
+# Supabase keeps `sound_events` as one JSONB blob per analysis, which cannot
+# answer "all gunshots across cases between 10:00 and 10:05" without loading
+# every row. This store keeps one row per event with indexes on (type, time)
+# and (analysis, time), works offline, and is fed directly from the
+# classifier's `soundEvents` output.
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB_PATH = os.environ.get(
+    "FORENSIC_EVENT_DB", os.path.join(PROJECT_DIR, "data", "forensic_events.sqlite3")
+)
+
+# Length of a YAMNet frame; used as event length when the event has no "end".
+DEFAULT_EVENT_DURATION = 0.975
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    analysis_key TEXT NOT NULL UNIQUE,
+    filename TEXT,
+    case_id TEXT,
+    recorded_at REAL,
+    duration REAL,
+    max_event_duration REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    analysis_id INTEGER NOT NULL REFERENCES analyses(id) ON DELETE CASCADE,
+    type TEXT NOT NULL,
+    time REAL NOT NULL,
+    end_time REAL NOT NULL,
+    wall_time REAL,
+    confidence REAL,
+    decibels REAL,
+    extra TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_events_type_time ON events(type, time);
+CREATE INDEX IF NOT EXISTS idx_events_type_wall_time ON events(type, wall_time);
+CREATE INDEX IF NOT EXISTS idx_events_analysis_time ON events(analysis_id, time);
+CREATE INDEX IF NOT EXISTS idx_analyses_case_id ON analyses(case_id);
+"""
+
+CORE_EVENT_KEYS = {"time", "start", "end", "type", "confidence", "decibels"}
+
+
+def connect(db_path=None):
+    db_path = db_path or DEFAULT_DB_PATH
+    if db_path != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def parse_timestamp(value):
+    """Accepts epoch seconds or an ISO-8601 string and returns epoch seconds."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def insert_analysis(conn, classification, analysis_key=None, filename=None,
+                    case_id=None, recorded_at=None, duration=None):
+    """
+    Bulk-inserts the `soundEvents` of one classifier result in a single
+    transaction. Re-inserting the same analysis_key replaces its events.
+    Returns the number of events stored.
+    """
+    analysis_key = analysis_key or classification.get("jobID")
+    if not analysis_key:
+        raise ValueError("analysis_key is required when the result has no jobID")
+    recorded_at = parse_timestamp(recorded_at)
+    events = classification.get("soundEvents", [])
+
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO analyses (analysis_key, filename, case_id, recorded_at, duration, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(analysis_key) DO UPDATE SET
+                filename = excluded.filename,
+                case_id = excluded.case_id,
+                recorded_at = excluded.recorded_at,
+                duration = excluded.duration
+            """,
+            (analysis_key, filename, case_id, recorded_at, duration, time.time()),
+        )
+        analysis_id = conn.execute(
+            "SELECT id FROM analyses WHERE analysis_key = ?", (analysis_key,)
+        ).fetchone()[0]
+        conn.execute("DELETE FROM events WHERE analysis_id = ?", (analysis_id,))
+
+        rows = []
+        for event in events:
+            start = float(event.get("start", event.get("time", 0)))
+            end = float(event.get("end", start + DEFAULT_EVENT_DURATION))
+            extra = {k: v for k, v in event.items() if k not in CORE_EVENT_KEYS}
+            rows.append((
+                analysis_id,
+                event.get("type", "Unknown"),
+                start,
+                end,
+                recorded_at + start if recorded_at is not None else None,
+                event.get("confidence"),
+                event.get("decibels"),
+                json.dumps(extra) if extra else None,
+            ))
+        max_duration = max((r[3] - r[2] for r in rows), default=0.0)
+        conn.execute(
+            "UPDATE analyses SET max_event_duration = ? WHERE id = ?", (max_duration, analysis_id)
+        )
+        conn.executemany(
+            """
+            INSERT INTO events (analysis_id, type, time, end_time, wall_time, confidence, decibels, extra)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+    return len(rows)
+
+
+def query_events(conn, types=None, start=None, end=None, wall_clock=False,
+                 case_id=None, analysis_key=None, min_confidence=None, limit=None):
+    """
+    Returns events overlapping [start, end].
+    With wall_clock, start/end are absolute timestamps (epoch or ISO) compared
+    against each recording's start time; otherwise they are seconds into the
+    recording.
+    """
+    time_col = "e.wall_time" if wall_clock else "e.time"
+    clauses = []
+    params = []
+
+    if types:
+        types = [types] if isinstance(types, str) else list(types)
+        clauses.append(f"e.type IN ({','.join('?' * len(types))})")
+        params.extend(types)
+    if start is not None:
+        start = parse_timestamp(start) if wall_clock else float(start)
+        # Bound the indexed column by the longest stored event so the
+        # (type, time) index range-scans instead of filtering every row.
+        longest = conn.execute("SELECT COALESCE(MAX(max_event_duration), 0) FROM analyses").fetchone()[0]
+        clauses.append(f"{time_col} >= ?")
+        params.append(start - longest)
+        clauses.append(f"{time_col} + (e.end_time - e.time) >= ?")
+        params.append(start)
+    if end is not None:
+        end = parse_timestamp(end) if wall_clock else float(end)
+        clauses.append(f"{time_col} <= ?")
+        params.append(end)
+    if case_id is not None:
+        clauses.append("a.case_id = ?")
+        params.append(case_id)
+    if analysis_key is not None:
+        clauses.append("a.analysis_key = ?")
+        params.append(analysis_key)
+    if min_confidence is not None:
+        clauses.append("e.confidence >= ?")
+        params.append(float(min_confidence))
+
+    sql = f"""
+        SELECT a.analysis_key, a.filename, a.case_id, e.type, e.time, e.end_time,
+               e.wall_time, e.confidence, e.decibels, e.extra
+        FROM events e JOIN analyses a ON a.id = e.analysis_id
+        {"WHERE " + " AND ".join(clauses) if clauses else ""}
+        ORDER BY {time_col}
+    """
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+
+    results = []
+    for row in conn.execute(sql, params):
+        item = {
+            "analysisKey": row["analysis_key"],
+            "filename": row["filename"],
+            "caseId": row["case_id"],
+            "type": row["type"],
+            "time": round(row["time"], 3),
+            "end": round(row["end_time"], 3),
+            "wallTime": row["wall_time"],
+            "confidence": row["confidence"],
+            "decibels": row["decibels"],
+        }
+        if row["extra"]:
+            item.update(json.loads(row["extra"]))
+        results.append(item)
+    return results
+
+
+def _parse_options(argv):
+    options = {}
+    positional = []
+    for arg in argv:
+        if arg.startswith("--"):
+            key, _, value = arg[2:].partition("=")
+            options.setdefault(key, []).append(value)
+        else:
+            positional.append(arg)
+    return positional, options
+
+
+if __name__ == "__main__":
+    # Usage:
+    #   event_store.py ingest <classification.json> [--key=JOB] [--case=ID] [--recorded-at=ISO] [--db=PATH]
+    #   event_store.py query [--type=T ...] [--from=X] [--to=Y] [--wall-clock] [--case=ID] [--key=JOB]
+    #                        [--min-confidence=C] [--limit=N] [--db=PATH]
+    positional, options = _parse_options(sys.argv[1:])
+    first = lambda key: options[key][-1] if key in options else None
+
+    try:
+        if not positional:
+            raise ValueError("Expected a command: ingest or query")
+        conn = connect(first("db"))
+        command = positional[0]
+
+        if command == "ingest":
+            if len(positional) < 2:
+                raise ValueError("ingest requires at least one classification JSON path")
+            total = 0
+            for path in positional[1:]:
+                with open(path.strip('"'), "r") as f:
+                    classification = json.load(f)
+                total += insert_analysis(
+                    conn, classification,
+                    analysis_key=first("key") if len(positional) == 2 else None,
+                    filename=os.path.basename(path),
+                    case_id=first("case"),
+                    recorded_at=first("recorded-at"),
+                )
+            output = {"status": "success", "eventsStored": total}
+        elif command == "query":
+            started = time.perf_counter()
+            events = query_events(
+                conn,
+                types=options.get("type"),
+                start=first("from"),
+                end=first("to"),
+                wall_clock="wall-clock" in options,
+                case_id=first("case"),
+                analysis_key=first("key"),
+                min_confidence=first("min-confidence"),
+                limit=first("limit"),
+            )
+            output = {
+                "status": "success",
+                "count": len(events),
+                "queryMs": round((time.perf_counter() - started) * 1000, 2),
+                "events": events,
+            }
+        else:
+            raise ValueError(f"Unknown command: {command}")
+    except Exception as e:
+        output = {"status": "error", "message": str(e)}
+
+    sys.stdout.write(json.dumps(output))
+    sys.stdout.flush()
@@ -0,0 +1,303 @@
+import sys
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+
+# ================================
+# Per-File Feature Store
+# ================================
+# analyze_audio used to decode the file and recompute every feature each time
+# a threshold changed. Frame-level features are now computed once per content
+# hash (SHA-256 of the file bytes) and kept as one .npy column per feature
+# under <store>/<hash>/, memory-mapped on load. Event detection (peak picking
+# plus frequency-band labelling) runs against those arrays, so re-running it
+# with new parameters takes milliseconds.
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_STORE_DIR = os.environ.get(
+    "FORENSIC_FEATURE_STORE", os.path.join(PROJECT_DIR, "data", "feature_store")
+)
+STORE_VERSION = 1
+
+FRAME_LENGTH = 1024
+HOP_LENGTH = 512
+N_MFCC = 13
+SPECTRUM_POINTS = 100
+
+DEFAULT_PEAK_HEIGHT = 0.2
+DEFAULT_PEAK_DISTANCE = 5
+# (upper edge in Hz, label); a peak takes the first band its centroid is below
+DEFAULT_BANDS = [
+    (300.0, "Low Frequency/Bass"),
+    (1000.0, "Voice/Mid Range"),
+    (4000.0, "High Voice/Instruments"),
+    (float("inf"), "High Frequency/Noise"),
+]
+
+
+def content_hash(path=None, data=None, chunk_size=1 << 20):
+    """SHA-256 of the raw file bytes (from a path, streamed, or from bytes)."""
+    digest = hashlib.sha256()
+    if data is not None:
+        digest.update(data)
+    else:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def frame_energy(y, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH):
+    """
+    Sum of squares of y[i:i + frame_length] for every i in range(0, len(y), hop),
+    the same frames analyze_audio used (the tail frames are shorter).
+    """
+    n_frames = int(np.ceil(len(y) / hop_length))
+    padded = np.zeros((n_frames - 1) * hop_length + frame_length, dtype=np.float64)
+    padded[:len(y)] = y
+    windows = np.lib.stride_tricks.sliding_window_view(padded, frame_length)[::hop_length]
+    return np.einsum("ij,ij->i", windows, windows)
+
+
+def compute_features(y, sr):
+    """Returns ({column: array}, meta) for a mono signal."""
+    import librosa
+
+    # Same sampling as before: every len/100-th bin below Nyquist
+    magnitude = np.abs(np.fft.rfft(y))
+    frequency = np.fft.rfftfreq(len(y), d=1.0 / sr)
+    picks = np.arange(0, len(y) // 2, max(1, len(y) // SPECTRUM_POINTS))
+
+    columns = {
+        "energy": frame_energy(y),
+        "rms": librosa.feature.rms(y=y, frame_length=2048, hop_length=HOP_LENGTH)[0],
+        "centroid": librosa.feature.spectral_centroid(y=y, sr=sr, hop_length=HOP_LENGTH)[0],
+        "rolloff": librosa.feature.spectral_rolloff(y=y, sr=sr, hop_length=HOP_LENGTH)[0],
+        "zcr": librosa.feature.zero_crossing_rate(y, hop_length=HOP_LENGTH)[0],
+        "mfcc": librosa.feature.mfcc(y=y, sr=sr, n_mfcc=N_MFCC, hop_length=HOP_LENGTH).T,
+        "spectrum_freq": frequency[picks],
+        "spectrum_mag": magnitude[picks],
+    }
+    peak = float(np.max(np.abs(y))) if len(y) else 0.0
+    meta = {
+        "version": STORE_VERSION,
+        "sampleRate": int(sr),
+        "samples": int(len(y)),
+        "duration": float(len(y)) / sr if sr else 0.0,
+        "frameLength": FRAME_LENGTH,
+        "hopLength": HOP_LENGTH,
+        "maxAbs": peak,
+        "spectrumMax": float(magnitude.max()) if len(magnitude) else 0.0,
+        "createdAt": time.time(),
+    }
+    return {k: np.ascontiguousarray(v, dtype=np.float32) for k, v in columns.items()}, meta
+
+
+class FeatureSet:
+    """Memory-mapped feature columns for one content hash."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        self._columns = {}
+
+    @property
+    def hash(self):
+        return os.path.basename(self.directory)
+
+    def __getitem__(self, name):
+        if name not in self._columns:
+            self._columns[name] = np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode="r")
+        return self._columns[name]
+
+
+def store_path(digest, store_dir=None):
+    return os.path.join(store_dir or DEFAULT_STORE_DIR, digest)
+
+
+def save_features(digest, columns, meta, store_dir=None, extra_meta=None):
+    """Writes all columns to a temporary directory, then moves it into place."""
+    target = store_path(digest, store_dir)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f".{digest[:12]}-", dir=os.path.dirname(target))
+    try:
+        for name, values in columns.items():
+            np.save(os.path.join(staging, f"{name}.npy"), values)
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump({**meta, **(extra_meta or {})}, f)
+        try:
+            os.replace(staging, target)
+        except OSError:
+            # Another process stored the same content first
+            shutil.rmtree(staging, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return FeatureSet(target)
+
+
+def load_features(digest, store_dir=None):
+    """Returns the FeatureSet for a hash, or None if it was never extracted."""
+    target = store_path(digest, store_dir)
+    if not os.path.exists(os.path.join(target, "meta.json")):
+        return None
+    features = FeatureSet(target)
+    if features.meta.get("version") != STORE_VERSION:
+        return None
+    return features
+
+
+def get_features(path=None, data=None, store_dir=None, filename=None):
+    """
+    Feature set for an audio file (path or raw bytes), extracting it on the
+    first request only. Returns (features, cache_hit).
+    """
+    digest = content_hash(path, data)
+    features = load_features(digest, store_dir)
+    if features is not None:
+        return features, True
+
+    import librosa
+    temp_path = None
+    try:
+        if path is None:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_file:
+                temp_file.write(data)
+                temp_path = temp_file.name
+        y, sr = librosa.load(path or temp_path, sr=None)
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+    columns, meta = compute_features(y, sr)
+    name = filename or (os.path.basename(path) if path else None)
+    return save_features(digest, columns, meta, store_dir, {"filename": name}), False
+
+
+def detect_events(features, height=DEFAULT_PEAK_HEIGHT, distance=DEFAULT_PEAK_DISTANCE, bands=None, top=10):
+    """
+    Peak picking on normalized frame energy and band labelling by spectral
+    centroid, from cached arrays only. Returns (num_sounds, events) with
+    events sorted loudest first and cut to `top` (None for all).
+    """
+    from scipy.signal import find_peaks
+
+    bands = bands or DEFAULT_BANDS
+    energy = np.asarray(features["energy"], dtype=np.float64)
+    centroid = np.asarray(features["centroid"])
+    sr = features.meta["sampleRate"]
+    hop = features.meta["hopLength"]
+
+    peak_energy = energy.max() if len(energy) else 0.0
+    energy = energy / peak_energy if peak_energy > 0 else energy
+    peaks, _ = find_peaks(energy, height=height, distance=distance)
+
+    freq_at_peak = centroid[np.minimum(peaks, len(centroid) - 1)]
+    edges = np.array([edge for edge, _ in bands])
+    labels = np.array([label for _, label in bands], dtype=object)
+    types = labels[np.minimum(np.searchsorted(edges, freq_at_peak, side="right"), len(bands) - 1)]
+    amplitude = energy[peaks]
+    with np.errstate(divide="ignore"):
+        decibels = np.where(amplitude > 0, 20 * np.log10(amplitude), -np.inf)
+
+    order = np.argsort(-amplitude, kind="stable")
+    if top is not None:
+        order = order[:top]
+    events = [
+        {
+            "time": round(float(peaks[i] * hop / sr), 2),
+            "frequency": round(float(freq_at_peak[i]), 1),
+            "amplitude": round(float(amplitude[i]), 3),
+            "type": types[i],
+            "decibels": round(float(decibels[i]), 1),
+        }
+        for i in order
+    ]
+    return len(peaks), events
+
+
+def summary(features):
+    """File-level figures that do not depend on detection parameters."""
+    magnitude = np.asarray(features["spectrum_mag"])
+    frequency = np.asarray(features["spectrum_freq"])
+    peak_mag = features.meta["spectrumMax"]
+    max_abs = features.meta["maxAbs"]
+    return {
+        "duration": round(features.meta["duration"], 2),
+        "sampleRate": features.meta["sampleRate"],
+        "averageRMS": round(float(np.mean(features["rms"])), 6),
+        "dominantFrequency": round(float(np.mean(features["centroid"])), 1),
+        "maxDecibels": round(float(20 * np.log10(max_abs)) if max_abs > 0 else float("-inf"), 1),
+        "frequencySpectrum": [
+            {"frequency": round(float(f), 1), "magnitude": round(float(m / peak_mag), 3) if peak_mag > 0 else 0}
+            for f, m in zip(frequency, magnitude)
+        ],
+    }
+
+
+def sweep(features, heights, distances, bands=None):
+    """Event counts for every (height, distance) pair."""
+    return [
+        {"height": h, "distance": d, "detectedSounds": detect_events(features, h, d, bands, top=0)[0]}
+        for h in heights for d in distances
+    ]
+
+
+def parse_bands(value):
+    """'300,1000,4000' -> DEFAULT_BANDS labels with new edges (last band is open-ended)."""
+    edges = [float(v) for v in value.split(",")]
+    labels = [label for _, label in DEFAULT_BANDS]
+    if len(edges) != len(labels) - 1:
+        raise ValueError(f"Expected {len(labels) - 1} band edges")
+    return list(zip(edges + [float("inf")], labels))
+
+
+if __name__ == "__main__":
+    # Usage:
+    #   feature_store.py extract <audio>
+    #   feature_store.py detect <audio|hash> [--height=0.2] [--distance=5] [--bands=300,1000,4000] [--top=10]
+    #   feature_store.py sweep <audio|hash> --height=0.1,0.2,0.3 [--distance=3,5,8]
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    options = dict(a[2:].partition("=")[::2] for a in sys.argv[1:] if a.startswith("--"))
+    try:
+        if len(args) < 2:
+            raise ValueError("Expected a command (extract, detect or sweep) and an audio path or hash")
+        command, target = args[0], args[1].strip('"')
+        store_dir = options.get("store") or None
+        started = time.perf_counter()
+        if os.path.exists(target):
+            features, cache_hit = get_features(target, store_dir=store_dir)
+        else:
+            features, cache_hit = load_features(target, store_dir), True
+            if features is None:
+                raise FileNotFoundError(f"No stored features for {target}")
+        bands = parse_bands(options["bands"]) if options.get("bands") else None
+
+        output = {"status": "success", "hash": features.hash, "cacheHit": cache_hit}
+        if command == "extract":
+            output.update(summary(features))
+        elif command == "detect":
+            num_sounds, events = detect_events(
+                features,
+                height=float(options.get("height") or DEFAULT_PEAK_HEIGHT),
+                distance=int(options.get("distance") or DEFAULT_PEAK_DISTANCE),
+                bands=bands,
+                top=int(options["top"]) if options.get("top") else 10,
+            )
+            output.update({"detectedSounds": num_sounds, "soundEvents": events})
+        elif command == "sweep":
+            heights = [float(v) for v in (options.get("height") or str(DEFAULT_PEAK_HEIGHT)).split(",")]
+            distances = [int(v) for v in (options.get("distance") or str(DEFAULT_PEAK_DISTANCE)).split(",")]
+            output["results"] = sweep(features, heights, distances, bands)
+        else:
+            raise ValueError(f"Unknown command: {command}")
+        output["elapsedMs"] = round((time.perf_counter() - started) * 1000, 2)
+    except Exception as e:
+        output = {"status": "error", "message": str(e)}
+    sys.stdout.write(json.dumps(output))
+    sys.stdout.flush()
@@ -0,0 +1,285 @@
+import sys
+import os
+import json
+import sqlite3
+import time
+import numpy as np
+
+from audio_analysis import stft_magnitude
+
+# ================================
+# Acoustic Fingerprint Index
+# ================================
+# Analysts often upload re-encoded or trimmed copies of the same recording.
+# A file hash does not catch those, so each recording gets landmark
+# fingerprints: spectral peaks from the STFT are paired (anchor, target) and
+# each pair is hashed as (anchor bin, target bin, frame gap). The hashes go
+# into an on-disk inverted index (SQLite, clustered on the hash), so a query
+# only looks up its own hashes instead of scanning every stored recording.
+# Matching hashes that agree on the same time offset identify the recording
+# and where the query sits inside it, so classification and separation
+# results stored with the recording can be reused for the overlapping part.
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB_PATH = os.environ.get(
+    "FORENSIC_FINGERPRINT_DB", os.path.join(PROJECT_DIR, "data", "fingerprints.sqlite3")
+)
+
+SAMPLE_RATE = 8000
+N_FFT = 1024
+HOP_LENGTH = 256                     # 32 ms frames
+FRAME_SEC = HOP_LENGTH / SAMPLE_RATE
+PEAK_NEIGHBORHOOD = (15, 9)          # (bins, frames) for local-maximum picking
+PEAKS_PER_SECOND = 30
+FAN_OUT = 5
+MAX_FRAME_GAP = 63
+MIN_ALIGNED = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    id INTEGER PRIMARY KEY,
+    recording_key TEXT NOT NULL UNIQUE,
+    path TEXT,
+    duration REAL,
+    hash_count INTEGER NOT NULL DEFAULT 0,
+    results TEXT,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS hashes (
+    hash INTEGER NOT NULL,
+    recording_id INTEGER NOT NULL REFERENCES recordings(id) ON DELETE CASCADE,
+    frame INTEGER NOT NULL,
+    PRIMARY KEY (hash, recording_id, frame)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_hashes_recording ON hashes(recording_id);
+"""
+
+
+def connect(db_path=None):
+    db_path = db_path or DEFAULT_DB_PATH
+    if db_path != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def load_audio(path):
+    """Mono float32 at SAMPLE_RATE; librosa decodes WAV, FLAC and MP3 alike."""
+    import librosa
+    y, _ = librosa.load(path, sr=SAMPLE_RATE, mono=True)
+    return y
+
+
+def find_peaks(y):
+    """
+    Local maxima of the log spectrogram, thinned to the strongest
+    PEAKS_PER_SECOND. Returns (frames, bins) sorted by frame.
+    """
+    from scipy.ndimage import maximum_filter
+    spectrum = 20 * np.log10(stft_magnitude(y, n_fft=N_FFT, hop_length=HOP_LENGTH) + 1e-10)
+    local_max = (spectrum == maximum_filter(spectrum, size=PEAK_NEIGHBORHOOD, mode="constant", cval=-np.inf))
+    # Ignore flat digital silence, where every bin is its own maximum
+    local_max &= spectrum > spectrum.max() - 80
+    bins, frames = np.nonzero(local_max)
+
+    budget = max(1, int(PEAKS_PER_SECOND * spectrum.shape[1] * FRAME_SEC))
+    if len(frames) > budget:
+        strongest = np.argpartition(-spectrum[bins, frames], budget - 1)[:budget]
+        bins, frames = bins[strongest], frames[strongest]
+    order = np.lexsort((bins, frames))
+    return frames[order], bins[order]
+
+
+def landmark_hashes(frames, bins):
+    """
+    Pairs each peak with the next FAN_OUT peaks within MAX_FRAME_GAP frames.
+    Returns (hashes, anchor_frames) as int64 arrays.
+    """
+    hashes = []
+    anchors = []
+    for k in range(1, FAN_OUT + 1):
+        if len(frames) <= k:
+            break
+        gap = frames[k:] - frames[:-k]
+        valid = (gap > 0) & (gap <= MAX_FRAME_GAP)
+        f1 = bins[:-k][valid].astype(np.int64)
+        f2 = bins[k:][valid].astype(np.int64)
+        hashes.append((f1 << 18) | (f2 << 8) | gap[valid].astype(np.int64))
+        anchors.append(frames[:-k][valid].astype(np.int64))
+    if not hashes:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(hashes), np.concatenate(anchors)
+
+
+def fingerprint(y):
+    return landmark_hashes(*find_peaks(y))
+
+
+def add_recording(conn, path, recording_key=None, results=None, y=None):
+    """
+    Fingerprints a recording and stores its hashes. Re-adding the same key
+    replaces the old hashes. `results` (e.g. {"classification": path,
+    "separation": path}) is stored verbatim and returned with matches.
+    """
+    recording_key = recording_key or os.path.basename(path)
+    y = load_audio(path) if y is None else y
+    hashes, anchors = fingerprint(y)
+
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO recordings (recording_key, path, duration, hash_count, results, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(recording_key) DO UPDATE SET
+                path = excluded.path,
+                duration = excluded.duration,
+                hash_count = excluded.hash_count,
+                results = excluded.results
+            """,
+            (recording_key, path, len(y) / SAMPLE_RATE, len(hashes),
+             json.dumps(results) if results else None, time.time()),
+        )
+        recording_id = conn.execute(
+            "SELECT id FROM recordings WHERE recording_key = ?", (recording_key,)
+        ).fetchone()[0]
+        conn.execute("DELETE FROM hashes WHERE recording_id = ?", (recording_id,))
+        conn.executemany(
+            "INSERT OR IGNORE INTO hashes (hash, recording_id, frame) VALUES (?, ?, ?)",
+            zip(hashes.tolist(), [recording_id] * len(hashes), anchors.tolist()),
+        )
+    return {"recordingKey": recording_key, "hashes": len(hashes), "duration": round(len(y) / SAMPLE_RATE, 2)}
+
+
+def match_recording(conn, path=None, y=None, min_aligned=MIN_ALIGNED, limit=5):
+    """
+    Finds stored recordings that contain (part of) the query audio.
+    `offset` is where the query starts in the stored recording (negative if
+    the query starts earlier); `overlap` gives the shared span in both
+    timelines. Best match first.
+    """
+    y = load_audio(path) if y is None else y
+    hashes, anchors = fingerprint(y)
+    query_duration = len(y) / SAMPLE_RATE
+    if not len(hashes):
+        return []
+
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS query_hashes (hash INTEGER NOT NULL, frame INTEGER NOT NULL)")
+    conn.execute("DELETE FROM query_hashes")
+    conn.executemany("INSERT INTO query_hashes (hash, frame) VALUES (?, ?)", zip(hashes.tolist(), anchors.tolist()))
+    rows = conn.execute(
+        """
+        SELECT h.recording_id, h.frame - q.frame AS delta, COUNT(*) AS votes
+        FROM query_hashes q JOIN hashes h ON h.hash = q.hash
+        GROUP BY h.recording_id, delta
+        """
+    ).fetchall()
+    conn.execute("DELETE FROM query_hashes")
+
+    # Per recording, the offset with the most votes; neighbouring offsets are
+    # added in since peaks can land one frame apart after re-encoding.
+    votes = {}
+    for row in rows:
+        votes.setdefault(row["recording_id"], {})[row["delta"]] = row["votes"]
+    candidates = []
+    for recording_id, by_delta in votes.items():
+        best = max(by_delta, key=by_delta.get)
+        score = sum(by_delta.get(best + d, 0) for d in (-1, 0, 1))
+        if score >= min_aligned:
+            candidates.append((score, recording_id, best))
+    candidates.sort(reverse=True)
+
+    matches = []
+    for score, recording_id, delta in candidates[:limit]:
+        recording = conn.execute("SELECT * FROM recordings WHERE id = ?", (recording_id,)).fetchone()
+        offset = delta * FRAME_SEC
+        query_start = max(0.0, -offset)
+        query_end = min(query_duration, recording["duration"] - offset)
+        matches.append({
+            "recordingKey": recording["recording_key"],
+            "path": recording["path"],
+            "offset": round(offset, 3),
+            "alignedHashes": score,
+            "confidence": round(score / len(hashes), 4),
+            "overlap": {
+                "queryStart": round(query_start, 3),
+                "queryEnd": round(query_end, 3),
+                "recordingStart": round(query_start + offset, 3),
+                "recordingEnd": round(query_end + offset, 3),
+            },
+            "results": json.loads(recording["results"]) if recording["results"] else None,
+        })
+    return matches
+
+
+def map_events(events, match):
+    """
+    Moves stored events (in the matched recording's timeline) onto the query
+    timeline, keeping only those inside the overlap.
+    """
+    overlap = match["overlap"]
+    offset = match["offset"]
+    mapped = []
+    for event in events:
+        start = float(event.get("start", event.get("time", 0)))
+        end = float(event.get("end", start))
+        if end < overlap["recordingStart"] or start > overlap["recordingEnd"]:
+            continue
+        shifted = dict(event)
+        for key in ("time", "start", "end"):
+            if key in shifted:
+                shifted[key] = round(float(shifted[key]) - offset, 2)
+        mapped.append(shifted)
+    return mapped
+
+
+def _parse_options(argv):
+    options = {}
+    positional = []
+    for arg in argv:
+        if arg.startswith("--"):
+            key, _, value = arg[2:].partition("=")
+            options.setdefault(key, []).append(value)
+        else:
+            positional.append(arg)
+    return positional, options
+
+
+if __name__ == "__main__":
+    # Usage:
+    #   fingerprint.py add <audio> [--key=JOB] [--classification=PATH] [--separation=PATH] [--db=PATH]
+    #   fingerprint.py match <audio> [--min-aligned=N] [--limit=N] [--db=PATH]
+    positional, options = _parse_options(sys.argv[1:])
+    first = lambda key: options[key][-1] if key in options else None
+
+    try:
+        if len(positional) < 2:
+            raise ValueError("Expected a command (add or match) and an audio path")
+        conn = connect(first("db"))
+        command, audio_path = positional[0], positional[1].strip('"')
+        started = time.perf_counter()
+
+        if command == "add":
+            results = {k: first(k) for k in ("classification", "separation") if first(k)}
+            output = {"status": "success", **add_recording(conn, audio_path, first("key"), results or None)}
+        elif command == "match":
+            matches = match_recording(
+                conn, audio_path,
+                min_aligned=int(first("min-aligned") or MIN_ALIGNED),
+                limit=int(first("limit") or 5),
+            )
+            output = {"status": "success", "count": len(matches), "matches": matches}
+        else:
+            raise ValueError(f"Unknown command: {command}")
+        output["elapsedMs"] = round((time.perf_counter() - started) * 1000, 2)
+    except Exception as e:
+        output = {"status": "error", "message": str(e)}
+
+    sys.stdout.write(json.dumps(output))
+    sys.stdout.flush()
@@ -0,0 +1,157 @@
+import os
+import csv
+import json
+import numpy as np
+
+# ================================
+# Forensic Category Lookup
+# ================================
+# YAMNet labels are mapped to forensic categories by case-insensitive keyword
+# match, first match wins. Instead of re-running that match for every frame,
+# the mapping is compiled once into an array indexed by YAMNet class id, so a
+# whole score matrix is labelled with a single gather.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CLASS_MAP_PATH = os.path.join(SCRIPT_DIR, "res", "yamnet_class_map.csv")
+PROFILE_DIR = os.path.join(SCRIPT_DIR, "res", "category_profiles")
+
+DEFAULT_MAPPING = {
+    "Speech": "Human Voice",
+    "Singing": "Human Voice",
+    "Male speech": "Male Voice",
+    "Female speech": "Female Voice",
+    "Music": "Musical Content",
+    "Vehicle": "Vehicle Sound",
+    "Car": "Vehicle Sound",
+    "Bus": "Vehicle Sound",
+    "Truck": "Vehicle Sound",
+    "Motorcycle": "Vehicle Sound",
+    "Footsteps": "Footsteps",
+    "Animal": "Animal Signal",
+    "Dog": "Animal Signal",
+    "Cat": "Animal Signal",
+    "Bird": "Animal Signal",
+    "Wind": "Atmospheric Wind",
+    "Thunder": "Atmospheric Wind",
+    "Breeze": "Atmospheric Wind",
+    "Silence": "Silence",
+    # NEW FORENSIC CATEGORIES
+    "Gunshot": "Gunshot / Explosion",
+    "Explosion": "Gunshot / Explosion",
+    "Cap gun": "Gunshot / Explosion",
+    "Fusillade": "Gunshot / Explosion",
+    "Artillery": "Gunshot / Explosion",
+    "Screaming": "Scream / Aggression",
+    "Shout": "Scream / Aggression",
+    "Yell": "Scream / Aggression",
+    "Siren": "Siren / Alarm",
+    "Alarm": "Siren / Alarm",
+    "Buzzer": "Siren / Alarm",
+    "Glass": "Impact / Breach",
+    "Shatter": "Impact / Breach",
+    "Smash": "Impact / Breach",
+    "Hammer": "Impact / Breach",
+    "Door": "Impact / Breach",
+    "Knock": "Impact / Breach",
+    "Slam": "Impact / Breach"
+}
+
+# Categories whose frames are never merged into a neighbouring segment
+PRIORITY_CATEGORIES = frozenset({
+    "Gunshot / Explosion",
+    "Scream / Aggression",
+    "Siren / Alarm",
+    "Impact / Breach",
+})
+
+_CLASS_NAMES = {}
+_LOOKUPS = {}
+
+
+def load_class_names(class_map_path=CLASS_MAP_PATH):
+    """YAMNet display names, indexed by class id."""
+    if class_map_path not in _CLASS_NAMES:
+        with open(class_map_path, "r", newline="") as f:
+            reader = csv.reader(f)
+            next(reader)  # Skip header row
+            _CLASS_NAMES[class_map_path] = [row[2] for row in reader]
+    return _CLASS_NAMES[class_map_path]
+
+
+def load_profile(profile):
+    """
+    Loads a mapping profile by name (res/category_profiles/<name>.json) or path.
+    A profile is {"mapping": {keyword: category, ...}, "extendsDefault": bool};
+    with extendsDefault its keywords are matched before the default ones.
+    Returns the ordered keyword -> category dict.
+    """
+    if profile is None or profile == "default":
+        return DEFAULT_MAPPING
+    if isinstance(profile, dict):
+        config = profile
+    else:
+        path = profile if os.path.exists(profile) else os.path.join(PROFILE_DIR, f"{profile}.json")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Category profile not found: {profile}")
+        with open(path, "r") as f:
+            config = json.load(f)
+
+    mapping = dict(config.get("mapping", {}))
+    if config.get("extendsDefault", False):
+        for key, value in DEFAULT_MAPPING.items():
+            mapping.setdefault(key, value)
+    return mapping
+
+
+def match_category(label, mapping=DEFAULT_MAPPING):
+    """Keyword match for a single label; unmatched labels keep their own name."""
+    lowered = label.lower()
+    for key, value in mapping.items():
+        if key.lower() in lowered:
+            return value
+    return label
+
+
+def build_lookup(profile=None, class_map_path=CLASS_MAP_PATH):
+    """
+    Compiles a mapping profile against the YAMNet class list.
+    Returns (categories, class_to_category) where categories is the list of
+    distinct category names and class_to_category[class_id] indexes into it.
+    Results are cached per profile.
+    """
+    cache_key = (json.dumps(profile, sort_keys=True) if isinstance(profile, dict) else profile, class_map_path)
+    if cache_key in _LOOKUPS:
+        return _LOOKUPS[cache_key]
+
+    mapping = load_profile(profile)
+    categories = []
+    positions = {}
+    class_to_category = np.empty(len(load_class_names(class_map_path)), dtype=np.int32)
+    for class_id, name in enumerate(load_class_names(class_map_path)):
+        category = match_category(name, mapping)
+        if category not in positions:
+            positions[category] = len(categories)
+            categories.append(category)
+        class_to_category[class_id] = positions[category]
+
+    _LOOKUPS[cache_key] = (categories, class_to_category)
+    return _LOOKUPS[cache_key]
+
+
+def categories_for(class_ids, profile=None):
+    """Vectorized gather: forensic category name for each YAMNet class id."""
+    categories, class_to_category = build_lookup(profile)
+    return np.asarray(categories, dtype=object)[class_to_category[np.asarray(class_ids)]]
+
+
+def category_scores(scores, profile=None):
+    """
+    Collapses a frames x 521 score matrix to frames x categories by taking the
+    best class score within each category. Returns (categories, matrix).
+    """
+    categories, class_to_category = build_lookup(profile)
+    scores = np.asarray(scores, dtype=np.float32)
+    # Sort classes by category so each category is one contiguous column block
+    order = np.argsort(class_to_category, kind="stable")
+    starts = np.searchsorted(class_to_category[order], np.arange(len(categories)))
+    return categories, np.maximum.reduceat(scores[:, order], starts, axis=1)
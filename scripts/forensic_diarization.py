@@ -1,11 +1,10 @@
 import os
-import torch
-import soundfile as sf
+import sys
 import json
-import io
-from pydub import AudioSegment
-from pyannote.audio import Pipeline
-from huggingface_hub import login
+import inspect
+import tempfile
+import subprocess
+import numpy as np
 from dotenv import load_dotenv
 
 # --- 1. LOCAL FFMEPG SETUP ---
@@ -13,61 +12,309 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 FFMPEG_DIR = os.path.join(BASE_DIR, "ffmpeg")
 os.environ["PATH"] += os.pathsep + FFMPEG_DIR
 
-AudioSegment.converter = os.path.join(FFMPEG_DIR, "ffmpeg.exe")
-AudioSegment.ffprobe = os.path.join(FFMPEG_DIR, "ffprobe.exe")
-
 # --- 2. AUTHENTICATION (The Secure Way) ---
 # This tells Python to look for the .env file in the same folder as this script
 load_dotenv(os.path.join(BASE_DIR, ".env"))
 HF_TOKEN = os.getenv("HF_TOKEN")
 
+PIPELINE_NAME = "pyannote/speaker-diarization-3.1"
+SAMPLE_RATE = 16000
+
+# Long recordings are diarized in windows of CHUNK_SEC with OVERLAP_SEC shared
+# between neighbours; speaker labels are stitched across the shared region.
+CHUNK_SEC = 300.0
+OVERLAP_SEC = 30.0
+# Speakers not heard in the shared region are matched to earlier speakers by
+# embedding when the cosine distance is below this (pyannote 3.1's own
+# clustering threshold)
+EMBEDDING_MATCH_DISTANCE = 0.7
+# Lines of FFmpeg's stderr quoted when decoding fails
+STDERR_TAIL_LINES = 10
+
+# Warm pipeline, loaded once per process and reused by every diarization call.
+_PIPELINE = None
+
+
+def get_ffmpeg_binary():
+    local = os.path.join(FFMPEG_DIR, "ffmpeg.exe")
+    return local if os.path.exists(local) else "ffmpeg"
+
+
+def load_pipeline(local_only=True):
+    """
+    Returns the process-wide diarization pipeline, loading it on first use.
+    With local_only, weights are resolved from the Hugging Face cache only and
+    no network login is attempted.
+    """
+    global _PIPELINE
+    if _PIPELINE is not None:
+        return _PIPELINE
+
+    if local_only:
+        # Must be set before huggingface_hub is imported to take effect.
+        os.environ["HF_HUB_OFFLINE"] = "1"
+
+    import torch
+    from pyannote.audio import Pipeline
+
+    if not local_only:
+        if not HF_TOKEN:
+            raise RuntimeError("HF_TOKEN not found! Ensure the .env file is in the scripts folder.")
+        from huggingface_hub import login
+        login(token=HF_TOKEN)
+
+    print("[INFO] Building AI Brain from local cache...", file=sys.stderr)
+    pipeline = Pipeline.from_pretrained(PIPELINE_NAME, token=HF_TOKEN)
+    if pipeline is None:
+        raise RuntimeError(f"Pipeline {PIPELINE_NAME} is not available in the local cache.")
+
+    # Use CPU for processing
+    pipeline.to(torch.device("cpu"))
+    _PIPELINE = pipeline
+    return _PIPELINE
+
+
+def iter_decoded_chunks(audio_path, chunk_sec=CHUNK_SEC, overlap_sec=OVERLAP_SEC):
+    """
+    Decodes audio_path with FFmpeg straight to 16 kHz mono float32 and yields
+    (offset_sec, samples) windows of chunk_sec that overlap by overlap_sec.
+    Only one window is held in memory at a time.
+    """
+    chunk_len = int(chunk_sec * SAMPLE_RATE)
+    hop_len = chunk_len - int(overlap_sec * SAMPLE_RATE)
+    if hop_len <= 0:
+        raise ValueError("overlap_sec must be shorter than chunk_sec")
+
+    cmd = [
+        get_ffmpeg_binary(), "-v", "error",
+        "-i", audio_path,
+        "-f", "f32le", "-ac", "1", "-ar", str(SAMPLE_RATE),
+        "pipe:1",
+    ]
+    # stderr goes to a file so a chatty FFmpeg cannot block on a full pipe
+    errors = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errors)
+    finished = False
+    try:
+        buffer = np.zeros(0, dtype=np.float32)
+        offset = 0
+        while True:
+            need = chunk_len - len(buffer)
+            raw = proc.stdout.read(need * 4)
+            raw = raw[: len(raw) - len(raw) % 4]
+            eof = len(raw) < need * 4
+            if raw:
+                buffer = np.concatenate([buffer, np.frombuffer(raw, dtype=np.float32)])
+            # Stop when nothing new arrived: the tail is already covered.
+            if not raw and (offset > 0 or len(buffer) == 0):
+                break
+            yield offset / SAMPLE_RATE, buffer
+            if eof:
+                break
+            buffer = buffer[hop_len:].copy()
+            offset += hop_len
+        finished = True
+    finally:
+        proc.stdout.close()
+        proc.wait()
+        errors.seek(0)
+        stderr = errors.read().decode("utf-8", "replace").strip().splitlines()
+        errors.close()
+    if finished and proc.returncode != 0:
+        detail = "\n".join(stderr[-STDERR_TAIL_LINES:]) or f"exit code {proc.returncode}"
+        raise RuntimeError(f"FFmpeg failed to decode {audio_path}: {detail}")
+
+
+def _overlap(*spans):
+    return max(0.0, min(end for _, end in spans) - max(start for start, _ in spans))
+
+
+def run_pipeline(pipeline, samples):
+    """
+    Diarizes one chunk. Returns (annotation, {local_label: embedding}); the
+    embeddings are empty when the installed pyannote does not provide them.
+    """
+    import torch
+    inputs = {"waveform": torch.from_numpy(samples).unsqueeze(0), "sample_rate": SAMPLE_RATE}
+    embeddings = None
+    if "return_embeddings" in inspect.signature(pipeline.apply).parameters:
+        output = pipeline(inputs, return_embeddings=True)
+    else:
+        output = pipeline(inputs)
+    if isinstance(output, tuple):
+        # pyannote 3.x: (annotation, embeddings in annotation.labels() order)
+        annotation, embeddings = output
+    else:
+        # pyannote >= 4 wraps the annotation in an output object
+        annotation = getattr(output, "speaker_diarization", output)
+        embeddings = getattr(output, "speaker_embeddings", None)
+
+    by_label = {}
+    if embeddings is not None:
+        for label, vector in zip(annotation.labels(), np.asarray(embeddings, dtype=np.float32)):
+            if np.all(np.isfinite(vector)) and np.any(vector):
+                by_label[label] = vector / np.linalg.norm(vector)
+    return annotation, by_label
+
+
+def stitch_speakers(previous, current, region_start, region_end, next_global_id, embeddings=None, known=None):
+    """
+    Maps the chunk-local speaker labels in `current` onto the global labels in
+    `previous` by greedily pairing the labels that talk at the same time inside
+    the shared region. Labels still unmatched are paired with the closest
+    `known` speaker ({global_label: summed unit embedding}) by the cosine
+    distance of their `embeddings`, below EMBEDDING_MATCH_DISTANCE. Anything
+    left gets a new global id.
+    Returns ({local_label: global_label}, next_global_id).
+    """
+    shared = {}
+    for p in previous:
+        for c in current:
+            dur = _overlap((p["start"], p["end"]), (c["start"], c["end"]), (region_start, region_end))
+            if dur > 0:
+                key = (p["speaker"], c["speaker"])
+                shared[key] = shared.get(key, 0.0) + dur
+
+    mapping = {}
+    used = set()
+    for (global_label, local_label), _ in sorted(shared.items(), key=lambda x: x[1], reverse=True):
+        if local_label in mapping or global_label in used:
+            continue
+        mapping[local_label] = global_label
+        used.add(global_label)
+
+    if embeddings and known:
+        candidates = []
+        for local_label, vector in embeddings.items():
+            if local_label in mapping:
+                continue
+            for global_label, total in known.items():
+                if global_label not in used:
+                    distance = 1.0 - float(vector @ total) / (float(np.linalg.norm(total)) + 1e-12)
+                    candidates.append((distance, local_label, global_label))
+        for distance, local_label, global_label in sorted(candidates):
+            if distance > EMBEDDING_MATCH_DISTANCE:
+                break
+            if local_label in mapping or global_label in used:
+                continue
+            mapping[local_label] = global_label
+            used.add(global_label)
+
+    for c in current:
+        if c["speaker"] not in mapping:
+            mapping[c["speaker"]] = f"SPEAKER_{next_global_id:02d}"
+            next_global_id += 1
+    return mapping, next_global_id
+
+
+def diarize_file(audio_path, chunk_sec=CHUNK_SEC, overlap_sec=OVERLAP_SEC, local_only=True, use_vad=False):
+    """
+    Runs warm, chunked speaker diarization on audio_path.
+    With use_vad, only the active spans of each chunk are passed to pyannote and
+    the resulting turns are mapped back to recording time. Labels are stitched
+    against the last chunk that had speech and, where the pipeline provides
+    them, against the embeddings of every speaker so far, so a speaker keeps
+    their label across silent chunks.
+    Returns the same structure run_forensic_analysis writes to JSON.
+    """
+    pipeline = load_pipeline(local_only=local_only)
+    if use_vad:
+        from vad import detect_active_regions, extract_active, to_original_intervals
+
+    segments = []
+    next_global_id = 0
+    previous = []
+    known = {}
+    total_duration = 0.0
+    active_seconds = 0.0
+
+    for offset, samples in iter_decoded_chunks(audio_path, chunk_sec, overlap_sec):
+        chunk_end = offset + len(samples) / SAMPLE_RATE
+        own_start = offset + overlap_sec if offset > 0 else 0.0
+        total_duration = chunk_end
+        print(f"[INFO] Diarizing {offset:.1f}s - {chunk_end:.1f}s", file=sys.stderr)
+
+        kept = None
+        if use_vad:
+            regions = detect_active_regions(samples, SAMPLE_RATE)["regions"]
+            # Count activity only over the part of the chunk not seen before
+            active_seconds += sum(
+                max(0.0, min(offset + e, chunk_end) - max(offset + s, own_start)) for s, e in regions
+            )
+            samples, kept = extract_active(samples, SAMPLE_RATE, regions)
+
+        current = []
+        embeddings = {}
+        if len(samples) > 0:
+            annotation, embeddings = run_pipeline(pipeline, samples)
+            for turn, _, speaker in annotation.itertracks(yield_label=True):
+                spans = to_original_intervals(turn.start, turn.end, kept) if kept is not None else [[turn.start, turn.end]]
+                for start, end in spans:
+                    current.append({"start": offset + start, "end": offset + end, "speaker": speaker})
+
+        if offset == 0:
+            mapping, next_global_id = stitch_speakers([], current, 0.0, 0.0, next_global_id)
+            cut = offset
+        else:
+            region_end = min(offset + overlap_sec, chunk_end)
+            mapping, next_global_id = stitch_speakers(previous, current, offset, region_end, next_global_id,
+                                                      embeddings, known)
+            # Hand over at the middle of the shared region: earlier chunk owns
+            # everything before the cut, this chunk everything after it.
+            cut = offset + (region_end - offset) / 2.0
+            segments = [
+                dict(s, end=min(s["end"], cut)) for s in segments if s["start"] < cut
+            ]
+
+        current = [dict(c, speaker=mapping[c["speaker"]]) for c in current]
+        for c in current:
+            if c["end"] > cut:
+                segments.append(dict(c, start=max(c["start"], cut)))
+        for local_label, vector in embeddings.items():
+            if local_label in mapping:
+                global_label = mapping[local_label]
+                known[global_label] = known.get(global_label, 0.0) + vector
+        # A chunk without speech keeps the last speakers for the next one
+        if current:
+            previous = current
+
+    # Merge turns of the same speaker that touch across the chunk boundaries.
+    segments.sort(key=lambda s: (s["start"], s["speaker"]))
+    merged = []
+    for s in segments:
+        last = next((m for m in reversed(merged) if m["speaker"] == s["speaker"]), None)
+        if last is not None and s["start"] - last["end"] < 0.01:
+            last["end"] = max(last["end"], s["end"])
+        else:
+            merged.append(dict(s))
+
+    result = {
+        "fileName": os.path.basename(audio_path),
+        "totalDuration": round(total_duration, 2),
+        "segments": [
+            {"start": round(s["start"], 2), "end": round(s["end"], 2), "speaker": s["speaker"]}
+            for s in merged if s["end"] - s["start"] > 0
+        ],
+    }
+    if use_vad:
+        skipped = max(0.0, total_duration - active_seconds)
+        vad_info = {
+            "duration": round(total_duration, 3),
+            "activeSeconds": round(active_seconds, 3),
+            "skippedSeconds": round(skipped, 3),
+            "skippedRatio": round(skipped / total_duration, 4) if total_duration > 0 else 0.0,
+        }
+        result["vad"] = vad_info
+    return result
+
+
 def run_forensic_analysis(audio_path):
     print(f"\n[INFO] Initializing Offline Forensic Analysis...")
-    
-    if not HF_TOKEN:
-        print("[ERROR] HF_TOKEN not found! Ensure the .env file is in the scripts folder.")
-        return
 
     try:
-        # Authenticate with Hugging Face using the token from .env
-        login(token=HF_TOKEN)
-        
-        print("[INFO] Building AI Brain from local cache...")
-        pipeline = Pipeline.from_pretrained(
-            "pyannote/speaker-diarization-3.1", 
-            token=HF_TOKEN
-        )
-        
-        # Use CPU for processing
-        pipeline.to(torch.device("cpu"))
-
-        # Step B: Manual Audio Decoding
         print(f"[INFO] Decoding: {os.path.basename(audio_path)}")
-        audio = AudioSegment.from_file(audio_path).set_frame_rate(16000).set_channels(1)
-        
-        buffer = io.BytesIO()
-        audio.export(buffer, format="wav")
-        buffer.seek(0)
-        data, samplerate = sf.read(buffer)
-        waveform = torch.tensor(data).float().unsqueeze(0)
-
-        # Step C: Run Analysis
         print("[INFO] Analyzing voices... (Processing locally)")
-        diarization = pipeline({"waveform": waveform, "sample_rate": samplerate})
-
-        # --- 3. ORGANIZE DATA FOR JSON ---
-        json_output = {
-            "fileName": os.path.basename(audio_path),
-            "totalDuration": round(len(audio) / 1000.0, 2),
-            "segments": []
-        }
-
-        for turn, _, speaker in diarization.itertracks(yield_label=True):
-            json_output["segments"].append({
-                "start": round(turn.start, 2),
-                "end": round(turn.end, 2),
-                "speaker": speaker
-            })
+        json_output = diarize_file(audio_path)
 
         # Save results to JSON
         output_file = os.path.join(BASE_DIR, "analysis_results.json")
@@ -77,14 +324,38 @@ def run_forensic_analysis(audio_path):
         print("\n" + "="*45)
         print(f" SUCCESS: Results saved to analysis_results.json")
         print("="*45)
-        
+
     except Exception as e:
         print(f"\n[ERROR] Analysis failed: {e}")
 
+
+def serve(use_vad=False):
+    """
+    Warm service mode: reads one audio path per line on stdin and writes one
+    JSON result per line on stdout, keeping the pipeline loaded between files.
+    """
+    load_pipeline()
+    for line in sys.stdin:
+        audio_path = line.strip().strip('"')
+        if not audio_path:
+            continue
+        try:
+            result = {"status": "success", **diarize_file(audio_path, use_vad=use_vad)}
+        except Exception as e:
+            result = {"status": "error", "fileName": os.path.basename(audio_path), "message": str(e)}
+        sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
+
+
 if __name__ == "__main__":
-    # Assumes test_audio.wav is in the scripts folder
-    target_audio = os.path.join(BASE_DIR, "test_audio.wav")
-    if os.path.exists(target_audio):
-        run_forensic_analysis(target_audio)
+    if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+        serve(use_vad="--vad" in sys.argv)
+    elif len(sys.argv) > 1:
+        run_forensic_analysis(sys.argv[1].strip('"'))
     else:
-        print(f"[!] File not found: {target_audio}")
\ No newline at end of file
+        # Assumes test_audio.wav is in the scripts folder
+        target_audio = os.path.join(BASE_DIR, "test_audio.wav")
+        if os.path.exists(target_audio):
+            run_forensic_analysis(target_audio)
+        else:
+            print(f"[!] File not found: {target_audio}")
@@ -0,0 +1,143 @@
+import sys
+import os
+import json
+import subprocess
+
+# ================================
+# Import-Time Budget Check
+# ================================
+# Every analysis request spawns a fresh Python process, so the time spent
+# importing a script before it touches any audio is paid on every job.
+# This harness runs each script's module import under `python -X importtime`
+# and fails when the cumulative import time exceeds its budget, or when a
+# heavy library that should only be loaded on demand shows up at import.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Budgets are cumulative import time of the module itself, in milliseconds.
+BUDGETS_MS = {
+    "audio_analysis": 150,
+    "audio_separator": 400,
+    "mediapipe_audio_classifier": 400,
+}
+
+# Modules that must only be imported inside the analysis path that needs them.
+LAZY_MODULES = [
+    "librosa",
+    "matplotlib",
+    "plotly",
+    "torch",
+    "torchaudio",
+    "demucs",
+    "tensorflow",
+    "mediapipe",
+    "pyannote",
+]
+
+
+def parse_importtime(stderr_text):
+    """
+    Parses `-X importtime` output into a list of (module_name, cumulative_us, depth)
+    in the order the interpreter reports them (children before their parent).
+    """
+    modules = []
+    for line in stderr_text.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            cumulative_us = int(parts[1].strip())
+        except ValueError:
+            # Header row ("self [us] | cumulative | imported package")
+            continue
+        name = parts[2].rstrip()
+        # Nesting is shown as one leading space plus two per level.
+        indent = len(name) - len(name.lstrip())
+        modules.append((name.strip(), cumulative_us, indent // 2 + 1))
+    return modules
+
+
+def measure_import(module_name, python_exe=None):
+    """
+    Imports `module_name` in a fresh interpreter with `-X importtime`.
+    Returns a dict with the cumulative time, the heaviest imports and any
+    lazy-only modules that were loaded eagerly.
+    """
+    cmd = [
+        python_exe or sys.executable, "-X", "importtime",
+        "-c", f"import {module_name}",
+    ]
+    proc = subprocess.run(cmd, cwd=SCRIPT_DIR, capture_output=True, text=True)
+    modules = parse_importtime(proc.stderr)
+
+    # The script is the last top-level entry; its direct children are the
+    # depth-2 entries reported since the previous top-level import.
+    total_us = 0
+    children = []
+    for idx in range(len(modules) - 1, -1, -1):
+        name, cumulative_us, depth = modules[idx]
+        if name == module_name and depth == 1:
+            total_us = cumulative_us
+            for child, child_us, child_depth in reversed(modules[:idx]):
+                if child_depth == 1:
+                    break
+                if child_depth == 2:
+                    children.append((child, child_us))
+            break
+    heaviest = sorted(children, key=lambda x: x[1], reverse=True)[:5]
+    eager = sorted({
+        lazy for lazy in LAZY_MODULES
+        for name, _, _ in modules
+        if name == lazy or name.startswith(lazy + ".")
+    })
+
+    return {
+        "module": module_name,
+        "ok": proc.returncode == 0,
+        "error": proc.stderr.strip().splitlines()[-1] if proc.returncode != 0 and proc.stderr.strip() else None,
+        "importMs": round(total_us / 1000.0, 1),
+        "heaviest": [{"module": n, "ms": round(c / 1000.0, 1)} for n, c in heaviest],
+        "eagerHeavyModules": eager,
+    }
+
+
+def check_budgets(budgets=None, python_exe=None):
+    budgets = budgets or BUDGETS_MS
+    report = []
+    failed = False
+    for module_name, budget_ms in budgets.items():
+        result = measure_import(module_name, python_exe)
+        result["budgetMs"] = budget_ms
+        result["withinBudget"] = (
+            result["ok"]
+            and result["importMs"] <= budget_ms
+            and not result["eagerHeavyModules"]
+        )
+        failed = failed or not result["withinBudget"]
+        report.append(result)
+    return {"status": "success" if not failed else "over_budget", "results": report}
+
+
+if __name__ == "__main__":
+    # Usage: python import_budget.py [module[=budget_ms] ...]
+    budgets = None
+    if len(sys.argv) > 1:
+        budgets = {}
+        for arg in sys.argv[1:]:
+            name, _, budget = arg.partition("=")
+            budgets[name] = float(budget) if budget else BUDGETS_MS.get(name, 400)
+
+    output = check_budgets(budgets)
+    for r in output["results"]:
+        flag = "OK  " if r["withinBudget"] else "FAIL"
+        print(f"[{flag}] {r['module']}: {r['importMs']} ms (budget {r['budgetMs']} ms)", file=sys.stderr)
+        if r["eagerHeavyModules"]:
+            print(f"       eagerly imports: {', '.join(r['eagerHeavyModules'])}", file=sys.stderr)
+        if r["error"]:
+            print(f"       import failed: {r['error']}", file=sys.stderr)
+
+    sys.stdout.write(json.dumps(output))
+    sys.stdout.flush()
+    sys.exit(0 if output["status"] == "success" else 1)
@@ -0,0 +1,179 @@
+import sys
+import os
+import json
+import time
+import numpy as np
+import scipy.fft
+
+from audio_io import to_mono_float
+
+# ================================
+# Impulsive Event Detector
+# ================================
+# Gunshots, slams and glass breaks are short broadband bursts that a 0.975 s
+# YAMNet frame can easily average away. This detector runs over the whole file
+# far faster than real time and proposes candidate timestamps:
+#
+#   - log-compressed magnitude spectra on a 5 ms hop (one batched rfft per block
+#     of a memory-mapped file)
+#   - spectral flux: the summed positive change per frame above LOW_CUT_HZ
+#   - an adaptive threshold: running median of the flux plus K robust
+#     deviations, with an absolute level floor so silence cannot trigger
+#
+# The classifier can then run dense, centred windows at the candidates only
+# (mediapipe_audio_classifier.py --impulses) instead of everywhere.
+
+HOP_SEC = 0.005
+FRAME_SEC = 0.02
+BLOCK_SECONDS = 60
+LOG_GAMMA = 100.0
+LOW_CUT_HZ = 200.0
+MEDIAN_SEC = 1.0
+THRESHOLD_K = 6.0
+MIN_LEVEL_DB = -55.0
+MIN_GAP_SEC = 0.1
+# Window centres around each candidate, in seconds (YAMNet windows are 0.975 s)
+WINDOW_OFFSETS = (-0.2, 0.0, 0.2)
+
+
+def onset_strength(audio, sr, hop_sec=HOP_SEC, frame_sec=FRAME_SEC):
+    """
+    Spectral flux and frame level (dBFS) on a `hop_sec` grid, computed block
+    by block. Returns (flux, level_db, hop_samples).
+    """
+    hop = max(1, int(round(hop_sec * sr)))
+    n_fft = 1 << int(np.ceil(np.log2(max(2, frame_sec * sr))))
+    n_frames = max(0, 1 + (len(audio) - n_fft) // hop)
+    flux = np.zeros(n_frames, dtype=np.float32)
+    level = np.zeros(n_frames, dtype=np.float32)
+    window = np.hanning(n_fft).astype(np.float32)
+    low_bin = int(LOW_CUT_HZ * n_fft / sr)
+
+    previous = None
+    per_block = max(1, int(BLOCK_SECONDS * sr) // hop)
+    for first in range(0, n_frames, per_block):
+        last = min(n_frames, first + per_block)
+        block = to_mono_float(audio[first * hop:(last - 1) * hop + n_fft])
+        frames = np.lib.stride_tricks.sliding_window_view(block, n_fft)[::hop]
+        level[first:last] = 10 * np.log10(np.einsum("ij,ij->i", frames, frames) / n_fft + 1e-12)
+        compressed = np.log1p(LOG_GAMMA * np.abs(scipy.fft.rfft(frames * window, axis=1, workers=-1)[:, low_bin:]))
+        # Carry the last spectrum across blocks so the difference is seamless
+        reference = np.concatenate([compressed[:1] if previous is None else previous, compressed[:-1]])
+        flux[first:last] = np.maximum(compressed - reference, 0.0).mean(axis=1)
+        previous = compressed[-1:]
+    return flux, level, hop
+
+
+def adaptive_threshold(flux, hop_sec=HOP_SEC, k=THRESHOLD_K):
+    """Running median plus k scaled median absolute deviations of the whole flux curve."""
+    from scipy.ndimage import median_filter
+    if not len(flux):
+        return flux
+    size = max(3, int(MEDIAN_SEC / hop_sec) | 1)
+    # Running median on a decimated curve: the baseline only needs to follow slow changes
+    step = max(1, size // 20)
+    baseline = median_filter(flux[::step], size=max(3, size // step | 1), mode="nearest")
+    baseline = np.repeat(baseline, step)[:len(flux)]
+    spread = 1.4826 * np.median(np.abs(flux - np.median(flux))) + 1e-6
+    return baseline + k * spread
+
+
+def detect_impulses(audio, sr, k=THRESHOLD_K, min_level_db=MIN_LEVEL_DB, min_gap=MIN_GAP_SEC):
+    """Candidate impulses as [{time, strength, flux, levelDb}], in time order."""
+    from scipy.signal import find_peaks
+    flux, level, hop = onset_strength(audio, sr)
+    hop_sec = hop / float(sr)
+    threshold = adaptive_threshold(flux, hop_sec, k)
+    peaks, _ = find_peaks(flux, distance=max(1, int(min_gap / hop_sec)))
+    # Level over the next few frames: the burst follows the flux peak
+    ahead = np.lib.stride_tricks.sliding_window_view(np.pad(level, (0, 3), mode="edge"), 4).max(axis=1) if len(level) else level
+    keep = peaks[(flux[peaks] > threshold[peaks]) & (ahead[peaks] > min_level_db)]
+    return [
+        {
+            "time": round(float(i * hop_sec), 3),
+            "strength": round(float(flux[i] / threshold[i]), 2),
+            "flux": round(float(flux[i]), 4),
+            "levelDb": round(float(ahead[i]), 1),
+        }
+        for i in keep
+    ]
+
+
+def classify_candidates(wav_data, sample_rate, candidates, interpreter, categories, class_to_category,
+                        score_threshold, offsets=WINDOW_OFFSETS):
+    """
+    YAMNet on windows centred at each candidate (plus `offsets`), one batched
+    run for all of them. Each candidate takes the best-scoring window.
+    Returns soundEvents-style entries for candidates above `score_threshold`.
+    """
+    from windowed_inference import to_yamnet_input, run_batched, WINDOW_SAMPLES, YAMNET_SAMPLE_RATE
+    if not candidates:
+        return []
+    wav = to_yamnet_input(wav_data, sample_rate)
+    half = WINDOW_SAMPLES // 2
+    padded = np.pad(wav, (half, half))
+    centres = np.array([[c["time"] + o for o in offsets] for c in candidates])
+    starts = np.clip(np.round(centres * YAMNET_SAMPLE_RATE).astype(int), 0, len(wav))
+    # Strided view of every window start in the padded signal, gathered in one go
+    windows = np.lib.stride_tricks.sliding_window_view(padded, WINDOW_SAMPLES)[starts.ravel()]
+    scores = run_batched(interpreter, windows).reshape(len(candidates), len(offsets), -1)
+
+    top = scores.argmax(axis=2)
+    best = np.take_along_axis(scores, top[..., None], axis=2)[..., 0]
+    which = best.argmax(axis=1)
+    events = []
+    for i, candidate in enumerate(candidates):
+        score = float(best[i, which[i]])
+        if score < score_threshold:
+            continue
+        events.append({
+            "time": round(candidate["time"], 2),
+            "type": categories[class_to_category[top[i, which[i]]]],
+            "confidence": round(score, 4),
+            "decibels": candidate["levelDb"],
+            "impulse": {"strength": candidate["strength"], "windowOffset": offsets[which[i]]},
+        })
+    return events
+
+
+def scan_file(audio_path, k=THRESHOLD_K):
+    started = time.perf_counter()
+    converted_path = None
+    try:
+        from scipy.io import wavfile
+        audio_path = audio_path.strip('"')
+        try:
+            sr, audio = wavfile.read(audio_path, mmap=True)
+        except Exception:
+            from mediapipe_audio_classifier import convert_to_wav
+            converted_path = convert_to_wav(audio_path)
+            sr, audio = wavfile.read(converted_path, mmap=True)
+
+        candidates = detect_impulses(audio, sr, k=k)
+        elapsed = time.perf_counter() - started
+        duration = len(audio) / float(sr)
+        return {
+            "status": "success",
+            "duration": round(duration, 2),
+            "candidateCount": len(candidates),
+            "candidates": candidates,
+            "elapsedSec": round(elapsed, 2),
+            "realtimeFactor": round(duration / elapsed, 1) if elapsed > 0 else None,
+        }
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+    finally:
+        if converted_path and converted_path != audio_path and os.path.exists(converted_path):
+            os.unlink(converted_path)
+
+
+if __name__ == "__main__":
+    # Usage: impulse.py <audio> [--k=6.0]
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    options = dict(a[2:].partition("=")[::2] for a in sys.argv[1:] if a.startswith("--"))
+    if args:
+        output = scan_file(args[0], k=float(options.get("k") or THRESHOLD_K))
+    else:
+        output = {"status": "error", "message": "No input"}
+    sys.stdout.write(json.dumps(output))
+    sys.stdout.flush()
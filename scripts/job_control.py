@@ -0,0 +1,72 @@
+import os
+import time
+
+# ================================
+# Cooperative Job Control
+# ================================
+# The API's scheduler (lib/cpu-scheduler.ts) gives every Python job a control
+# file and passes its path in FORENSIC_JOB_CONTROL. The file holds one word:
+#
+#   run      keep going (also the meaning of a missing or empty file)
+#   pause    preempted by interactive work: stop at the next checkpoint and
+#            wait, holding no CPU, until the word changes
+#   cancel   stop at the next checkpoint
+#
+# Long loops call checkpoint() between segments. Reads are throttled, so it
+# can sit in per-frame loops. Without the env var every call is a no-op.
+#
+# The "paused" message emitted on stopping is the job's acknowledgement: the
+# scheduler keeps the job's threads counted until it arrives, and the API
+# stops the job's run-time limit until "resumed".
+
+ENV_VAR = "FORENSIC_JOB_CONTROL"
+CHECK_INTERVAL = 0.25
+PAUSE_POLL = 0.25
+
+_STATE = {"path": None, "last_check": 0.0}
+
+
+class JobCancelled(Exception):
+    """Raised at a checkpoint after the scheduler asked the job to stop."""
+
+
+def control_path():
+    if _STATE["path"] is None:
+        _STATE["path"] = os.environ.get(ENV_VAR, "")
+    return _STATE["path"]
+
+
+def read_command():
+    path = control_path()
+    if not path:
+        return "run"
+    try:
+        with open(path, "r") as f:
+            return f.read().strip().lower() or "run"
+    except OSError:
+        return "run"
+
+
+def checkpoint(stage=None, force=False):
+    """
+    Returns immediately unless the scheduler asked for a pause or a cancel.
+    Pauses block here until resumed; cancels raise JobCancelled.
+    """
+    if not control_path():
+        return
+    now = time.monotonic()
+    if not force and now - _STATE["last_check"] < CHECK_INTERVAL:
+        return
+    _STATE["last_check"] = now
+
+    command = read_command()
+    if command == "pause":
+        from progress import emit
+        emit("paused", stage=stage)
+        paused_at = time.monotonic()
+        while command == "pause":
+            time.sleep(PAUSE_POLL)
+            command = read_command()
+        emit("resumed", stage=stage, pausedSec=round(time.monotonic() - paused_at, 2))
+    if command == "cancel":
+        raise JobCancelled(f"Cancelled by scheduler{f' during {stage}' if stage else ''}")
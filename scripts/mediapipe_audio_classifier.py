@@ -6,6 +6,7 @@ import os
 import warnings
 import tempfile
 import subprocess
+import contextlib
 from scipy.io import wavfile
 
 # Silence all background noise from TensorFlow/MediaPipe
@@ -19,51 +20,10 @@ def get_yamnet_model_path():
         raise FileNotFoundError(f"YAMNet model missing at {model_path}")
     return model_path
 
-def map_to_forensic_category(mediapipe_category):
-    mapping = {
-        "Speech": "Human Voice",
-        "Singing": "Human Voice",
-        "Male speech": "Male Voice",
-        "Female speech": "Female Voice",
-        "Music": "Musical Content",
-        "Vehicle": "Vehicle Sound",
-        "Car": "Vehicle Sound",
-        "Bus": "Vehicle Sound",
-        "Truck": "Vehicle Sound",
-        "Motorcycle": "Vehicle Sound",
-        "Footsteps": "Footsteps",
-        "Animal": "Animal Signal",
-        "Dog": "Animal Signal",
-        "Cat": "Animal Signal",
-        "Bird": "Animal Signal",
-        "Wind": "Atmospheric Wind",
-        "Thunder": "Atmospheric Wind",
-        "Breeze": "Atmospheric Wind",
-        "Silence": "Silence",
-        # NEW FORENSIC CATEGORIES
-        "Gunshot": "Gunshot / Explosion",
-        "Explosion": "Gunshot / Explosion",
-        "Cap gun": "Gunshot / Explosion",
-        "Fusillade": "Gunshot / Explosion",
-        "Artillery": "Gunshot / Explosion",
-        "Screaming": "Scream / Aggression",
-        "Shout": "Scream / Aggression",
-        "Yell": "Scream / Aggression",
-        "Siren": "Siren / Alarm",
-        "Alarm": "Siren / Alarm",
-        "Buzzer": "Siren / Alarm",
-        "Glass": "Impact / Breach",
-        "Shatter": "Impact / Breach",
-        "Smash": "Impact / Breach",
-        "Hammer": "Impact / Breach",
-        "Door": "Impact / Breach",
-        "Knock": "Impact / Breach",
-        "Slam": "Impact / Breach"
-    }
-    for key, value in mapping.items():
-        if key.lower() in mediapipe_category.lower():
-            return value
-    return mediapipe_category
+def map_to_forensic_category(mediapipe_category, profile=None):
+    """Name-based mapping; per-frame code should use the compiled lookup instead."""
+    from forensic_categories import load_profile, match_category
+    return match_category(mediapipe_category, load_profile(profile))
 
 def convert_to_wav(input_path):
     """
@@ -92,8 +52,187 @@ def convert_to_wav(input_path):
         # If conversion fails, return original (and hope for best)
         return input_path
 
-def classify_audio(audio_path, job_id):
+# Length of one YAMNet frame in seconds
+FRAME_DURATION = 0.975
+SCORE_THRESHOLD = 0.05
+NUM_CLASSES = 521
+# Inference runs in blocks about this long so pause/cancel requests are honoured between them
+CHECKPOINT_SECONDS = 30
+
+def compact_events(events, frame_duration=FRAME_DURATION, flicker_frames=1, priority=None):
+    """
+    Merges consecutive per-frame events of the same forensic category into
+    segments. Runs of at most `flicker_frames` frames of another category that
+    sit between two runs of the same category are absorbed (hysteresis), so a
+    single misclassified frame does not split a long segment. Runs of a
+    `priority` category (default PRIORITY_CATEGORIES) are never absorbed, and
+    absorbed frames are listed in the segment's "absorbedEvents".
+    """
+    if priority is None:
+        from forensic_categories import PRIORITY_CATEGORIES
+        priority = PRIORITY_CATEGORIES
+    # 1. Group contiguous frames of the same type into runs
+    runs = []
+    for event in events:
+        t = float(event["time"])
+        last = runs[-1] if runs else None
+        contiguous = last is not None and t - last["frames"][-1]["time"] <= frame_duration * 1.5
+        if contiguous and last["type"] == event["type"]:
+            last["frames"].append(event)
+        else:
+            runs.append({"type": event["type"], "contiguous": contiguous, "frames": [event]})
+
+    # 2. Absorb short flicker runs sandwiched between runs of one category
+    merged = []
+    i = 0
+    while i < len(runs):
+        run = runs[i]
+        if (
+            merged and i + 1 < len(runs)
+            and len(run["frames"]) <= flicker_frames
+            and run["type"] not in priority
+            and run["contiguous"] and runs[i + 1]["contiguous"]
+            and merged[-1]["type"] == runs[i + 1]["type"]
+        ):
+            merged[-1]["absorbed"] = merged[-1].get("absorbed", []) + run["frames"]
+            merged[-1]["frames"] = merged[-1]["frames"] + runs[i + 1]["frames"]
+            i += 2
+            continue
+        merged.append(run)
+        i += 1
+
+    # 3. Summarize each run as a segment
+    segments = []
+    for run in merged:
+        frames = run["frames"]
+        absorbed = run.get("absorbed", [])
+        confidences = [f["confidence"] for f in frames]
+        start = float(frames[0]["time"])
+        end = max(float(f["time"]) for f in frames + absorbed) + frame_duration
+        segment = {
+            "time": round(start, 2),
+            "start": round(start, 2),
+            "end": round(end, 2),
+            "type": run["type"],
+            "confidence": round(sum(confidences) / len(confidences), 4),
+            "maxConfidence": round(max(confidences), 4),
+            "decibels": round(sum(f["decibels"] for f in frames) / len(frames), 1),
+            "frameCount": len(frames) + len(absorbed),
+        }
+        if absorbed:
+            segment["absorbedEvents"] = [
+                {"time": round(float(f["time"]), 2), "type": f["type"], "confidence": round(f["confidence"], 4)}
+                for f in absorbed
+            ]
+        segments.append(segment)
+    return segments
+
+def _mediapipe_frames(classifier, containers, span_wav, sample_rate, want_rows):
+    """
+    Yields (offset_sec, class_id, score, score_row) for each 0.975 s MediaPipe
+    frame. The span is classified in blocks of whole frames about
+    CHECKPOINT_SECONDS long, with a checkpoint before each block.
+    """
+    from job_control import checkpoint
+    block_frames = max(1, int(round(CHECKPOINT_SECONDS / FRAME_DURATION)))
+    block = max(1, int(round(block_frames * FRAME_DURATION * sample_rate)))
+    for block_index, block_start in enumerate(range(0, len(span_wav), block)):
+        checkpoint("classify", force=True)
+        audio_clip = containers.AudioData.create_from_array(
+            span_wav[block_start:block_start + block].astype(np.float32), sample_rate)
+        for idx, res in enumerate(classifier.classify(audio_clip)):
+            offset = (block_index * block_frames + idx) * FRAME_DURATION
+            row = None
+            if want_rows:
+                row = np.zeros(NUM_CLASSES, dtype=np.float16)
+                if res.classifications:
+                    for cat in res.classifications[0].categories:
+                        row[cat.index] = cat.score
+            if res.classifications and res.classifications[0].categories:
+                top = res.classifications[0].categories[0]
+                yield offset, top.index, top.score, row
+            else:
+                yield offset, -1, 0.0, row
+
+def _windowed_frames(span_wav, sample_rate, hop):
+    """
+    Yields (offset_sec, class_id, score, score_row) on a `hop`-second grid.
+    The span is scored in blocks of about CHECKPOINT_SECONDS, with a
+    checkpoint before each; every block carries one window of context either
+    side so frames at its edges aggregate the same windows as a single pass.
+    """
+    from math import gcd, ceil
+    from windowed_inference import classify_windows, WINDOW_SAMPLES, YAMNET_SAMPLE_RATE
+    from thread_budget import thread_budget
+    from job_control import checkpoint
+    # Block edges fall on whole hops that are also whole samples at both rates,
+    # so every block continues the single-pass grid exactly
+    hop_samples = max(1, int(round(hop * YAMNET_SAMPLE_RATE)))
+    step = YAMNET_SAMPLE_RATE // gcd(int(sample_rate), YAMNET_SAMPLE_RATE)
+    unit = hop_samples * step // gcd(hop_samples, step)
+    unit_in = unit * int(sample_rate) // YAMNET_SAMPLE_RATE
+    block = unit_in * max(1, int(round(CHECKPOINT_SECONDS * YAMNET_SAMPLE_RATE / unit)))
+    # One window plus 0.1 s for the resampling filter to settle
+    context = unit_in * int(ceil((WINDOW_SAMPLES + YAMNET_SAMPLE_RATE // 10) / float(unit)))
+    block_hops = block * YAMNET_SAMPLE_RATE // int(sample_rate) // hop_samples
+    for block_start in range(0, len(span_wav), block):
+        checkpoint("classify", force=True)
+        lo = max(0, block_start - context)
+        hi = min(len(span_wav), block_start + block + context)
+        scores, times = classify_windows(span_wav[lo:hi], sample_rate, get_yamnet_model_path(), hop=hop,
+                                         num_threads=thread_budget())
+        first = (block_start - lo) * YAMNET_SAMPLE_RATE // int(sample_rate) // hop_samples
+        last = first + block_hops if block_start + block < len(span_wav) else len(times)
+        top = scores.argmax(axis=1)
+        for i in range(first, min(last, len(times))):
+            yield lo / float(sample_rate) + float(times[i]), int(top[i]), float(scores[i, top[i]]), scores[i]
+
+_CLASSIFIERS = {}
+
+def get_classifier(full_scores=False):
+    """
+    Returns a MediaPipe AudioClassifier that stays open for the life of the
+    process, so repeated classify_audio calls skip model loading.
+    """
+    if full_scores not in _CLASSIFIERS:
+        from mediapipe.tasks import python
+        from mediapipe.tasks.python import audio
+
+        # Keeping the full score matrix needs every class for every frame
+        options = audio.AudioClassifierOptions(
+            base_options=python.BaseOptions(model_asset_path=get_yamnet_model_path()),
+            max_results=-1 if full_scores else 5,
+            score_threshold=0.0 if full_scores else SCORE_THRESHOLD
+        )
+        _CLASSIFIERS[full_scores] = audio.AudioClassifier.create_from_options(options)
+    return _CLASSIFIERS[full_scores]
+
+def _multichannel_info(events, channel_data, sample_rate, mic_spacing=None):
+    """
+    Per-channel features and events in one batched pass, and GCC-PHAT delays
+    (plus angles when the mic spacing is known) attached to each event.
+    """
+    from multichannel import channel_features, channel_events, annotate_events
+    from progress import progress
+    progress("multichannel", 0)
+    features = channel_features(channel_data, sample_rate)
+    per_channel = channel_events(features, sample_rate)
+    annotate_events(events, channel_data, sample_rate, spacing=mic_spacing)
+    progress("multichannel", 100)
+    return {
+        "channels": int(channel_data.shape[1]),
+        "referenceChannel": 0,
+        "micSpacing": mic_spacing,
+        "channelLevelsDb": [round(float(v), 1) for v in 10 * np.log10(features["energy"].mean(axis=1) + 1e-12)],
+        "channelEventCounts": [len(e) for e in per_channel],
+        "channelEvents": per_channel,
+    }
+
+def classify_audio(audio_path, job_id, use_vad=False, per_frame=False, scores_path=None, profile=None, hop=None,
+                   multichannel=False, mic_spacing=None, impulses=False):
+    from job_control import JobCancelled, checkpoint
     converted_path = None
+    events = []
     try:
         # Handle quoted paths if passed
         audio_path = audio_path.strip('"')
@@ -112,69 +251,211 @@ def classify_audio(audio_path, job_id):
             except Exception as e:
                 return {"status": "error", "message": f"Error reading wav file: {str(e)}"}
         
+        # Keep the channels apart for the multichannel pass; YAMNet gets the mono mix
+        channel_data = wav_data if multichannel and wav_data.ndim > 1 and wav_data.shape[1] > 1 else None
+
         # Normalize and convert to mono
         if wav_data.dtype == np.int16:
             wav_data = wav_data.astype(float) / 32768.0
         if len(wav_data.shape) > 1:
             wav_data = np.mean(wav_data, axis=1)
 
-        # Import MediaPipe inside function to keep startup silent
-        from mediapipe.tasks import python
-        from mediapipe.tasks.python.components import containers
-        from mediapipe.tasks.python import audio
+        score_rows = []
+        score_times = []
 
-        options = audio.AudioClassifierOptions(
-            base_options=python.BaseOptions(model_asset_path=get_yamnet_model_path()),
-            max_results=5,
-            score_threshold=0.05
-        )
+        # Thread grant from the scheduler (TFLite gets it on the --hop path;
+        # the MediaPipe task API has no thread setting of its own)
+        from thread_budget import apply_thread_budget
+        thread_info = apply_thread_budget()
+
+        # Class id -> forensic category, compiled once for the chosen profile
+        from forensic_categories import build_lookup
+        categories, class_to_category = build_lookup(profile)
         
-        with audio.AudioClassifier.create_from_options(options) as classifier:
-            audio_clip = containers.AudioData.create_from_array(wav_data.astype(np.float32), sample_rate)
-            results = classifier.classify(audio_clip)
-            
+        # Optionally skip silence/ambient noise and only classify active spans
+        vad_info = None
+        if use_vad:
+            from vad import detect_active_regions, region_sample_bounds
+            vad_info = detect_active_regions(wav_data, sample_rate)
+            spans = list(region_sample_bounds(vad_info["regions"], sample_rate, len(wav_data)))
+            print(f"[VAD] Skipping {vad_info['skippedSeconds']}s of {vad_info['duration']}s", file=sys.stderr)
+        else:
+            spans = [(0, len(wav_data))]
+
+        if impulses:
+            # Dense classification only at impulse candidates (centred windows)
+            frame_duration = FRAME_DURATION
+            classifier_ctx = contextlib.nullcontext()
+            per_frame = True
+            print("--- Running Model: YAMNet / TFLite (impulse candidates) ---", file=sys.stderr)
+        elif hop:
+            # Overlapping windows on a finer grid, batched straight through TFLite
+            frame_duration = float(hop)
+            classifier_ctx = contextlib.nullcontext()
+            print(f"--- Running Model: YAMNet / TFLite (hop {frame_duration}s) ---", file=sys.stderr)
+        else:
+            # Import MediaPipe inside function to keep startup silent
+            from mediapipe.tasks.python.components import containers
+
+            frame_duration = FRAME_DURATION
+            classifier_ctx = contextlib.nullcontext(get_classifier(bool(scores_path)))
             print("--- Running Model: YAMNet / MediaPipe ---", file=sys.stderr)
-            
+
+        # Progress and per-frame events are streamed when --ndjson is on
+        from progress import EventBatcher, progress
+        batcher = EventBatcher()
+        total_samples = max(1, sum(end - start for start, end in spans))
+        done_samples = 0
+        progress("classify", 0, frameDuration=frame_duration)
+
+        impulse_info = None
+        with classifier_ctx as classifier:
             events = []
-            for idx, res in enumerate(results):
-                if res.classifications:
-                    top = res.classifications[0].categories[0]
-                    forensic_cat = map_to_forensic_category(top.category_name)
-                    confidence = round(top.score, 4)
-                    decibels = round(-60 + (top.score * 60), 1)
-                    time_sec = round(idx * 0.975, 2)
-                    
-                    print(f"[YAMNet] Time: {time_sec}s | Class: {forensic_cat} | Confidence: {confidence} | Vol: {decibels}dB", file=sys.stderr)
-                    
-                    events.append({
-                        "time": time_sec,
-                        "type": forensic_cat,
-                        "confidence": confidence,
-                        "decibels": decibels
-                    })
+            if impulses:
+                from impulse import detect_impulses, classify_candidates
+                from windowed_inference import load_interpreter
+                from thread_budget import thread_budget
+                candidates = []
+                for span_start, span_end in spans:
+                    for candidate in detect_impulses(wav_data[span_start:span_end], sample_rate):
+                        candidate["time"] = round(candidate["time"] + span_start / float(sample_rate), 3)
+                        candidates.append(candidate)
+                progress("classify", 50, candidates=len(candidates))
+                events = classify_candidates(
+                    wav_data, sample_rate, candidates,
+                    load_interpreter(get_yamnet_model_path(), thread_budget()),
+                    categories, class_to_category, SCORE_THRESHOLD,
+                )
+                for event in events:
+                    batcher.add(event)
+                impulse_info = {"candidates": len(candidates), "classified": len(events)}
+                print(f"[Impulse] {len(candidates)} candidates, {len(events)} classified", file=sys.stderr)
+                spans = []
+            for span_start, span_end in spans:
+                span_offset = span_start / float(sample_rate)
+                span_wav = wav_data[span_start:span_end]
+                if hop:
+                    frames = _windowed_frames(span_wav, sample_rate, frame_duration)
+                else:
+                    frames = _mediapipe_frames(classifier, containers, span_wav, sample_rate, bool(scores_path))
+
+                for offset, class_id, score, row in frames:
+                    checkpoint("classify")
+                    progress("classify", 100.0 * min(1.0, (done_samples + offset * sample_rate) / total_samples))
+                    if scores_path:
+                        score_rows.append(row)
+                        score_times.append(span_offset + offset)
+
+                    if class_id >= 0 and score >= SCORE_THRESHOLD:
+                        forensic_cat = categories[class_to_category[class_id]]
+                        confidence = round(float(score), 4)
+                        decibels = round(-60 + (float(score) * 60), 1)
+                        time_sec = round(span_offset + offset, 2)
+
+                        print(f"[YAMNet] Time: {time_sec}s | Class: {forensic_cat} | Confidence: {confidence} | Vol: {decibels}dB", file=sys.stderr)
+
+                        event = {
+                            "time": time_sec,
+                            "type": forensic_cat,
+                            "confidence": confidence,
+                            "decibels": decibels
+                        }
+                        if hop:
+                            event["end"] = round(span_offset + offset + frame_duration, 2)
+                        events.append(event)
+                        batcher.add(event)
+                done_samples += span_end - span_start
             
+            batcher.flush()
+            progress("classify", 100)
             print("--- Classification Complete ---", file=sys.stderr)
 
             # clean up temp converted file
             if converted_path and converted_path != audio_path and os.path.exists(converted_path):
                 os.unlink(converted_path)
 
-            return {
+            score_info = None
+            if scores_path:
+                from score_matrix import save_score_matrix
+                matrix = np.stack(score_rows) if score_rows else np.zeros((0, NUM_CLASSES), dtype=np.float16)
+                score_info = save_score_matrix(scores_path, matrix, score_times)
+                score_info["frameDuration"] = frame_duration
+
+            # Segments are the default view; per-frame events only on request
+            if not per_frame:
+                frame_count = len(events)
+                events = compact_events(events, frame_duration=frame_duration)
+
+            output = {
                 "status": "success",
                 "jobID": job_id,
+                "eventMode": "impulses" if impulses else "frames" if per_frame else "segments",
+                "frameDuration": frame_duration,
                 "detectedSounds": len(events),
                 "soundEvents": events
             }
+            if not per_frame:
+                output["frameCount"] = frame_count
+            if vad_info is not None:
+                output["vad"] = vad_info
+            if impulse_info is not None:
+                output["impulses"] = impulse_info
+            if score_info is not None:
+                output["scoreMatrix"] = score_info
+            if thread_info["threads"]:
+                output["threads"] = thread_info
+            if channel_data is not None:
+                output["multichannel"] = _multichannel_info(events, channel_data, sample_rate, mic_spacing)
+            return output
             
+    except JobCancelled as e:
+        if converted_path and os.path.exists(converted_path):
+            os.unlink(converted_path)
+        return {"status": "cancelled", "jobID": job_id, "message": str(e),
+                "eventMode": "frames", "detectedSounds": len(events), "soundEvents": events}
     except Exception as e:
         if converted_path and os.path.exists(converted_path):
             os.unlink(converted_path)
         return {"status": "error", "message": str(e)}
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
+    # Positional: <audio_path> [job_id]
+    # Flags: --vad, --frames (per-frame events), --scores[=path] (save full score matrix),
+    #        --profile=name|path (category mapping profile),
+    #        --hop=SECONDS (overlapping windows on a finer grid, e.g. --hop=0.25)
+    #        --triage[=SECONDS] (sampled category-presence summary within a time budget)
+    #        --impulses (impulse detector first, then YAMNet only on windows centred at candidates)
+    #        --multichannel[=SPACING_M] (per-channel levels/events and inter-channel delays per event)
+    #        --ndjson (stream progress/events as JSON lines, then a final "result" line)
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    options = dict(a[2:].partition("=")[::2] for a in sys.argv[1:] if a.startswith("--"))
+    import progress
+    if "ndjson" in options:
+        progress.enable()
+    if len(args) > 0 and "triage" in options:
+        from triage import triage_audio, DEFAULT_BUDGET
+        output = triage_audio(
+            args[0], args[1] if len(args) > 1 else "job",
+            budget=float(options["triage"] or DEFAULT_BUDGET),
+            profile=options.get("profile") or None,
+        )
+        progress.write_result(output)
+    elif len(args) > 0:
+        scores_path = None
+        if "scores" in options:
+            scores_path = options["scores"].strip('"') or os.path.splitext(args[0].strip('"'))[0] + ".scores.npy"
         # We use sys.stdout.write to ensure no extra newlines are added
-        output = classify_audio(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else "job")
-        sys.stdout.write(json.dumps(output))
+        output = classify_audio(
+            args[0], args[1] if len(args) > 1 else "job",
+            use_vad="vad" in options,
+            per_frame="frames" in options,
+            scores_path=scores_path,
+            profile=options.get("profile") or None,
+            hop=float(options["hop"]) if options.get("hop") else None,
+            multichannel="multichannel" in options,
+            impulses="impulses" in options,
+            mic_spacing=float(options["multichannel"]) if options.get("multichannel") else None,
+        )
+        progress.write_result(output)
     else:
-        sys.stdout.write(json.dumps({"status": "error", "message": "No input"}))
\ No newline at end of file
+        progress.write_result({"status": "error", "message": "No input"})
\ No newline at end of file
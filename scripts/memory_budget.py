@@ -0,0 +1,340 @@
+import sys
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+import importlib.util
+
+# ================================
+# Peak-Memory Budget Check
+# ================================
+# Long recordings are where jobs get OOM-killed, and one extra full-length
+# copy of the audio (a second wavfile.read, another zeros_like) is enough to
+# tip a stage over. This harness runs each engine stage on synthetic inputs
+# of DURATIONS_MIN minutes, each in a fresh interpreter, and records:
+#
+#   heapBytes   peak of Python + numpy allocations (tracemalloc) during the stage
+#   anonBytes   peak growth of anonymous RSS (RssAnon, sampled every
+#               RSS_SAMPLE_SEC) during the stage: sees torch/native buffers
+#               that tracemalloc does not, and ignores memory-mapped input
+#   hwmBytes    the process's total peak RSS (VmHWM / ru_maxrss), for reference
+#
+# Setup (imports, model load) happens before measuring starts. A stage is over
+# budget when its checked measure exceeds fixed + perSecond * seconds of audio:
+# `perSecond` is the declared cost of each second of audio, `fixed` covers
+# block buffers and models that do not grow with duration. Stages whose
+# libraries are not installed are reported as skipped.
+#
+# A stage measured alone misses arrays that outlive it (the decoded input
+# still held while masking, Demucs output still alive after the stems are
+# written), so `pipeline` runs separate_audio end to end as a job does.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DURATIONS_MIN = [10, 60]
+SAMPLE_RATE = 44100
+CHANNELS = 2
+RSS_SAMPLE_SEC = 0.02
+MB = 1 << 20
+
+# Per stage: required modules, measure checked against the budget, and the
+# budget itself. The test input is 16-bit stereo at 44.1 kHz (176 400 B/s),
+# so one float32 stereo copy of it costs 352 800 B/s.
+STAGES = {
+    # wavfile.read (int16) + float32 conversion in place: 529 200 B/s
+    "decode": {"requires": ["scipy"], "measure": "heapBytes", "fixed": 16 * MB, "perSecond": 600_000},
+    # wavfile.read + float64 mono mix + YAMNet frames
+    "classify": {"requires": ["scipy", "mediapipe"], "measure": "anonBytes", "fixed": 400 * MB, "perSecond": 1_600_000},
+    # decode + Demucs input tensor + (sources, channels, samples) output
+    "separate": {"requires": ["scipy", "torch", "torchaudio", "demucs"], "measure": "anonBytes", "fixed": 1500 * MB, "perSecond": 4_000_000},
+    # Masking with a decoded float32 copy still alive (the worst case inside
+    # separate_audio), the input memory-mapped and one int16 stem at a time:
+    # 352 800 + 176 400 B/s, so any further full-length int16 copy goes over
+    "mask": {"requires": ["scipy"], "measure": "heapBytes", "fixed": 16 * MB, "perSecond": 650_000},
+    # separate_audio end to end (decode, Demucs, stem writing, masking), as a job runs it
+    "pipeline": {"requires": ["scipy", "torch", "torchaudio", "demucs"], "measure": "anonBytes", "fixed": 1500 * MB, "perSecond": 4_000_000},
+    # librosa decode (float32 mono) + frame features
+    "analyze": {"requires": ["scipy", "librosa"], "measure": "heapBytes", "fixed": 64 * MB, "perSecond": 1_000_000},
+    # Streaming analyzers over a memory-mapped file: only their results grow.
+    # Fixed parts are ~1.2x the measured steady state (150 / 224 / 182 MB at
+    # 10 min); results grow by under 2 000 B/s, so 5 000 B/s is allowed
+    "enf": {"requires": ["scipy"], "measure": "heapBytes", "fixed": 180 * MB, "perSecond": 5_000},
+    "splice": {"requires": ["scipy"], "measure": "heapBytes", "fixed": 270 * MB, "perSecond": 5_000},
+    "impulses": {"requires": ["scipy"], "measure": "heapBytes", "fixed": 218 * MB, "perSecond": 5_000},
+}
+
+
+def write_synthetic_wav(path, minutes, sr=SAMPLE_RATE, block_seconds=60, seed=0):
+    """16-bit stereo tones + noise + clicks, written block by block so the parent stays small."""
+    import wave
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    with wave.open(path, "wb") as w:
+        w.setnchannels(CHANNELS)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        total = int(minutes * 60 * sr)
+        for start in range(0, total, block_seconds * sr):
+            t = (start + np.arange(min(block_seconds * sr, total - start))) / sr
+            signal = 0.1 * np.sin(2 * np.pi * 50.0 * t) + 0.2 * np.sin(2 * np.pi * 440.0 * t) * (t % 7 < 3)
+            signal += 0.05 * rng.standard_normal(len(t))
+            for click in rng.integers(0, max(1, len(t) - 100), size=max(1, len(t) // (5 * sr))):
+                signal[click:click + 100] += 0.6 * rng.standard_normal(100)
+            stereo = np.stack([signal, np.roll(signal, 5)], axis=1)
+            w.writeframes((np.clip(stereo, -1, 1) * 32767).astype("<i2").tobytes())
+    return path
+
+
+def synthetic_events(seconds, spacing=5.0, length=1.0):
+    """One classified segment every `spacing` seconds, cycling through the forensic stem types."""
+    from audio_separator import FORENSIC_STEMS
+    types = list(FORENSIC_STEMS.values())
+    return [
+        {"type": types[i % len(types)], "start": i * spacing, "end": i * spacing + length}
+        for i in range(int(seconds // spacing))
+    ]
+
+
+def wav_seconds(path):
+    import wave
+    with wave.open(path, "rb") as w:
+        return w.getnframes() / float(w.getframerate())
+
+
+def prepare_stage(stage, path, workdir):
+    """Imports and loads what `stage` needs; returns the zero-argument call to measure."""
+    if stage == "decode":
+        from audio_separator import load_audio
+        return lambda: load_audio(path)
+    if stage == "classify":
+        from mediapipe_audio_classifier import classify_audio
+        return lambda: classify_audio(path, "memory")
+    if stage == "separate":
+        from audio_separator import load_audio, load_demucs_model, separate_array
+        model = load_demucs_model("htdemucs")
+
+        def run():
+            sr, audio = load_audio(path)
+            return separate_array(model, audio, sr, progress=False)
+        return run
+    if stage == "mask":
+        from audio_separator import FORENSIC_STEMS, load_audio, read_wav_mapped, event_spans, masked_stems
+
+        def run():
+            # The decoded copy stays referenced throughout, so a masking step
+            # that makes its own full copy shows up on top of it
+            sr, decoded = load_audio(path)
+            sr, audio = read_wav_mapped(path)
+            spans = event_spans(synthetic_events(len(audio) / float(sr)), sr, len(audio), FORENSIC_STEMS)
+            # As separate_audio does: each stem is written, then dropped
+            for stem_key, stem_audio, peak in masked_stems(audio, spans):
+                del stem_audio
+            return decoded.shape
+        return run
+    if stage == "pipeline":
+        from audio_separator import load_demucs_model, separate_audio
+        load_demucs_model("htdemucs")
+        classification_path = os.path.join(workdir, "classification.json")
+        with open(classification_path, "w") as f:
+            json.dump({"status": "success", "soundEvents": synthetic_events(wav_seconds(path))}, f)
+        return lambda: separate_audio(path, os.path.join(workdir, "out"), "memory", classification_path, peaks=True)
+    if stage == "analyze":
+        from feature_store import get_features
+        return lambda: get_features(path=path, store_dir=workdir)
+    if stage == "enf":
+        from enf import analyze_file
+        return lambda: analyze_file(path)
+    if stage == "splice":
+        from splice import analyze_file
+        return lambda: analyze_file(path)
+    if stage == "impulses":
+        from impulse import scan_file
+        return lambda: scan_file(path)
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def _proc_status(field):
+    """A `kB` field of /proc/self/status in bytes (None where /proc is unavailable)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler(threading.Thread):
+    """Tracks the highest anonymous RSS seen while running."""
+
+    def __init__(self, interval=RSS_SAMPLE_SEC):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.baseline = _proc_status("RssAnon")
+        self.peak = self.baseline
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.is_set():
+            self.sample()
+            self.done.wait(self.interval)
+
+    def sample(self):
+        value = _proc_status("RssAnon")
+        if value is not None and (self.peak is None or value > self.peak):
+            self.peak = value
+
+    def stop(self):
+        self.done.set()
+        self.join()
+        self.sample()
+        return None if self.baseline is None else self.peak - self.baseline
+
+
+def measure_stage(stage, path, workdir):
+    """Runs inside the child interpreter. Returns the stage's peak-memory figures."""
+    import tracemalloc
+    sys.path.insert(0, SCRIPT_DIR)
+    run = prepare_stage(stage, path, workdir)
+
+    sampler = RssSampler()
+    tracemalloc.start()
+    sampler.start()
+    started = time.perf_counter()
+    try:
+        result = run()
+    finally:
+        anon = sampler.stop()
+        _, heap_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    elapsed = time.perf_counter() - started
+
+    hwm = _proc_status("VmHWM")
+    if hwm is None:
+        import resource
+        hwm = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    status = result.get("status") if isinstance(result, dict) else None
+    return {
+        "heapBytes": heap_peak,
+        "anonBytes": anon,
+        "hwmBytes": hwm,
+        "elapsedSec": round(elapsed, 2),
+        "error": result.get("message") if status == "error" else None,
+    }
+
+
+def missing_modules(stage):
+    return [m for m in STAGES[stage]["requires"] if importlib.util.find_spec(m) is None]
+
+
+def run_stage(stage, path, seconds, python_exe=None):
+    """One stage in a fresh interpreter, checked against its budget."""
+    budget = STAGES[stage]
+    allowed = budget["fixed"] + budget["perSecond"] * seconds
+    result = {"stage": stage, "seconds": seconds, "measure": budget["measure"], "allowedBytes": int(allowed)}
+
+    missing = missing_modules(stage)
+    if missing:
+        result.update({"skipped": True, "withinBudget": None, "error": f"not installed: {', '.join(missing)}"})
+        return result
+
+    workdir = tempfile.mkdtemp(prefix="forensic-mem-")
+    try:
+        proc = subprocess.run(
+            [python_exe or sys.executable, os.path.abspath(__file__), f"--child={stage}", f"--input={path}",
+             f"--workdir={workdir}"],
+            cwd=SCRIPT_DIR, capture_output=True, text=True,
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    try:
+        measured = json.loads(proc.stdout.strip().splitlines()[-1])
+    except (ValueError, IndexError):
+        # Killed (likely by the OOM killer) or crashed before reporting
+        tail = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit code {proc.returncode}"
+        result.update({"skipped": False, "withinBudget": False, "error": tail})
+        return result
+
+    used = measured.get(budget["measure"])
+    result.update(measured)
+    result["skipped"] = False
+    result["bytesPerSecond"] = int(used / seconds) if used is not None else None
+    result["withinBudget"] = used is not None and used <= allowed and not measured.get("error")
+    return result
+
+
+def check_budgets(stages=None, durations=None, python_exe=None):
+    stages = stages or list(STAGES)
+    durations = durations or DURATIONS_MIN
+    report = []
+    failed = False
+    input_dir = tempfile.mkdtemp(prefix="forensic-mem-input-")
+    try:
+        for minutes in durations:
+            path = os.path.join(input_dir, f"synthetic_{minutes}min.wav")
+            print(f"[Memory] Writing {minutes} min synthetic input...", file=sys.stderr)
+            write_synthetic_wav(path, minutes)
+            for stage in stages:
+                result = run_stage(stage, path, minutes * 60.0, python_exe)
+                failed = failed or result["withinBudget"] is False
+                report.append(result)
+                _print_result(result)
+            os.unlink(path)
+    finally:
+        shutil.rmtree(input_dir, ignore_errors=True)
+
+    # Growth between the shortest and longest input: the real per-second cost,
+    # with the fixed part cancelled out
+    growth = {}
+    for stage in stages:
+        runs = [r for r in report if r["stage"] == stage and not r["skipped"] and r.get(r["measure"]) is not None]
+        if len(runs) >= 2:
+            short, long = min(runs, key=lambda r: r["seconds"]), max(runs, key=lambda r: r["seconds"])
+            if long["seconds"] > short["seconds"]:
+                growth[stage] = int((long[long["measure"]] - short[short["measure"]]) / (long["seconds"] - short["seconds"]))
+    return {"status": "success" if not failed else "over_budget", "growthBytesPerSecond": growth, "results": report}
+
+
+def _print_result(r):
+    label = f"{r['stage']} @ {r['seconds'] / 60:g} min"
+    if r["skipped"]:
+        print(f"[SKIP] {label}: {r['error']}", file=sys.stderr)
+        return
+    flag = "OK  " if r["withinBudget"] else "FAIL"
+    used = r.get(r["measure"])
+    shown = f"{used / MB:.1f} MB" if used is not None else "n/a"
+    print(f"[{flag}] {label}: {r['measure']} {shown} (budget {r['allowedBytes'] / MB:.1f} MB), "
+          f"hwm {r.get('hwmBytes', 0) / MB:.1f} MB, {r.get('elapsedSec')} s", file=sys.stderr)
+    if r.get("error"):
+        print(f"       error: {r['error']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    # Usage: python memory_budget.py [stage ...] [--durations=10,60]
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    options = dict(a[2:].partition("=")[::2] for a in sys.argv[1:] if a.startswith("--"))
+
+    if options.get("child"):
+        # Child side: measure one stage and report on the last stdout line
+        try:
+            output = measure_stage(options["child"], options["input"], options.get("workdir") or tempfile.gettempdir())
+        except Exception as e:
+            output = {"heapBytes": None, "anonBytes": None, "hwmBytes": None, "error": f"{type(e).__name__}: {e}"}
+        sys.stdout.write("\n" + json.dumps(output))
+        sys.stdout.flush()
+        sys.exit(0)
+
+    unknown = [s for s in args if s not in STAGES]
+    if unknown:
+        output = {"status": "error", "message": f"Unknown stage(s): {', '.join(unknown)}"}
+    else:
+        output = check_budgets(
+            args or None,
+            [float(v) for v in options["durations"].split(",")] if options.get("durations") else None,
+        )
+    sys.stdout.write(json.dumps(output))
+    sys.stdout.flush()
+    sys.exit(0 if output["status"] == "success" else 1)
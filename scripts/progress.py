@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import time
+
+# ================================
+# NDJSON Progress Stream
+# ================================
+# With --ndjson (or FORENSIC_NDJSON=1) the engines write one JSON object per
+# line on stdout while they run, instead of a single JSON document at the end:
+#
+#   {"type": "progress", "stage": "classify", "percent": 42.0}
+#   {"type": "events", "events": [...]}          incremental soundEvents (per frame)
+#   {"type": "stem", "name": "vocals", ...}      a stem has been written
+#   {"type": "result", "result": {...}}          the final output, always last
+#
+# The caller can show progress and partial results as they arrive and keep
+# them if the job is killed. Without the flag nothing is emitted and scripts
+# print their single JSON result exactly as before.
+
+ENV_VAR = "FORENSIC_NDJSON"
+PROGRESS_INTERVAL = 0.5
+EVENT_BATCH_SIZE = 50
+EVENT_BATCH_INTERVAL = 1.0
+
+_STATE = {"enabled": None, "last_progress": 0.0, "last_stage": None}
+
+
+def enable(flag=True):
+    _STATE["enabled"] = flag
+
+
+def is_enabled():
+    if _STATE["enabled"] is None:
+        _STATE["enabled"] = os.environ.get(ENV_VAR, "") == "1"
+    return _STATE["enabled"]
+
+
+def emit(message_type, **payload):
+    """Writes one NDJSON message; a no-op unless streaming is enabled."""
+    if not is_enabled():
+        return
+    sys.stdout.write(json.dumps({"type": message_type, **payload}) + "\n")
+    sys.stdout.flush()
+
+
+def progress(stage, percent=None, **extra):
+    """Throttled progress message; stage changes and 100% always go out."""
+    now = time.monotonic()
+    if (stage == _STATE["last_stage"] and percent != 100
+            and now - _STATE["last_progress"] < PROGRESS_INTERVAL):
+        return
+    _STATE["last_progress"] = now
+    _STATE["last_stage"] = stage
+    if percent is not None:
+        extra["percent"] = round(float(percent), 1)
+    emit("progress", stage=stage, **extra)
+
+
+def write_result(output):
+    """Final message: NDJSON `result` when streaming, otherwise the plain JSON document."""
+    if is_enabled():
+        emit("result", result=output)
+    else:
+        sys.stdout.write(json.dumps(output))
+        sys.stdout.flush()
+
+
+class EventBatcher:
+    """Collects events and emits them in batches by count or age."""
+
+    def __init__(self, message_type="events", size=EVENT_BATCH_SIZE, interval=EVENT_BATCH_INTERVAL):
+        self.message_type = message_type
+        self.size = size
+        self.interval = interval
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+    def add(self, event):
+        if not is_enabled():
+            return
+        self.pending.append(event)
+        if len(self.pending) >= self.size or time.monotonic() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            emit(self.message_type, events=self.pending)
+            self.pending = []
+        self.last_flush = time.monotonic()
@@ -0,0 +1,120 @@
+import sys
+import os
+import json
+import numpy as np
+
+from mediapipe_audio_classifier import FRAME_DURATION, SCORE_THRESHOLD, compact_events
+from forensic_categories import categories_for, load_class_names
+
+# ================================
+# Full YAMNet Score Matrix
+# ================================
+# classify_audio keeps only the top class per frame. When asked, it also saves
+# the full frames x 521 score matrix as float16 .npy (plus a .times.npy with
+# each frame's start time). Everything below re-derives events from that file
+# without running the model again, so re-thresholding takes milliseconds.
+
+def times_path_for(scores_path):
+    base = scores_path[:-4] if scores_path.endswith(".npy") else scores_path
+    return base + ".times.npy"
+
+
+def save_score_matrix(scores_path, scores, times):
+    """Writes the score matrix as float16 and the frame times as float32."""
+    np.save(scores_path, np.asarray(scores, dtype=np.float16))
+    np.save(times_path_for(scores_path), np.asarray(times, dtype=np.float32))
+    return {
+        "path": scores_path,
+        "timesPath": times_path_for(scores_path),
+        "shape": list(np.shape(scores)),
+        "bytes": os.path.getsize(scores_path),
+    }
+
+
+def load_score_matrix(scores_path, mmap=True):
+    """Returns (scores, times); the score matrix is memory-mapped by default."""
+    scores = np.load(scores_path, mmap_mode="r" if mmap else None)
+    times_path = times_path_for(scores_path)
+    if os.path.exists(times_path):
+        times = np.load(times_path)
+    else:
+        times = np.arange(scores.shape[0], dtype=np.float32) * FRAME_DURATION
+    return scores, times
+
+
+def top_k(scores, k=5):
+    """Vectorized top-k per frame. Returns (indices, values), best first."""
+    scores = np.asarray(scores, dtype=np.float32)
+    k = min(k, scores.shape[1])
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    vals = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-vals, axis=1)
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(vals, order, axis=1)
+
+
+def derive_events(scores, times, threshold=SCORE_THRESHOLD, k=1, per_frame=False, profile=None):
+    """
+    Rebuilds `soundEvents` from a stored score matrix.
+    With k == 1 the output matches classify_audio; larger k adds an
+    `alternatives` list of the next best classes to each frame.
+    """
+    class_names = load_class_names()
+    indices, values = top_k(scores, k)
+    frame_categories = categories_for(indices[:, 0], profile)
+
+    events = []
+    for frame, t in enumerate(times):
+        best = float(values[frame, 0])
+        if best < threshold:
+            continue
+        event = {
+            "time": round(float(t), 2),
+            "type": frame_categories[frame],
+            "confidence": round(best, 4),
+            "decibels": round(-60 + (best * 60), 1),
+        }
+        if k > 1:
+            event["alternatives"] = [
+                {"class": class_names[i], "score": round(float(v), 4)}
+                for i, v in zip(indices[frame, 1:], values[frame, 1:])
+                if v >= threshold
+            ]
+        events.append(event)
+
+    if per_frame:
+        return events
+    # Matrices from --hop runs are on a finer grid than the 0.975 s default
+    frame_duration = float(np.median(np.diff(times))) if len(times) > 1 else FRAME_DURATION
+    return compact_events(events, frame_duration=frame_duration)
+
+
+def rederive(scores_path, threshold=SCORE_THRESHOLD, k=1, per_frame=False, profile=None):
+    scores, times = load_score_matrix(scores_path)
+    events = derive_events(scores, times, threshold=threshold, k=k, per_frame=per_frame, profile=profile)
+    return {
+        "status": "success",
+        "eventMode": "frames" if per_frame else "segments",
+        "detectedSounds": len(events),
+        "soundEvents": events,
+    }
+
+
+if __name__ == "__main__":
+    # Usage: score_matrix.py <scores.npy> [--threshold=0.05] [--top-k=1] [--frames] [--profile=name]
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    options = dict(a[2:].partition("=")[::2] for a in sys.argv[1:] if a.startswith("--"))
+    if args:
+        try:
+            output = rederive(
+                args[0].strip('"'),
+                threshold=float(options.get("threshold") or SCORE_THRESHOLD),
+                k=int(options.get("top-k") or 1),
+                per_frame="frames" in options,
+                profile=options.get("profile") or None,
+            )
+        except Exception as e:
+            output = {"status": "error", "message": str(e)}
+    else:
+        output = {"status": "error", "message": "No input"}
+    sys.stdout.write(json.dumps(output))
+    sys.stdout.flush()
@@ -5,36 +5,91 @@ import librosa
 import soundfile as sf
 import numpy as np
 
+# ================================
+# Single-STFT Forensic Stem Engine
+# ================================
+# All six stems come from one STFT of the input: harmonic/percussive soft
+# masks (median filtering of that magnitude) and frequency band masks are
+# computed in vectorized form, applied to the same spectrum and inverted with
+# one batched iSTFT. Band masks stay (n_bins, 1) and broadcast over frames;
+# only the masked spectra are stacked.
+
+N_FFT = 2048
+HOP_LENGTH = 512
+# Margin > 1 leaves a residual that is neither harmonic nor percussive;
+# that residual is the background stem.
+HPSS_MARGIN = 2.0
+BAND_TAPER_HZ = 50.0
+
+VEHICLE_CUTOFF = 300.0
+ANIMAL_CUTOFF = 2000.0
+WIND_BAND = (500.0, 1500.0)
+
+STEMS = ["vocals", "footsteps", "vehicles", "animals", "wind", "background"]
+
+
+def band_mask(freqs, low=None, high=None, taper=BAND_TAPER_HZ):
+    """
+    Frequency-only mask with linear tapers of `taper` Hz at each edge,
+    which rings less than a hard cut. Shape (n_bins, 1) so it broadcasts
+    over frames.
+    """
+    mask = np.ones_like(freqs, dtype=np.float32)
+    if low is not None:
+        mask *= np.clip((freqs - (low - taper)) / taper, 0.0, 1.0)
+    if high is not None:
+        mask *= np.clip(((high + taper) - freqs) / taper, 0.0, 1.0)
+    return mask[:, None]
+
+
+def stem_masks(D, sr):
+    """
+    Returns the six float32 masks in STEMS order: the HPSS masks are
+    (n_bins, n_frames), the band masks (n_bins, 1).
+    """
+    harmonic, percussive = librosa.decompose.hpss(D, margin=HPSS_MARGIN, mask=True)
+    harmonic = harmonic.astype(np.float32, copy=False)
+    percussive = percussive.astype(np.float32, copy=False)
+    background = np.clip(1.0 - harmonic - percussive, 0.0, 1.0)
+
+    freqs = librosa.fft_frequencies(sr=sr, n_fft=N_FFT)
+    return [
+        harmonic,
+        percussive,
+        band_mask(freqs, high=VEHICLE_CUTOFF),
+        band_mask(freqs, low=ANIMAL_CUTOFF),
+        band_mask(freqs, low=WIND_BAND[0], high=WIND_BAND[1]),
+        background,
+    ]
+
+
+def separate_stems(y, sr):
+    """One STFT in, one batched iSTFT out. Returns {stem: signal}."""
+    D = librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH)
+    masks = stem_masks(D, sr)
+    masked = np.empty((len(masks),) + D.shape, dtype=D.dtype)
+    for i, mask in enumerate(masks):
+        np.multiply(D, mask, out=masked[i])
+    del masks, D
+    signals = librosa.istft(masked, hop_length=HOP_LENGTH, n_fft=N_FFT, length=len(y))
+    return dict(zip(STEMS, signals))
+
+
 def process_forensic(input_path, output_dir, base_name):
     # Load the audio
     y, sr = librosa.load(input_path, sr=None)
-    
-    # 1. ISOLATE VOCALS (Using Median Filtering for harmonic/percussive)
-    harmonic, percussive = librosa.effects.hpss(y)
-    sf.write(os.path.join(output_dir, f"{base_name}_vocals.wav"), harmonic, sr)
-    
-    # 2. ISOLATE FOOTSTEPS / IMPACT (Percussive transients)
-    sf.write(os.path.join(output_dir, f"{base_name}_footsteps.wav"), percussive, sr)
-    
-    # 3. ISOLATE VEHICLES (Low Pass Filter < 300Hz)
-    vehicles = librosa.lowpass_filter(y, sr=sr, cutoff=300)
-    sf.write(os.path.join(output_dir, f"{base_name}_vehicles.wav"), vehicles, sr)
-    
-    # 4. ISOLATE ANIMALS / BIRDS (High Pass Filter > 2000Hz + Peak Detection)
-    animals = librosa.highpass_filter(y, sr=sr, cutoff=2000)
-    sf.write(os.path.join(output_dir, f"{base_name}_animals.wav"), animals, sr)
-    
-    # 5. ISOLATE WIND / ATMOSPHERIC (Bandpass 500Hz - 1500Hz + Smoothing)
-    wind = librosa.bandpass_filter(y, sr=sr, low=500, high=1500)
-    sf.write(os.path.join(output_dir, f"{base_name}_wind.wav"), wind, sr)
-    
-    # 6. ISOLATE BACKGROUND (The remainder)
-    background = y - harmonic - percussive
-    sf.write(os.path.join(output_dir, f"{base_name}_background.wav"), background, sr)
+
+    stems = separate_stems(y, sr)
+    files = []
+    for name in STEMS:
+        path = os.path.join(output_dir, f"{base_name}_{name}.wav")
+        sf.write(path, stems[name], sr)
+        files.append(path)
 
     return {
         "status": "completed",
-        "files_generated": 6
+        "files_generated": len(files),
+        "files": files
     }
 
 if __name__ == "__main__":
@@ -42,8 +97,8 @@ if __name__ == "__main__":
         in_file = sys.argv[1]
         out_dir = sys.argv[2]
         name = sys.argv[3]
-        
+
         result = process_forensic(in_file, out_dir, name)
         print(json.dumps(result))
     except Exception as e:
-        print(json.dumps({"status": "error", "message": str(e)}))
\ No newline at end of file
+        print(json.dumps({"status": "error", "message": str(e)}))
@@ -0,0 +1,200 @@
+import sys
+import os
+import json
+import time
+import numpy as np
+
+from audio_separator import load_demucs_model, separate_array, quantized_model_path
+
+# ================================
+# Demucs float32 vs int8 Benchmark
+# ================================
+# Quality/speed report for the --quantized separation mode. Synthetic
+# mixtures are built from known stems (drums, bass, other, vocals), so each
+# mode's output can be scored with SDR against the true sources. Real test
+# files have no ground truth; for those the int8 output is scored against
+# the float32 output ("agreement") and only speed is compared directly.
+#
+# With no files given, the repo's own test recordings are used, and the
+# report is written to res/separation_benchmark.json unless --out says
+# otherwise. Files that cannot be read are listed with the error instead of
+# failing the run.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FILES = [os.path.join(SCRIPT_DIR, "test_audio.wav"), os.path.join(SCRIPT_DIR, "valid_test.wav")]
+DEFAULT_REPORT = os.path.join(SCRIPT_DIR, "res", "separation_benchmark.json")
+SAMPLE_RATE = 44100
+DEFAULT_DURATION = 20.0
+DEFAULT_MIXTURES = 3
+
+
+def _envelope(n, sr, onsets, decay):
+    env = np.zeros(n, dtype=np.float32)
+    t = np.arange(int(decay * 6 * sr)) / sr
+    shape = np.exp(-t / decay).astype(np.float32)
+    for onset in onsets:
+        start = int(onset * sr)
+        end = min(n, start + len(shape))
+        env[start:end] = np.maximum(env[start:end], shape[:end - start])
+    return env
+
+
+def synthetic_stems(seed, duration=DEFAULT_DURATION, sr=SAMPLE_RATE):
+    """Returns {source: (2, samples) float32} with a simple, distinct texture per source."""
+    rng = np.random.default_rng(seed)
+    n = int(duration * sr)
+    t = np.arange(n) / sr
+    beat = 60.0 / rng.uniform(80, 140)
+
+    # Drums: decaying noise bursts on the beat, low thumps on every other beat
+    kicks = np.arange(0, duration, 2 * beat)
+    hats = np.arange(beat / 2, duration, beat)
+    drums = _envelope(n, sr, kicks, 0.08) * np.sin(2 * np.pi * 60 * t)
+    drums += 0.4 * _envelope(n, sr, hats, 0.02) * rng.standard_normal(n)
+
+    # Bass: a low note per bar
+    notes = rng.choice([41.2, 49.0, 55.0, 61.7, 73.4], size=int(duration / (4 * beat)) + 1)
+    bass_freq = notes[(t / (4 * beat)).astype(int)]
+    bass = 0.5 * np.sin(2 * np.pi * np.cumsum(bass_freq) / sr)
+
+    # Other: a sustained chord pad
+    chord = rng.choice([220.0, 261.6, 329.6, 392.0, 440.0, 523.3], size=3, replace=False)
+    other = sum(0.15 * np.sin(2 * np.pi * f * t + rng.uniform(0, 2 * np.pi)) for f in chord)
+
+    # Vocals: a harmonic tone with vibrato, gated into syllables
+    f0 = rng.uniform(140, 260) * (1 + 0.01 * np.sin(2 * np.pi * 5.5 * t))
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    voice = sum((0.3 / k) * np.sin(k * phase) for k in range(1, 8))
+    syllables = np.arange(rng.uniform(0, 0.3), duration, rng.uniform(0.25, 0.4))
+    vocals = voice * _envelope(n, sr, syllables, 0.12)
+
+    stems = {}
+    for name, mono in (("drums", drums), ("bass", bass), ("other", other), ("vocals", vocals)):
+        pan = rng.uniform(0.3, 0.7)
+        stems[name] = np.stack([mono * (1 - pan), mono * pan]).astype(np.float32) * 2
+    return stems
+
+
+def sdr(reference, estimate):
+    """Signal-to-distortion ratio in dB (plain energy ratio, no projection)."""
+    reference = np.asarray(reference, dtype=np.float64)
+    estimate = np.asarray(estimate, dtype=np.float64)
+    n = min(reference.shape[-1], estimate.shape[-1])
+    reference, estimate = reference[..., :n], estimate[..., :n]
+    noise = np.sum((reference - estimate) ** 2)
+    signal = np.sum(reference ** 2)
+    if signal == 0:
+        return None
+    return float(10 * np.log10(signal / max(noise, 1e-12)))
+
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return round(float(np.mean(values)), 2) if values else None
+
+
+def _load_file(path):
+    from scipy.io import wavfile
+    from audio_io import to_float
+    sr, audio = wavfile.read(path)
+    audio = to_float(audio)
+    audio = audio[None, :] if audio.ndim == 1 else audio.T
+    return sr, np.ascontiguousarray(audio, dtype=np.float32)
+
+
+def _readable(files, report):
+    """Files whose WAV header parses; the rest go into the report with the error."""
+    from audio_separator import read_wav_mapped
+    readable = []
+    for path in files:
+        try:
+            sr, audio = read_wav_mapped(path)
+            if not len(audio):
+                raise ValueError("no samples")
+            readable.append(path)
+        except Exception as e:
+            report["files"].append({"path": path, "error": str(e)})
+    return readable
+
+
+def run_benchmark(files=DEFAULT_FILES, mixtures=DEFAULT_MIXTURES, duration=DEFAULT_DURATION):
+    report = {"modes": {}, "mixtures": [], "files": []}
+    outputs = {}
+    files = _readable(files, report)
+
+    for mode, quantized in (("float32", False), ("int8", True)):
+        started = time.perf_counter()
+        model = load_demucs_model("htdemucs", quantized=quantized)
+        load_sec = time.perf_counter() - started
+        sources = list(model.sources)
+
+        audio_sec = 0.0
+        compute_sec = 0.0
+        scores = {name: [] for name in sources}
+        for seed in range(mixtures):
+            stems = synthetic_stems(seed, duration)
+            mixture = sum(stems.values())
+            started = time.perf_counter()
+            estimate = separate_array(model, mixture, SAMPLE_RATE, progress=False).numpy()
+            compute_sec += time.perf_counter() - started
+            audio_sec += duration
+            outputs[(mode, "mix", seed)] = estimate
+            for i, name in enumerate(sources):
+                scores[name].append(sdr(stems[name], estimate[i]))
+
+        for path in files:
+            sr, audio = _load_file(path)
+            started = time.perf_counter()
+            outputs[(mode, "file", path)] = separate_array(model, audio, sr, progress=False).numpy()
+            compute_sec += time.perf_counter() - started
+            audio_sec += audio.shape[-1] / float(sr)
+
+        report["modes"][mode] = {
+            "loadSec": round(load_sec, 2),
+            "computeSec": round(compute_sec, 2),
+            "realtimeFactor": round(audio_sec / max(compute_sec, 1e-9), 2),
+            "sdr": {name: _mean(values) for name, values in scores.items()},
+            "meanSdr": _mean([v for values in scores.values() for v in values]),
+        }
+
+    for seed in range(mixtures):
+        reference = outputs[("float32", "mix", seed)]
+        estimate = outputs[("int8", "mix", seed)]
+        report["mixtures"].append({
+            "seed": seed,
+            "agreementSdr": {name: round(sdr(reference[i], estimate[i]) or 0.0, 2) for i, name in enumerate(sources)},
+        })
+    for path in files:
+        reference = outputs[("float32", "file", path)]
+        estimate = outputs[("int8", "file", path)]
+        report["files"].append({
+            "path": path,
+            "agreementSdr": {name: round(sdr(reference[i], estimate[i]) or 0.0, 2) for i, name in enumerate(sources)},
+        })
+
+    fp32, int8 = report["modes"]["float32"], report["modes"]["int8"]
+    report["speedup"] = round(fp32["computeSec"] / max(int8["computeSec"], 1e-9), 2)
+    if fp32["meanSdr"] is not None and int8["meanSdr"] is not None:
+        report["sdrDelta"] = round(int8["meanSdr"] - fp32["meanSdr"], 2)
+    cache = quantized_model_path("htdemucs")
+    if os.path.exists(cache):
+        report["quantizedModelBytes"] = os.path.getsize(cache)
+    return report
+
+
+if __name__ == "__main__":
+    # Usage: separation_benchmark.py [test.wav ...] [--mixtures=3] [--duration=20] [--out=report.json]
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    options = dict(a[2:].partition("=")[::2] for a in sys.argv[1:] if a.startswith("--"))
+    try:
+        output = {"status": "success", **run_benchmark(
+            files=[a.strip('"') for a in args] or DEFAULT_FILES,
+            mixtures=int(options.get("mixtures") or DEFAULT_MIXTURES),
+            duration=float(options.get("duration") or DEFAULT_DURATION),
+        )}
+        with open(options.get("out") or DEFAULT_REPORT, "w") as f:
+            json.dump(output, f, indent=2)
+    except Exception as e:
+        output = {"status": "error", "message": str(e)}
+    sys.stdout.write(json.dumps(output))
+    sys.stdout.flush()
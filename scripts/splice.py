@@ -0,0 +1,238 @@
+import sys
+import os
+import json
+import time
+import heapq
+import numpy as np
+import scipy.fft
+
+from audio_io import to_mono_float
+
+# ================================
+# Splice / Edit Discontinuity Detector
+# ================================
+# An edit joins audio recorded at different times or places. Around the cut
+# the background changes in ways the foreground rarely explains. One STFT pass
+# (block by block from a memory-mapped WAV) yields per-frame features:
+#
+#   - noise floor: 10th percentile of the frame's log magnitude spectrum
+#   - spectral envelope: log energy in ENVELOPE_BANDS log-spaced bands
+#   - phase continuity: magnitude-weighted second difference of each steady
+#     bin's phase, which is zero for a stationary sinusoid
+#   - DC offset: mean sample value of the frame
+#
+# At every frame boundary the WINDOW_SEC before is compared with the WINDOW_SEC
+# after, using prefix sums (running sums) of the features and their squares:
+# Welch-style t statistics for floor and DC, an RMS t statistic over bands
+# for the envelope, and a z-score of the boundary's phase deviation. Only the
+# last two windows of features are carried between blocks and only the
+# MAX_CANDIDATES best points are kept, so memory is bounded on any length.
+# Results use the soundEvents layout of the classifier.
+
+N_FFT = 2048
+HOP_LENGTH = 1024
+BLOCK_SECONDS = 60
+WINDOW_SEC = 2.0
+ENVELOPE_BANDS = 24
+FLOOR_PERCENTILE = 10
+MIN_SCORE = 3.0
+MAX_CANDIDATES = 50
+# Every SAMPLE_STRIDE-th boundary's statistics are kept to estimate their typical values
+SAMPLE_STRIDE = 16
+EVENT_TYPE = "Possible Edit"
+
+
+def band_matrix(sr, n_fft=N_FFT, n_bands=ENVELOPE_BANDS, low=50.0):
+    """(bins, bands) matrix summing power into log-spaced bands from `low` to Nyquist."""
+    freqs = np.fft.rfftfreq(n_fft, 1.0 / sr)
+    edges = np.geomspace(low, sr / 2.0, n_bands + 1)
+    which = np.searchsorted(edges, freqs, side="right") - 1
+    matrix = np.zeros((len(freqs), n_bands), dtype=np.float32)
+    inside = (which >= 0) & (which < n_bands)
+    matrix[np.flatnonzero(inside), which[inside]] = 1.0
+    return matrix
+
+
+def frame_features(frames, previous_spectra, bands, window):
+    """
+    Features for a (frames, n_fft) block. `previous_spectra` holds the last two
+    complex spectra of the previous block (None at the start).
+    Returns (features, last_spectra) with features (frames, 3 + bands):
+    floor, phase deviation, DC, then the band envelope.
+    """
+    spectrum = scipy.fft.rfft(frames * window, axis=1, workers=-1)
+    magnitude = np.abs(spectrum)
+    log_magnitude = np.log(magnitude + 1e-9)
+    floor = np.percentile(log_magnitude, FLOOR_PERCENTILE, axis=1)
+    envelope = np.log(magnitude ** 2 @ bands + 1e-12)
+
+    # Second difference of phase per bin: zero for a steady sinusoid at any frequency
+    history = np.concatenate([np.repeat(spectrum[:1], 2, axis=0) if previous_spectra is None else previous_spectra, spectrum])
+    prior, prior2 = history[1:-1], history[:-2]
+    deviation = np.abs(np.angle(spectrum * np.conj(prior) ** 2 * prior2))
+    # Only components that are steady over the three frames count; onsets
+    # and decays change phase for reasons that have nothing to do with edits
+    stack = np.abs(np.stack([spectrum, prior, prior2]))
+    steady = stack.min(axis=0) / np.maximum(stack.max(axis=0), 1e-12)
+    weight = magnitude * steady ** 4
+    phase = (deviation * weight).sum(axis=1) / np.maximum(weight.sum(axis=1), 1e-12)
+
+    features = np.column_stack([floor, phase, frames.mean(axis=1), envelope]).astype(np.float64)
+    return features, history[-2:]
+
+
+def boundary_scores(features, window):
+    """
+    Scores for every boundary b in [window, len - window] of a feature buffer
+    (frames b - window .. b - 1 against b .. b + window - 1), from prefix sums.
+    Returns a (boundaries, 4) array: floor, envelope, phase, dc.
+    """
+    c1 = np.concatenate([np.zeros((1, features.shape[1])), np.cumsum(features, axis=0)])
+    c2 = np.concatenate([np.zeros((1, features.shape[1])), np.cumsum(features ** 2, axis=0)])
+    b = np.arange(window, len(features) - window + 1)
+
+    def stats(lo, hi):
+        mean = (c1[hi] - c1[lo]) / window
+        var = np.maximum((c2[hi] - c2[lo]) / window - mean ** 2, 0.0)
+        return mean, var
+
+    mean_before, var_before = stats(b - window, b)
+    mean_after, var_after = stats(b, b + window)
+    t = np.abs(mean_after - mean_before) / np.sqrt((var_before + var_after) / window + 1e-12)
+
+    # Phase: the boundary frame itself against both windows
+    pooled_mean = (mean_before[:, 1] + mean_after[:, 1]) / 2
+    pooled_std = np.sqrt((var_before[:, 1] + var_after[:, 1]) / 2 + 1e-12)
+    phase_z = np.abs(features[b, 1] - pooled_mean) / pooled_std
+
+    envelope = np.sqrt(np.mean(t[:, 3:] ** 2, axis=1))
+    return np.column_stack([t[:, 0], envelope, phase_z, t[:, 2]])
+
+
+def combined_score(parts, scale):
+    """
+    Mean of the four statistics, each in units of its typical (median) value
+    over the file so far: a cut usually moves several at once, and the
+    foreground of a recording sets how much each one varies anyway.
+    """
+    return (parts / scale).mean(axis=1)
+
+
+def detect_splices(audio, sr, window_sec=WINDOW_SEC, min_score=MIN_SCORE, top=MAX_CANDIDATES):
+    """Ranked candidate splice points for a (memory-mapped) array."""
+    from scipy.signal import find_peaks
+    from progress import progress
+    window = max(2, int(round(window_sec * sr / HOP_LENGTH)))
+    n_frames = max(0, 1 + (len(audio) - N_FFT) // HOP_LENGTH)
+    hann = np.hanning(N_FFT).astype(np.float32)
+    bands = band_matrix(sr)
+
+    best = []  # min-heap of (score, frame, parts)
+    samples = []
+    buffer, buffer_start = None, 0
+    previous = None
+    per_block = max(1, int(BLOCK_SECONDS * sr) // HOP_LENGTH)
+    for first in range(0, n_frames, per_block):
+        last = min(n_frames, first + per_block)
+        block = to_mono_float(audio[first * HOP_LENGTH:(last - 1) * HOP_LENGTH + N_FFT])
+        frames = np.lib.stride_tricks.sliding_window_view(block, N_FFT)[::HOP_LENGTH]
+        features, previous = frame_features(frames, previous, bands, hann)
+        buffer = features if buffer is None else np.concatenate([buffer, features])
+
+        if len(buffer) >= 2 * window:
+            parts = boundary_scores(buffer, window)
+            samples.append(parts[::SAMPLE_STRIDE])
+            scale = np.maximum(np.median(np.concatenate(samples), axis=0), 1e-6)
+            score = combined_score(parts, scale)
+            peaks, _ = find_peaks(np.concatenate([[0.0], score, [0.0]]), height=min_score, distance=window)
+            for i in peaks - 1:
+                entry = (float(score[i]), buffer_start + window + int(i), parts[i].tolist())
+                if len(best) < top * 2:
+                    heapq.heappush(best, entry)
+                elif entry[0] > best[0][0]:
+                    heapq.heapreplace(best, entry)
+            # Keep just enough frames for the next boundary to have a full window before it
+            keep = 2 * window - 1
+            buffer_start += len(buffer) - keep
+            buffer = buffer[-keep:]
+        progress("splice", 100.0 * last / max(1, n_frames))
+
+    # Re-score with the typical values of the whole file, then drop peaks on
+    # either side of a block edge that landed within one window of a stronger one
+    scale = np.maximum(np.median(np.concatenate(samples), axis=0), 1e-6) if samples else np.ones(4)
+    rescored = [(float(combined_score(np.array([parts]), scale)[0]), frame, (np.array(parts) / scale).tolist())
+                for _, frame, parts in best]
+    chosen = []
+    for score, frame, parts in sorted(rescored, reverse=True):
+        if score < min_score:
+            continue
+        if all(abs(frame - other) >= window for _, other, _ in chosen):
+            chosen.append((score, frame, parts))
+    chosen = chosen[:top]
+
+    hop_sec = HOP_LENGTH / float(sr)
+    return [
+        {
+            "time": round(frame * hop_sec, 2),
+            "type": EVENT_TYPE,
+            "confidence": round(1.0 - float(np.exp(-(score - min_score) / min_score)), 4),
+            "rank": rank + 1,
+            "splice": {
+                "score": round(score, 2),
+                "noiseFloor": round(parts[0], 2),
+                "envelope": round(parts[1], 2),
+                "phase": round(parts[2], 2),
+                "dcOffset": round(parts[3], 2),
+            },
+        }
+        for rank, (score, frame, parts) in enumerate(chosen)
+    ]
+
+
+def analyze_file(audio_path, job_id="job", window_sec=WINDOW_SEC, min_score=MIN_SCORE, top=MAX_CANDIDATES):
+    started = time.perf_counter()
+    converted_path = None
+    try:
+        from scipy.io import wavfile
+        audio_path = audio_path.strip('"')
+        try:
+            sr, audio = wavfile.read(audio_path, mmap=True)
+        except Exception:
+            from mediapipe_audio_classifier import convert_to_wav
+            converted_path = convert_to_wav(audio_path)
+            sr, audio = wavfile.read(converted_path, mmap=True)
+
+        events = detect_splices(audio, sr, window_sec, min_score, top)
+        return {
+            "status": "success",
+            "jobID": job_id,
+            "eventMode": "splices",
+            "duration": round(len(audio) / float(sr), 2),
+            "detectedSounds": len(events),
+            "soundEvents": events,
+            "elapsedSec": round(time.perf_counter() - started, 2),
+        }
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+    finally:
+        if converted_path and converted_path != audio_path and os.path.exists(converted_path):
+            os.unlink(converted_path)
+
+
+if __name__ == "__main__":
+    # Usage: splice.py <audio> [job_id] [--window=2.0] [--min-score=4.0] [--top=50] [--ndjson]
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    options = dict(a[2:].partition("=")[::2] for a in sys.argv[1:] if a.startswith("--"))
+    import progress
+    if "ndjson" in options:
+        progress.enable()
+    if args:
+        output = analyze_file(
+            args[0], args[1] if len(args) > 1 else "job",
+            window_sec=float(options.get("window") or WINDOW_SEC),
+            min_score=float(options.get("min-score") or MIN_SCORE),
+            top=int(options.get("top") or MAX_CANDIDATES),
+        )
+    else:
+        output = {"status": "error", "message": "No input"}
+    progress.write_result(output)
@@ -0,0 +1,134 @@
+import os
+import wave
+import tempfile
+import subprocess
+import numpy as np
+
+from audio_io import iter_float_blocks
+
+# ================================
+# Stem Output Encodings
+# ================================
+# Stems used to be written only as float32 WAV, which for a one-hour job means
+# gigabytes on disk and in the browser. Each stem can now be written in one or
+# more encodings, chunk by chunk, so no full-length converted copy is made:
+#
+#   master   - WAV at the precision the stem was produced in (previous behaviour:
+#              float32 for Demucs stems, source dtype for forensic stems)
+#   pcm16    - 16-bit PCM WAV, half the size of float32
+#   flac     - lossless 24-bit FLAC
+#   preview  - compressed AAC stream for quick playback in the dashboard
+
+FORMATS = {
+    "master": ".wav",
+    "pcm16": ".wav",
+    "flac": ".flac",
+    "preview": ".m4a",
+}
+DEFAULT_FORMATS = ["master"]
+PREVIEW_BITRATE = "96k"
+CHUNK_SECONDS = 10
+STDERR_TAIL_LINES = 10
+
+
+def parse_formats(value):
+    """Accepts a list or a comma-separated string and validates each entry."""
+    if not value:
+        return list(DEFAULT_FORMATS)
+    formats = value if isinstance(value, (list, tuple)) else [f.strip() for f in value.split(",")]
+    unknown = [f for f in formats if f not in FORMATS]
+    if unknown:
+        raise ValueError(f"Unknown stem format(s): {', '.join(unknown)}")
+    return list(dict.fromkeys(formats))
+
+
+def stem_path(base_path, fmt):
+    """base_path has no extension. pcm16 gets its own suffix so it can sit next to the master."""
+    suffix = ".pcm16" if fmt == "pcm16" else ""
+    return f"{base_path}{suffix}{FORMATS[fmt]}"
+
+
+def iter_float_chunks(audio, sr):
+    """Yields (samples, channels) float32 chunks in [-1, 1] from any PCM dtype."""
+    for _, block in iter_float_blocks(audio, sr * CHUNK_SECONDS):
+        yield block.reshape(len(block), -1)
+
+
+def _write_pcm16(path, audio, sr):
+    channels = 1 if audio.ndim == 1 else audio.shape[1]
+    with wave.open(path, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(int(sr))
+        for block in iter_float_chunks(audio, sr):
+            w.writeframes((np.clip(block, -1.0, 1.0) * 32767.0).astype("<i2").tobytes())
+
+
+def _write_ffmpeg(path, audio, sr, codec_args):
+    channels = 1 if audio.ndim == 1 else audio.shape[1]
+    cmd = [
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "f32le", "-ar", str(int(sr)), "-ac", str(channels), "-i", "pipe:0",
+        *codec_args,
+        path,
+    ]
+    # stderr goes to a file: FFmpeg cannot block on it while we are writing,
+    # and it is still there to report if FFmpeg exits early
+    with tempfile.TemporaryFile() as errors:
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=errors)
+        broken = False
+        try:
+            for block in iter_float_chunks(audio, sr):
+                proc.stdin.write(np.ascontiguousarray(block, dtype="<f4").tobytes())
+        except BrokenPipeError:
+            # FFmpeg exited before reading everything; its stderr says why
+            broken = True
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                broken = True
+            proc.wait()
+        if proc.returncode != 0 or broken:
+            errors.seek(0)
+            tail = errors.read().decode(errors="ignore").strip().splitlines()[-STDERR_TAIL_LINES:]
+            detail = "\n".join(tail) or f"exit code {proc.returncode}"
+            raise RuntimeError(f"FFmpeg encode failed for {path}: {detail}")
+
+
+def write_stem(base_path, audio, sr, fmt):
+    """
+    Writes `audio` (samples[, channels]) to base_path + extension in `fmt`.
+    Returns (path, size_in_bytes).
+    """
+    path = stem_path(base_path, fmt)
+    if fmt == "master":
+        from scipy.io import wavfile
+        wavfile.write(path, int(sr), audio)
+    elif fmt == "pcm16":
+        _write_pcm16(path, audio, sr)
+    elif fmt == "flac":
+        _write_ffmpeg(path, audio, sr, ["-c:a", "flac", "-sample_fmt", "s32", "-bits_per_raw_sample", "24"])
+    elif fmt == "preview":
+        _write_ffmpeg(path, audio, sr, ["-c:a", "aac", "-b:a", PREVIEW_BITRATE, "-movflags", "+faststart"])
+    else:
+        raise ValueError(f"Unknown stem format: {fmt}")
+    return path, os.path.getsize(path)
+
+
+def write_stem_formats(base_path, audio, sr, formats, url_root, output_dir, peaks=False):
+    """
+    Writes one stem in every requested format, plus its waveform peak file
+    when `peaks` is set.
+    Returns {fmt: {"url": ..., "bytes": ...}} with URLs relative to url_root.
+    """
+    written = {}
+    paths = [(fmt, write_stem(base_path, audio, sr, fmt)) for fmt in formats]
+    if peaks:
+        from waveform_peaks import build_peaks
+        info = build_peaks(audio, sr, base_path + ".peaks")
+        paths.append(("peaks", (info["path"], info["bytes"])))
+    for fmt, (path, size) in paths:
+        rel = os.path.relpath(path, output_dir).replace(os.sep, "/")
+        written[fmt] = {"url": f"{url_root}/{rel}", "bytes": size}
+    return written
@@ -0,0 +1,64 @@
+import os
+
+# ================================
+# Per-Job Thread Budget
+# ================================
+# Left alone, torch (Demucs), TFLite/XNNPACK (YAMNet) and the BLAS under numpy
+# each start one thread per core, so two concurrent jobs oversubscribe the box.
+# The scheduler in lib/cpu-scheduler.ts hands every spawned job a thread count
+# in FORENSIC_THREADS (and the usual BLAS variables); this module applies it to
+# the libraries that can only be limited from inside the process.
+
+ENV_VAR = "FORENSIC_THREADS"
+BLAS_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+)
+
+
+def thread_budget():
+    """Threads granted to this process, or None when no budget was set."""
+    value = os.environ.get(ENV_VAR, "").strip()
+    if not value:
+        return None
+    try:
+        return max(1, int(value))
+    except ValueError:
+        return None
+
+
+def apply_thread_budget(threads=None, torch_module=None):
+    """
+    Caps BLAS/OpenMP and torch at `threads` (default: FORENSIC_THREADS).
+    BLAS pools are sized when numpy loads, so the environment variables only
+    help child processes; threadpoolctl, if installed, resizes the pools that
+    are already running. Returns a description for the job's debug output.
+    """
+    threads = threads or thread_budget()
+    if not threads:
+        return {"threads": None}
+
+    applied = {"threads": threads}
+    for name in BLAS_ENV_VARS:
+        os.environ[name] = str(threads)
+    os.environ[ENV_VAR] = str(threads)
+
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(threads)
+        applied["blas"] = "threadpoolctl"
+    except ImportError:
+        applied["blas"] = "env"
+
+    if torch_module is not None:
+        torch_module.set_num_threads(threads)
+        try:
+            # Only allowed before torch runs any parallel work
+            torch_module.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+        applied["torch"] = torch_module.get_num_threads()
+    return applied
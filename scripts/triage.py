@@ -0,0 +1,202 @@
+import sys
+import os
+import time
+import numpy as np
+
+from audio_io import to_mono_float
+from mediapipe_audio_classifier import FRAME_DURATION, SCORE_THRESHOLD, get_yamnet_model_path
+from job_control import JobCancelled
+
+# ================================
+# Triage: Sampled Category Presence
+# ================================
+# Answers "does this recording contain speech / gunshots / sirens?" without
+# classifying every frame. The file is cut into 0.975 s windows and split into
+# equal time strata. Each round draws one unsampled window per stratum, with
+# a preference for windows at energy onsets, and runs the batch through YAMNet.
+# Rounds continue until the time budget is spent or every watched category is
+# settled: seen at least once, or its prevalence upper bound is below
+# `min_prevalence`. Prevalence is estimated with inverse-probability weights
+# (the onset preference is undone) and a Wilson interval on the effective
+# sample size.
+
+DEFAULT_BUDGET = 20.0
+STRATA = 64
+ONSET_WEIGHT = 4.0
+ENERGY_BLOCK_SECONDS = 60
+MIN_PREVALENCE = 0.005
+Z = 1.96
+WATCH_CATEGORIES = ["Human Voice", "Gunshot / Explosion", "Siren / Alarm"]
+
+
+def window_energy(audio, sr, window):
+    """Per-window log energy, read block by block so long files are never fully converted."""
+    n_windows = len(audio) // window
+    energy = np.empty(n_windows, dtype=np.float32)
+    per_block = max(1, int(ENERGY_BLOCK_SECONDS * sr) // window)
+    for first in range(0, n_windows, per_block):
+        last = min(n_windows, first + per_block)
+        block = np.asarray(audio[first * window:last * window], dtype=np.float32)
+        if block.ndim > 1:
+            block = block[:, 0]
+        energy[first:last] = np.log10(np.mean(block.reshape(last - first, window) ** 2, axis=1) + 1e-12)
+    return energy
+
+
+def sampling_weights(energy):
+    """1 + ONSET_WEIGHT * normalized rise in energy: onsets are drawn more often."""
+    rise = np.maximum(np.diff(energy, prepend=energy[:1]), 0.0)
+    if rise.max() > 0:
+        rise = rise / rise.max()
+    return 1.0 + ONSET_WEIGHT * rise
+
+
+def wilson_interval(p, n):
+    if n <= 0:
+        return 0.0, 1.0
+    denom = 1 + Z ** 2 / n
+    centre = (p + Z ** 2 / (2 * n)) / denom
+    half = Z * np.sqrt(p * (1 - p) / n + Z ** 2 / (4 * n ** 2)) / denom
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+
+def read_windows(audio, sr, indices, window):
+    """Mono float32 windows at the file's sample rate."""
+    clips = []
+    for i in indices:
+        clips.append(to_mono_float(audio[i * window:(i + 1) * window]))
+    return clips
+
+
+def classify_clips(clips, sr, interpreter, class_to_category):
+    """Category id of the top YAMNet class per clip, -1 below threshold."""
+    from windowed_inference import to_yamnet_input, run_batched, WINDOW_SAMPLES
+    batch = np.zeros((len(clips), WINDOW_SAMPLES), dtype=np.float32)
+    for row, clip in enumerate(clips):
+        wav = to_yamnet_input(clip, sr)[:WINDOW_SAMPLES]
+        batch[row, :len(wav)] = wav
+    scores = run_batched(interpreter, batch)
+    top = scores.argmax(axis=1)
+    best = scores[np.arange(len(top)), top]
+    return np.where(best >= SCORE_THRESHOLD, class_to_category[top], -1)
+
+
+def summarize(categories, hits, weights, sampled_times, watch, min_prevalence, complete=False):
+    """
+    Per-category presence, weighted prevalence and bounds. With `complete`
+    every window was classified, so the prevalence is exact.
+    """
+    inv = 1.0 / weights
+    n_eff = inv.sum() ** 2 / np.sum(inv ** 2) if len(inv) else 0.0
+    summary = {}
+    seen = set(hits[hits >= 0].tolist())
+    for cat_id in sorted(seen | {categories.index(c) for c in watch if c in categories}):
+        name = categories[cat_id]
+        mask = hits == cat_id
+        p = float(inv[mask].sum() / inv.sum()) if len(inv) else 0.0
+        lower, upper = (p, p) if complete else wilson_interval(p, n_eff)
+        summary[name] = {
+            "present": bool(mask.any()),
+            "hits": int(mask.sum()),
+            "prevalence": round(p, 4),
+            "lower": round(float(lower), 4),
+            "upper": round(float(upper), 4),
+            "settled": bool(complete or mask.any() or upper < min_prevalence),
+            "firstHits": sorted(round(float(t), 2) for t in np.asarray(sampled_times)[mask])[:5],
+        }
+    return summary, n_eff
+
+
+def triage_audio(audio_path, job_id, budget=DEFAULT_BUDGET, profile=None, watch=None,
+                 min_prevalence=MIN_PREVALENCE, seed=0):
+    started = time.perf_counter()
+    watch = WATCH_CATEGORIES if watch is None else watch
+    converted_path = None
+    summary = {}
+    try:
+        from scipy.io import wavfile
+        from mediapipe_audio_classifier import convert_to_wav
+        from forensic_categories import build_lookup
+        from windowed_inference import load_interpreter
+        from thread_budget import thread_budget
+        from progress import emit, progress
+        from job_control import checkpoint
+
+        audio_path = audio_path.strip('"')
+        try:
+            sr, audio = wavfile.read(audio_path, mmap=True)
+        except Exception:
+            converted_path = convert_to_wav(audio_path)
+            sr, audio = wavfile.read(converted_path, mmap=True)
+
+        window = int(round(FRAME_DURATION * sr))
+        energy = window_energy(audio, sr, window)
+        n_windows = len(energy)
+        if n_windows == 0:
+            return {"status": "error", "message": "Recording is shorter than one window"}
+        weights = sampling_weights(energy)
+        bounds = np.linspace(0, n_windows, min(STRATA, n_windows) + 1).astype(int)
+
+        categories, class_to_category = build_lookup(profile)
+        interpreter = load_interpreter(get_yamnet_model_path(), thread_budget())
+        rng = np.random.default_rng(seed)
+        available = np.ones(n_windows, dtype=bool)
+        sampled, sampled_hits = [], []
+        rounds = 0
+        reason = "budget"
+        summary, n_eff = {}, 0.0
+
+        while True:
+            checkpoint("triage", force=True)
+            # One onset-weighted draw per stratum
+            picks = []
+            for lo, hi in zip(bounds[:-1], bounds[1:]):
+                free = np.flatnonzero(available[lo:hi]) + lo
+                if len(free):
+                    w = weights[free]
+                    picks.append(int(rng.choice(free, p=w / w.sum())))
+            if not picks:
+                reason = "exhausted"
+                break
+            available[picks] = False
+            sampled.extend(picks)
+            sampled_hits.extend(classify_clips(read_windows(audio, sr, picks, window), sr,
+                                               interpreter, class_to_category).tolist())
+            rounds += 1
+
+            idx = np.asarray(sampled)
+            summary, n_eff = summarize(categories, np.asarray(sampled_hits), weights[idx],
+                                       idx * FRAME_DURATION, watch, min_prevalence,
+                                       complete=len(sampled) == n_windows)
+            print(f"[Triage] Round {rounds}: {len(sampled)}/{n_windows} windows", file=sys.stderr)
+            progress("triage", 100.0 * min(1.0, (time.perf_counter() - started) / budget),
+                     round=rounds, coverage=round(len(sampled) / n_windows, 4))
+            emit("summary", categories=summary)
+            if watch and all(summary.get(c, {}).get("settled") for c in watch if c in categories):
+                reason = "settled"
+                break
+            if time.perf_counter() - started >= budget:
+                break
+
+        return {
+            "status": "success",
+            "jobID": job_id,
+            "mode": "triage",
+            "duration": round(n_windows * FRAME_DURATION, 2),
+            "budgetSec": budget,
+            "elapsedSec": round(time.perf_counter() - started, 2),
+            "rounds": rounds,
+            "windowsSampled": len(sampled),
+            "windowsTotal": n_windows,
+            "coverage": round(len(sampled) / n_windows, 4),
+            "effectiveSamples": round(float(n_eff), 1),
+            "stopReason": reason,
+            "categories": summary,
+        }
+    except JobCancelled as e:
+        return {"status": "cancelled", "jobID": job_id, "mode": "triage", "message": str(e), "categories": summary}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+    finally:
+        if converted_path and converted_path != audio_path and os.path.exists(converted_path):
+            os.unlink(converted_path)
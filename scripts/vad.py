@@ -0,0 +1,198 @@
+import numpy as np
+
+from audio_io import to_mono_float
+
+# ================================
+# Activity Pre-Filter (Energy + Spectral Flatness VAD)
+# ================================
+# Field recordings are often mostly silence or steady ambient noise. This stage
+# finds the spans that contain anything worth sending to Demucs, YAMNet or
+# pyannote, so the heavy models only see active audio. Timestamps produced on
+# the reduced audio are mapped back to the original recording with the helpers
+# at the bottom of this file.
+
+FRAME_SEC = 0.032
+HOP_SEC = 0.016
+ENERGY_MARGIN_DB = 6.0     # frame must be this far above the noise floor
+FLATNESS_THRESHOLD = 0.5   # below this the frame is tonal/structured, not noise
+PAD_SEC = 0.25
+MIN_GAP_SEC = 0.5
+MIN_REGION_SEC = 0.1       # shorter runs are kept only if they are impulses
+IMPULSE_MARGIN_DB = 20.0   # a run peaking this far above the floor is an impulse
+BLOCK_FRAMES = 4096        # frames per rfft batch, bounds memory on long files
+
+
+def frame_features(samples, sr, frame_sec=FRAME_SEC, hop_sec=HOP_SEC):
+    """
+    Returns per-frame (energy_db, spectral_flatness) computed on strided views
+    of the signal, batched through rfft in blocks of BLOCK_FRAMES frames.
+    """
+    frame_len = max(16, int(frame_sec * sr))
+    hop_len = max(1, int(hop_sec * sr))
+    if len(samples) < frame_len:
+        samples = np.pad(samples, (0, frame_len - len(samples)))
+
+    frames = np.lib.stride_tricks.sliding_window_view(samples, frame_len)[::hop_len]
+    window = np.hanning(frame_len).astype(np.float32)
+
+    energy_db = np.empty(len(frames), dtype=np.float32)
+    flatness = np.empty(len(frames), dtype=np.float32)
+    for start in range(0, len(frames), BLOCK_FRAMES):
+        block = frames[start:start + BLOCK_FRAMES]
+        energy = np.mean(block.astype(np.float32) ** 2, axis=1)
+        energy_db[start:start + len(block)] = 10 * np.log10(energy + 1e-12)
+
+        power = np.abs(np.fft.rfft(block * window, axis=1)) ** 2 + 1e-12
+        geometric = np.exp(np.mean(np.log(power), axis=1))
+        flatness[start:start + len(block)] = geometric / np.mean(power, axis=1)
+
+    return energy_db, flatness, hop_len
+
+
+def mask_to_intervals(mask, hop_sec):
+    """Converts a boolean frame mask into a list of [start_sec, end_sec] runs."""
+    if not np.any(mask):
+        return []
+    padded = np.concatenate([[False], mask, [False]])
+    edges = np.flatnonzero(np.diff(padded.astype(np.int8)))
+    starts, ends = edges[0::2], edges[1::2]
+    return [[float(s * hop_sec), float(e * hop_sec)] for s, e in zip(starts, ends)]
+
+
+def merge_intervals(intervals, duration, pad_sec=PAD_SEC, min_gap_sec=MIN_GAP_SEC):
+    """Pads each interval, clips to [0, duration] and merges close neighbours."""
+    merged = []
+    for start, end in sorted(intervals):
+        start = max(0.0, start - pad_sec)
+        end = min(duration, end + pad_sec)
+        if merged and start - merged[-1][1] < min_gap_sec:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def detect_active_regions(samples, sr, energy_margin_db=ENERGY_MARGIN_DB,
+                          flatness_threshold=FLATNESS_THRESHOLD, pad_sec=PAD_SEC,
+                          min_gap_sec=MIN_GAP_SEC, min_region_sec=MIN_REGION_SEC,
+                          impulse_margin_db=IMPULSE_MARGIN_DB):
+    """
+    Finds active regions in `samples`.
+    A frame is active when it rises above the adaptive noise floor and is either
+    spectrally structured (low flatness) or loud enough to matter regardless.
+    Runs shorter than `min_region_sec` are dropped unless they peak
+    `impulse_margin_db` above the floor, so gunshots, slams and breaking
+    glass survive.
+    Returns a dict with the padded region list and how much audio was skipped.
+    """
+    samples = to_mono_float(samples)
+    duration = len(samples) / float(sr)
+    if len(samples) == 0:
+        return summarize_regions([], duration)
+
+    energy_db, flatness, hop_len = frame_features(samples, sr)
+    hop_sec = hop_len / float(sr)
+
+    noise_floor = np.percentile(energy_db, 10)
+    above_floor = energy_db > noise_floor + energy_margin_db
+    loud = energy_db > noise_floor + 2 * energy_margin_db
+    active = above_floor & ((flatness < flatness_threshold) | loud)
+    # Digital silence never counts, whatever the floor estimate says
+    active &= energy_db > -90
+
+    intervals = [
+        iv for iv in mask_to_intervals(active, hop_sec)
+        if iv[1] - iv[0] >= min_region_sec
+        or energy_db[int(round(iv[0] / hop_sec)):int(round(iv[1] / hop_sec))].max()
+        > noise_floor + impulse_margin_db
+    ]
+    regions = merge_intervals(intervals, duration, pad_sec, min_gap_sec)
+    return summarize_regions(regions, duration)
+
+
+def summarize_regions(regions, duration):
+    active = float(sum(end - start for start, end in regions))
+    skipped = max(0.0, duration - active)
+    return {
+        "regions": [[round(s, 3), round(e, 3)] for s, e in regions],
+        "duration": round(duration, 3),
+        "activeSeconds": round(active, 3),
+        "skippedSeconds": round(skipped, 3),
+        "skippedRatio": round(skipped / duration, 4) if duration > 0 else 0.0,
+    }
+
+
+# ================================
+# Timestamp Mapping
+# ================================
+
+def region_sample_bounds(regions, sr, n_samples):
+    """Yields (start_idx, end_idx) sample bounds for each region."""
+    for start, end in regions:
+        s = max(0, int(start * sr))
+        e = min(n_samples, int(end * sr))
+        if e > s:
+            yield s, e
+
+
+def extract_active(samples, sr, regions):
+    """
+    Concatenates the active regions of `samples` (along axis 0).
+    Returns (reduced_samples, kept_regions) where kept_regions holds the
+    original [start, end] in seconds of each piece, in order.
+    """
+    pieces = []
+    kept = []
+    for s, e in region_sample_bounds(regions, sr, len(samples)):
+        pieces.append(samples[s:e])
+        kept.append([s / float(sr), e / float(sr)])
+    if not pieces:
+        return samples[:0], []
+    return np.concatenate(pieces, axis=0), kept
+
+
+def to_original_time(t, kept_regions):
+    """Maps a time on the concatenated active audio back to the original recording."""
+    if not kept_regions:
+        return t
+    lengths = np.array([e - s for s, e in kept_regions])
+    cumulative = np.concatenate([[0.0], np.cumsum(lengths)])
+    idx = int(np.clip(np.searchsorted(cumulative, t, side="right") - 1, 0, len(kept_regions) - 1))
+    return kept_regions[idx][0] + (t - cumulative[idx])
+
+
+def to_original_intervals(start, end, kept_regions):
+    """
+    Maps a [start, end] span on the concatenated active audio back to the
+    original recording, splitting it wherever it crosses a removed gap.
+    """
+    if not kept_regions:
+        return [[start, end]]
+    pieces = []
+    offset = 0.0
+    for region_start, region_end in kept_regions:
+        length = region_end - region_start
+        lo = max(start, offset)
+        hi = min(end, offset + length)
+        if hi > lo:
+            pieces.append([region_start + (lo - offset), region_start + (hi - offset)])
+        offset += length
+        if offset >= end:
+            break
+    return pieces
+
+
+if __name__ == "__main__":
+    # Self-check: short bursts in a quiet noise bed must each yield a region
+    rng = np.random.default_rng(0)
+    sr = 16000
+    for burst_sec in (0.02, 0.05, 0.08, 0.12):
+        audio = 0.001 * rng.standard_normal(5 * sr).astype(np.float32)
+        start = 2 * sr
+        audio[start:start + int(burst_sec * sr)] += 0.8 * rng.standard_normal(int(burst_sec * sr))
+        regions = detect_active_regions(audio, sr)["regions"]
+        assert any(s <= 2.0 <= e for s, e in regions), (burst_sec, regions)
+        print(f"{burst_sec * 1000:.0f} ms burst -> {regions}")
+    quiet = 0.001 * rng.standard_normal(5 * sr).astype(np.float32)
+    assert detect_active_regions(quiet, sr)["regions"] == []
+    print("ok")
@@ -0,0 +1,168 @@
+import sys
+import os
+import json
+import struct
+import numpy as np
+
+from audio_io import to_float
+
+# ================================
+# Waveform Peak Pyramid
+# ================================
+# The waveform viewer used to download and decode whole stem WAVs just to draw
+# them. Instead, a small min/max peak file (in the spirit of audiowaveform's
+# .dat) is written next to the input and every stem during the write pass.
+# It holds several resolutions so the dashboard can draw the overview from
+# the coarsest level and fetch finer levels with HTTP Range requests on zoom.
+#
+# File layout (little-endian):
+#   header  "AFPK" | version u16 | channels u16 | sample_rate u32 |
+#           total_samples u64 | n_levels u32 | reserved u32          (28 bytes)
+#   table   n_levels x (samples_per_pixel u32 | length u32 | offset u64)
+#   data    per level, `length` int16 (min, max) pairs scaled to +-32767
+
+MAGIC = b"AFPK"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIQII")
+LEVEL = struct.Struct("<IIQ")
+BASE_SAMPLES_PER_PIXEL = 256
+LEVEL_FACTOR = 4
+MIN_PIXELS = 1024
+CHUNK_SECONDS = 10
+
+
+class PeakBuilder:
+    """
+    Accumulates min/max peaks at the base resolution from audio blocks of any
+    length; coarser levels are reduced from the base level in finish().
+    """
+
+    def __init__(self, sample_rate, samples_per_pixel=BASE_SAMPLES_PER_PIXEL):
+        self.sample_rate = int(sample_rate)
+        self.samples_per_pixel = samples_per_pixel
+        self.total_samples = 0
+        self._carry_lo = np.zeros(0, dtype=np.float32)
+        self._carry_hi = np.zeros(0, dtype=np.float32)
+        self._mins = []
+        self._maxs = []
+
+    def add(self, block):
+        block = to_float(block)
+        self.total_samples += len(block)
+
+        # Envelope across channels: keep the extremes of any channel per sample
+        # (column-wise ufuncs: reducing over a 2-wide axis is very slow in numpy)
+        if block.ndim > 1:
+            lo = block[:, 0].astype(np.float32)
+            hi = lo.copy()
+            for c in range(1, block.shape[1]):
+                np.minimum(lo, block[:, c], out=lo)
+                np.maximum(hi, block[:, c], out=hi)
+        else:
+            lo = hi = block
+        lo = np.concatenate([self._carry_lo, lo.astype(np.float32, copy=False)])
+        hi = np.concatenate([self._carry_hi, hi.astype(np.float32, copy=False)])
+
+        spp = self.samples_per_pixel
+        full = (len(lo) // spp) * spp
+        if full:
+            self._mins.append(lo[:full].reshape(-1, spp).min(axis=1))
+            self._maxs.append(hi[:full].reshape(-1, spp).max(axis=1))
+        self._carry_lo, self._carry_hi = lo[full:], hi[full:]
+
+    def finish(self, factor=LEVEL_FACTOR, min_pixels=MIN_PIXELS):
+        """Returns [(samples_per_pixel, mins, maxs), ...], finest level first."""
+        mins = list(self._mins)
+        maxs = list(self._maxs)
+        if len(self._carry_lo):
+            mins.append(np.array([self._carry_lo.min()], dtype=np.float32))
+            maxs.append(np.array([self._carry_hi.max()], dtype=np.float32))
+        base_min = np.concatenate(mins) if mins else np.zeros(0, dtype=np.float32)
+        base_max = np.concatenate(maxs) if maxs else np.zeros(0, dtype=np.float32)
+
+        levels = [(self.samples_per_pixel, base_min, base_max)]
+        while len(levels[-1][1]) > min_pixels:
+            spp, lo, hi = levels[-1]
+            pad = (-len(lo)) % factor
+            lo = np.pad(lo, (0, pad), constant_values=lo[-1]).reshape(-1, factor).min(axis=1)
+            hi = np.pad(hi, (0, pad), constant_values=hi[-1]).reshape(-1, factor).max(axis=1)
+            levels.append((spp * factor, lo, hi))
+        return levels
+
+
+def write_peaks(path, builder, channels=1):
+    levels = builder.finish()
+    table_size = HEADER.size + LEVEL.size * len(levels)
+    offset = table_size
+    entries = []
+    payloads = []
+    for spp, lo, hi in levels:
+        pairs = np.empty(2 * len(lo), dtype="<i2")
+        pairs[0::2] = np.clip(lo * 32767.0, -32767, 32767)
+        pairs[1::2] = np.clip(hi * 32767.0, -32767, 32767)
+        entries.append(LEVEL.pack(spp, len(lo), offset))
+        payloads.append(pairs.tobytes())
+        offset += len(payloads[-1])
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, channels, builder.sample_rate, builder.total_samples, len(levels), 0))
+        for entry in entries:
+            f.write(entry)
+        for payload in payloads:
+            f.write(payload)
+    return {"path": path, "bytes": offset, "levels": [spp for spp, _, _ in levels]}
+
+
+def build_peaks(audio, sample_rate, path):
+    """Writes the peak pyramid for an in-memory (samples[, channels]) array, chunk by chunk."""
+    builder = PeakBuilder(sample_rate)
+    chunk = max(1, int(sample_rate * CHUNK_SECONDS))
+    for start in range(0, len(audio), chunk):
+        builder.add(audio[start:start + chunk])
+    channels = 1 if np.ndim(audio) == 1 else np.shape(audio)[1]
+    return write_peaks(path, builder, channels)
+
+
+def build_peaks_from_wav(wav_path, path=None):
+    """Memory-maps a WAV file and writes its peak pyramid next to it (or to `path`)."""
+    from scipy.io import wavfile
+    sample_rate, audio = wavfile.read(wav_path, mmap=True)
+    return build_peaks(audio, sample_rate, path or os.path.splitext(wav_path)[0] + ".peaks")
+
+
+def read_header(path):
+    """Returns the header and level table of a peak file."""
+    with open(path, "rb") as f:
+        magic, version, channels, sample_rate, total_samples, n_levels, _ = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"Not a peak file: {path}")
+        levels = [LEVEL.unpack(f.read(LEVEL.size)) for _ in range(n_levels)]
+    return {
+        "version": version,
+        "channels": channels,
+        "sampleRate": sample_rate,
+        "totalSamples": total_samples,
+        "levels": [{"samplesPerPixel": s, "length": n, "offset": o} for s, n, o in levels],
+    }
+
+
+def read_level(path, samples_per_pixel):
+    """Returns (mins, maxs) as float arrays in [-1, 1] for one level."""
+    header = read_header(path)
+    level = next(l for l in header["levels"] if l["samplesPerPixel"] == samples_per_pixel)
+    pairs = np.fromfile(path, dtype="<i2", count=2 * level["length"], offset=level["offset"])
+    return pairs[0::2] / 32767.0, pairs[1::2] / 32767.0
+
+
+if __name__ == "__main__":
+    # Usage: waveform_peaks.py <input.wav> [output.peaks]
+    if len(sys.argv) > 1:
+        try:
+            info = build_peaks_from_wav(sys.argv[1].strip('"'), sys.argv[2].strip('"') if len(sys.argv) > 2 else None)
+            output = {"status": "success", **info}
+        except Exception as e:
+            output = {"status": "error", "message": str(e)}
+    else:
+        output = {"status": "error", "message": "No input"}
+    sys.stdout.write(json.dumps(output))
+    sys.stdout.flush()
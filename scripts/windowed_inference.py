@@ -0,0 +1,250 @@
+import os
+import sys
+import time
+import numpy as np
+
+# ================================
+# Overlapping-Window YAMNet Inference
+# ================================
+# MediaPipe classifies back-to-back 0.975 s windows, so short impulsive events
+# (gunshots, glass) get smeared or missed between grid points. Here windows are
+# taken every `hop` seconds as strided views of the waveform (no copies), run
+# through the TFLite model in batches, and the overlapping window scores are
+# aggregated back onto a `hop`-spaced frame grid.
+#
+# The published YAMNet graph takes a single 1-D [15600] waveform. run_batched
+# first tries resizing that input to [n, 15600] and keeps the batch only if it
+# reproduces the per-window scores; otherwise the windows are split across
+# single-threaded interpreter instances running in parallel (invoke releases
+# the GIL), and the measured per-window cost is logged.
+
+YAMNET_SAMPLE_RATE = 16000
+WINDOW_SAMPLES = 15600          # 0.975 s at 16 kHz
+DEFAULT_HOP = 0.25
+BATCH_SIZE = 256
+
+BATCH_TOLERANCE = 1e-4          # max score difference a batched probe may show
+
+_INTERPRETERS = {}
+_ORIGINS = {}                   # id(interpreter) -> (model_path, num_threads)
+_BATCHABLE = {}                 # id(interpreter) -> result of the batch probe
+_POOLS = {}                     # (model_path, workers) -> single-thread interpreters
+_REPORTED = set()               # interpreters whose per-window cost has been logged
+
+
+def _new_interpreter(model_path, num_threads=None):
+    """A fresh, allocated interpreter from whichever runtime is installed."""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+    interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+    interpreter.allocate_tensors()
+    return interpreter
+
+
+def load_interpreter(model_path, num_threads=None):
+    """
+    Returns a cached TFLite interpreter for model_path, using whichever
+    runtime is installed (LiteRT, tflite_runtime or full TensorFlow).
+    """
+    key = (model_path, num_threads)
+    if key in _INTERPRETERS:
+        return _INTERPRETERS[key]
+    interpreter = _new_interpreter(model_path, num_threads)
+    _INTERPRETERS[key] = interpreter
+    _ORIGINS[id(interpreter)] = key
+    return interpreter
+
+
+def to_yamnet_input(wav_data, sample_rate):
+    """Mono float32 at 16 kHz, resampled with a polyphase filter if needed."""
+    wav = np.asarray(wav_data, dtype=np.float32)
+    if wav.ndim > 1:
+        wav = wav.mean(axis=1)
+    if sample_rate != YAMNET_SAMPLE_RATE:
+        from math import gcd
+        from scipy.signal import resample_poly
+        g = gcd(int(sample_rate), YAMNET_SAMPLE_RATE)
+        wav = resample_poly(wav, YAMNET_SAMPLE_RATE // g, int(sample_rate) // g).astype(np.float32)
+    return wav
+
+
+def frame_windows(wav, hop_samples, window=WINDOW_SAMPLES):
+    """
+    Overlapping windows of `window` samples every `hop_samples`, as a strided
+    view. The tail is zero-padded so the last samples are covered.
+    """
+    if len(wav) < window:
+        wav = np.pad(wav, (0, window - len(wav)))
+    else:
+        remainder = (len(wav) - window) % hop_samples
+        if remainder:
+            wav = np.pad(wav, (0, hop_samples - remainder))
+    return np.lib.stride_tricks.sliding_window_view(wav, window)[::hop_samples]
+
+
+def _invoke_each(interpreter, windows):
+    """One invoke per window at the model's own input shape."""
+    input_detail = interpreter.get_input_details()[0]
+    output_index = interpreter.get_output_details()[0]["index"]
+    rows = []
+    for window in windows:
+        interpreter.set_tensor(input_detail["index"],
+                               np.ascontiguousarray(window, dtype=np.float32).reshape(input_detail["shape"]))
+        interpreter.invoke()
+        rows.append(np.array(interpreter.get_tensor(output_index), dtype=np.float32).reshape(1, -1))
+    return rows
+
+
+def _invoke_batch(interpreter, batch):
+    """One invoke for a [n, window] batch; the input must already have that shape."""
+    interpreter.set_tensor(interpreter.get_input_details()[0]["index"], batch)
+    interpreter.invoke()
+    output_index = interpreter.get_output_details()[0]["index"]
+    return np.array(interpreter.get_tensor(output_index), dtype=np.float32).reshape(len(batch), -1)
+
+
+def _probe_batching(interpreter, windows):
+    """
+    Whether a single-window model accepts a [n, window] input and gives the
+    same scores as per-window invokes. The interpreter is left at its
+    original input shape when it does not.
+    """
+    input_detail = interpreter.get_input_details()[0]
+    original = [int(d) for d in input_detail["shape"]]
+    sample = np.ascontiguousarray(windows[:2] if len(windows) >= 2 else np.repeat(windows[:1], 2, axis=0),
+                                  dtype=np.float32)
+    expected = np.concatenate(_invoke_each(interpreter, sample), axis=0)
+    try:
+        interpreter.resize_tensor_input(input_detail["index"], [len(sample), sample.shape[1]])
+        interpreter.allocate_tensors()
+        scores = _invoke_batch(interpreter, sample)
+        if scores.shape == expected.shape and np.abs(scores - expected).max() <= BATCH_TOLERANCE:
+            return True
+    except Exception:
+        pass
+    interpreter.resize_tensor_input(input_detail["index"], original)
+    interpreter.allocate_tensors()
+    return False
+
+
+def _run_parallel(interpreter, windows):
+    """
+    Splits the windows across single-threaded copies of the model, one per
+    thread the interpreter was granted. Falls back to one invoke per window
+    on `interpreter` itself if its model path is unknown or it has one thread.
+    The measured cost is logged on the first call per interpreter.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    model_path, num_threads = _ORIGINS.get(id(interpreter), (None, None))
+    pool_size = num_threads or os.cpu_count() or 1
+    workers = min(pool_size, len(windows))
+    started = time.perf_counter()
+    if model_path is None or workers <= 1:
+        workers = 1
+        rows = _invoke_each(interpreter, windows)
+    else:
+        key = (model_path, pool_size)
+        if key not in _POOLS:
+            _POOLS[key] = [_new_interpreter(model_path, 1) for _ in range(pool_size)]
+        # Contiguous slices stay views of the strided windows; index arrays would copy them
+        bounds = np.linspace(0, len(windows), workers + 1).astype(int)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(lambda pair: _invoke_each(pair[0], windows[pair[1][0]:pair[1][1]]),
+                                  zip(_POOLS[key], zip(bounds[:-1], bounds[1:]))))
+        rows = [row for part in parts for row in part]
+    elapsed = time.perf_counter() - started
+    if id(interpreter) in _REPORTED:
+        return rows
+    _REPORTED.add(id(interpreter))
+    print(f"[Windows] Model input is single-window; {len(windows)} windows on {workers} "
+          f"interpreter(s) in {elapsed:.2f}s ({1000 * elapsed / len(windows):.1f} ms/window)",
+          file=sys.stderr)
+    return rows
+
+
+def run_batched(interpreter, windows, batch_size=BATCH_SIZE):
+    """
+    Runs every window through the model, `batch_size` windows per invoke.
+    A single-window model is probed once for a batch dimension; if it has
+    none the windows run in parallel on copies of the model (see
+    _run_parallel).
+    Returns a (n_windows, n_classes) float32 array.
+    """
+    if len(windows) == 0:
+        return np.zeros((0, 521), dtype=np.float32)
+    input_detail = interpreter.get_input_details()[0]
+    input_index = input_detail["index"]
+    batched = len(input_detail["shape"]) == 2
+    if not batched:
+        if id(interpreter) not in _BATCHABLE:
+            _BATCHABLE[id(interpreter)] = _probe_batching(interpreter, windows)
+        batched = _BATCHABLE[id(interpreter)]
+
+    if not batched:
+        return np.concatenate(_run_parallel(interpreter, windows), axis=0)
+
+    results = []
+    current = int(interpreter.get_input_details()[0]["shape"][0])
+    for start in range(0, len(windows), batch_size):
+        batch = np.ascontiguousarray(windows[start:start + batch_size], dtype=np.float32)
+        if current != len(batch):
+            interpreter.resize_tensor_input(input_index, [len(batch), windows.shape[1]])
+            interpreter.allocate_tensors()
+            current = len(batch)
+        results.append(_invoke_batch(interpreter, batch))
+    return np.concatenate(results, axis=0)
+
+
+def aggregate_scores(window_scores, windows_per_frame, n_frames, mode="mean"):
+    """
+    Spreads each window's scores over the hop-frames it covers and combines
+    them per frame. With "mean" a short event peaks at the frame all covering
+    windows agree on; "max" favours recall.
+    """
+    n_windows, n_classes = window_scores.shape
+    if windows_per_frame <= 1:
+        return window_scores[:n_frames]
+
+    if mode == "max":
+        out = np.zeros((n_frames, n_classes), dtype=np.float32)
+        for offset in range(windows_per_frame):
+            frames = np.arange(n_windows) + offset
+            valid = frames < n_frames
+            np.maximum.at(out, frames[valid], window_scores[valid])
+        return out
+
+    # Mean via a cumulative sum over windows: frame f is covered by windows
+    # max(0, f - windows_per_frame + 1) .. min(f, n_windows - 1).
+    cumulative = np.concatenate([np.zeros((1, n_classes), dtype=np.float64), np.cumsum(window_scores, axis=0)])
+    f = np.arange(n_frames)
+    lo = np.clip(f - windows_per_frame + 1, 0, n_windows)
+    hi = np.clip(f + 1, 0, n_windows)
+    counts = np.maximum(hi - lo, 1)[:, None]
+    return ((cumulative[hi] - cumulative[lo]) / counts).astype(np.float32)
+
+
+def classify_windows(wav_data, sample_rate, model_path, hop=DEFAULT_HOP,
+                     batch_size=BATCH_SIZE, aggregate="mean", num_threads=None):
+    """
+    Scores `wav_data` on a `hop`-second grid.
+    Returns (frame_scores, frame_times) with one row per hop-frame.
+    """
+    wav = to_yamnet_input(wav_data, sample_rate)
+    hop_samples = max(1, int(round(hop * YAMNET_SAMPLE_RATE)))
+    windows = frame_windows(wav, hop_samples)
+
+    interpreter = load_interpreter(model_path, num_threads)
+    window_scores = run_batched(interpreter, windows, batch_size)
+
+    windows_per_frame = max(1, int(round(WINDOW_SAMPLES / hop_samples)))
+    n_frames = max(1, int(np.ceil(len(wav) / hop_samples)))
+    frame_scores = aggregate_scores(window_scores, windows_per_frame, n_frames, aggregate)
+    frame_times = np.arange(n_frames, dtype=np.float32) * (hop_samples / YAMNET_SAMPLE_RATE)
+    return frame_scores, frame_times